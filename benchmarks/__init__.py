@@ -0,0 +1 @@
+"""Benchmarks for the Rate Comparison Portal pipelines."""
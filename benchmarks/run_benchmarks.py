@@ -0,0 +1,240 @@
+"""
+Time every stage of the portal's pipelines on synthetic inputs.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 10000 1000000 10000000 --formats csv
+    python -m benchmarks.run_benchmarks --json bench.json --baseline previous.json
+
+Three scenarios run the same ``portal.engine`` functions as the app's pages:
+
+- ``rate``: OLD vs NEW deck (Rate Comparison page)
+- ``topcode``: dialer top-count file vs a comparison file (Smart Top Code Check)
+- ``lcr``: several carrier decks ranked per code (Carrier-to-Carrier, LCR mode)
+
+Stage times (parse / normalize / dedupe / join / aggregate, plus the export
+of the result downloads) are read from a ``portal.diagnostics`` run around
+each scenario, i.e. from the instrumentation the app itself records, so a
+change to the shipped pipeline shows up here as is. Results are printed as
+a table and optionally written as JSON; with ``--baseline`` every stage is
+also shown as a ratio to an earlier JSON run so regressions between versions
+stand out.
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from portal import engine
+from portal.diagnostics import begin_run, finish_run, stage
+from portal.exports import export_table
+from portal.loaders import EXCEL_ENGINE, parse_cache
+from portal.prefix import LONGEST_PREFIX
+
+RATE_COLS = ["Interstate Rate", "Intrastate Rate", "Indeterminate Rate"]
+STAGES = ["parse", "normalize", "dedupe", "join", "aggregate", "export"]
+
+
+def _stage_records(page, scenario):
+    """
+    Run ``scenario()`` as a diagnostics run of its own, with a cold parse
+    cache, and return the stages it recorded as ``{stage, seconds, rows}``.
+    Stages that ran in worker threads are summed over the threads.
+    """
+    def call():
+        parse_cache.clear()  # measure cold parses, not cache hits
+        run = begin_run(page, enabled=True)
+        try:
+            scenario()
+        finally:
+            finish_run(run, log_path=None)
+        return run.summary()
+
+    summary = contextvars.Context().run(call)
+    return [
+        {"stage": row.Stage, "seconds": float(row.Seconds), "rows": None if pd.isna(row.Rows) else int(row.Rows)}
+        for row in summary[["Stage", "Seconds", "Rows"]].itertuples(index=False)
+    ]
+
+
+def _export(table, rows):
+    # What a download button does with a result table
+    with stage("export", rows=rows):
+        export_table(table, "CSV")
+
+
+def bench_rate(old_path, new_path):
+    """The Rate Comparison page: ``engine.compare_rate_files`` and the comparison download."""
+    pairs = [(c, c, f"Rate {i + 1}") for i, c in enumerate(RATE_COLS)]
+
+    def scenario():
+        result = engine.compare_rate_files(old_path, new_path, "Code", "Code", pairs, LONGEST_PREFIX)
+        result.summary()
+        _export(result.comparison.to_frame, len(result.comparison.keys))
+
+    return _stage_records("rate", scenario)
+
+
+def bench_topcode(top_path, comp_path):
+    """The Smart Top Code Check page: ``engine.match_top_codes`` and both downloads."""
+    def scenario():
+        result = engine.match_top_codes(top_path, "term_billed_prefix", "count", comp_path, "dialed_number")
+        _export(result.missing_df, len(result.missing_df))
+        _export(result.found_df, len(result.found_df))
+
+    return _stage_records("topcode", scenario)
+
+
+def bench_lcr(paths):
+    """The LCR mode of the Carrier-to-Carrier page: ``engine.rank_carrier_files`` and the table download."""
+    names = [f"Carrier {i + 1}" for i in range(len(paths))]
+
+    def scenario():
+        lcr = engine.rank_carrier_files(
+            paths, names, ["Code"] * len(paths), ["Interstate Rate"] * len(paths), LONGEST_PREFIX,
+        )
+        lcr.summary()
+        _export(lcr.to_frame, len(lcr.keys))
+
+    return _stage_records("lcr", scenario)
+
+
+def _dataset(data_dir, name, size, fmt, build):
+    path = os.path.join(data_dir, f"{name}_{size}.{fmt}")
+    if not os.path.exists(path):
+        synthetic.write(build(), path)
+    return path
+
+
+def run(args):
+    data_dir = args.data_dir
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+
+    for size in args.sizes:
+        deck_rows = min(size, args.max_deck_rows)
+        top_rows = min(size, args.max_top_rows)
+        for fmt in args.formats:
+            too_big = fmt == "xlsx" and max(size, deck_rows) > args.max_xlsx_rows
+            for scenario in args.scenarios:
+                if too_big:
+                    print(f"skipping {scenario} {fmt} at {size} rows (above --max-xlsx-rows)", file=sys.stderr)
+                    continue
+                print(f"running {scenario} {fmt} {size}...", file=sys.stderr)
+                if scenario == "rate":
+                    old_path = _dataset(data_dir, "old_deck", deck_rows, fmt,
+                                        lambda: synthetic.rate_deck(deck_rows, seed=0))
+                    new_path = _dataset(data_dir, "new_deck", deck_rows, fmt,
+                                        lambda: synthetic.next_deck(synthetic.rate_deck(deck_rows, seed=0)))
+                    records = _best_of(args.repeat, lambda: bench_rate(old_path, new_path))
+                elif scenario == "topcode":
+                    top = synthetic.dialer_top_counts(top_rows)
+                    top_path = _dataset(data_dir, "dialer_top", top_rows, fmt, lambda: top)
+                    # The comparison file draws its hits from the top list, so it depends on its size too
+                    comp_path = _dataset(data_dir, f"comparison_top{top_rows}", size, fmt,
+                                         lambda: synthetic.comparison_file(size, top["term_billed_prefix"]))
+                    records = _best_of(args.repeat, lambda: bench_topcode(top_path, comp_path))
+                else:
+                    paths = [
+                        _dataset(data_dir, f"carrier{i}", deck_rows, fmt,
+                                 lambda i=i: synthetic.next_deck(synthetic.rate_deck(deck_rows, seed=0), seed=i + 1))
+                        for i in range(args.carriers)
+                    ]
+                    records = _best_of(args.repeat, lambda: bench_lcr(paths))
+                for record in records:
+                    results.append({"scenario": scenario, "format": fmt, "size": size, **record})
+    return results
+
+
+def _best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        records = func()
+        if best is None:
+            best = records
+        else:
+            for kept, new in zip(best, records):
+                kept["seconds"] = min(kept["seconds"], new["seconds"])
+    return best
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "excel_engine": EXCEL_ENGINE or "openpyxl",
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def report(results, baseline=None):
+    table = pd.DataFrame(results)
+    table["stage"] = pd.Categorical(table["stage"], categories=STAGES, ordered=True)
+    table = table.sort_values(["scenario", "format", "size", "stage"])
+    if baseline:
+        base = pd.DataFrame(baseline["results"])[["scenario", "format", "size", "stage", "seconds"]]
+        table = table.merge(base.rename(columns={"seconds": "baseline"}), how="left",
+                            on=["scenario", "format", "size", "stage"])
+        table["ratio"] = table["seconds"] / table["baseline"]
+    table["rows/s"] = table["rows"] / table["seconds"]
+    return table.to_string(index=False, float_format=lambda x: f"{x:,.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="comparison-file / deck sizes in rows")
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--scenarios", nargs="+", choices=["rate", "topcode", "lcr"],
+                        default=["rate", "topcode", "lcr"])
+    parser.add_argument("--carriers", type=int, default=5, help="decks in the lcr scenario")
+    parser.add_argument("--max-deck-rows", type=int, default=1_000_000)
+    parser.add_argument("--max-top-rows", type=int, default=100_000)
+    parser.add_argument("--max-xlsx-rows", type=int, default=200_000,
+                        help="larger sizes are only benchmarked as CSV")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of N runs")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "portal-bench"),
+                        help="where generated inputs are written and reused")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    print(report(results, baseline))
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"meta": metadata(), "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
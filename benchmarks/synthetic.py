@@ -0,0 +1,134 @@
+"""
+Synthetic inputs shaped like the files the portal receives.
+
+- A-Z rate decks: country codes broken down into hierarchies of longer
+  prefixes (``44`` -> ``4420`` -> ``44207``), interstate/intrastate/
+  indeterminate rate columns, an effective date, a few duplicate codes and
+  a few malformed ones (``"44-20 7"``, ``"4420.0"``, blanks, text).
+- NEW decks derived from an OLD deck with changed, added and removed codes.
+- Dialer top-count files of 7-digit codes (``1`` + NPA + NXX) with counts.
+- Comparison files: CDR-like rows whose code column partly hits the top
+  codes, with extra columns the portal has to skip.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import POW10, code_keys, key_digits, key_lengths, keys_to_strings
+
+EXCEL_MAX_ROWS = 1_048_575
+
+COUNTRY_CODES = np.array(
+    ["1", "7", "20", "27", "30", "31", "32", "33", "34", "39", "40", "44", "49", "52", "55", "61",
+     "62", "63", "81", "82", "86", "90", "91", "92", "234", "254", "351", "353", "380", "880", "971"]
+)
+
+
+def _random_codes(rng, m):
+    ccs = pd.Series(rng.choice(COUNTRY_CODES, m))
+    extra = rng.integers(0, 9, m)
+    tails = rng.integers(0, 10 ** 8, m, dtype=np.int64) // POW10[8 - extra]
+    # Sentinel-digit trick: 10**k + tail renders as "1" + tail zero-padded to k digits
+    return ccs + pd.Series(POW10[extra] + tails).astype(str).str.slice(1)
+
+
+def prefix_codes(rng, n):
+    """``n`` distinct codes: country code + 0..8 more digits, with parents of some codes added."""
+    codes = pd.Series([], dtype=object)
+    while len(codes) < n:
+        # Short codes collide often, so draw more until there are enough distinct ones
+        fresh = _random_codes(rng, int((n - len(codes)) * 1.3) + 10)
+
+        # Make hierarchies explicit: a fifth of the codes also appear cut short
+        keys = code_keys(fresh.sample(frac=0.2, random_state=int(rng.integers(1 << 31))))
+        lengths = key_lengths(keys).astype(np.int64)
+        cut = np.minimum(rng.integers(1, 4, len(keys)), lengths - 1)
+        parents = key_digits(keys, lengths) // POW10[cut] + POW10[lengths - cut]
+        codes = pd.concat([codes, fresh, keys_to_strings(parents)], ignore_index=True).drop_duplicates()
+    return codes.sample(frac=1.0, random_state=int(rng.integers(1 << 31))).head(n).reset_index(drop=True)
+
+
+def _dirty(rng, codes, duplicate_frac, malformed_frac):
+    codes = codes.astype(object).copy()
+    n = len(codes)
+    bad = rng.random(n) < malformed_frac
+    kinds = rng.integers(0, 4, n)
+    for i in np.flatnonzero(bad):
+        code = codes[i]
+        codes[i] = [f"{code[:2]}-{code[2:]} ", f"{code}.0", "", "N/A"][kinds[i]]
+    dups = rng.choice(n, int(n * duplicate_frac), replace=False) if n else []
+    return codes, np.asarray(dups, dtype=np.int64)
+
+
+def rate_deck(n, seed=0, duplicate_frac=0.01, malformed_frac=0.005):
+    """An A-Z deck of about ``n`` rows."""
+    rng = np.random.default_rng(seed)
+    codes = prefix_codes(rng, n)
+    codes, dups = _dirty(rng, codes, duplicate_frac, malformed_frac)
+    base = np.round(rng.lognormal(-3.5, 1.0, len(codes)), 5)
+    deck = pd.DataFrame({
+        "Code": codes,
+        "Destination": "Destination " + pd.Series(rng.integers(0, 5000, len(codes))).astype(str),
+        "Interstate Rate": base,
+        "Intrastate Rate": np.round(base * rng.uniform(0.9, 1.2, len(codes)), 5),
+        "Indeterminate Rate": np.round(base * rng.uniform(1.0, 1.3, len(codes)), 5),
+        "Effective Date": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 60, len(codes)), unit="D"),
+    })
+    if len(dups):
+        deck = pd.concat([deck, deck.iloc[dups]], ignore_index=True)
+    return deck
+
+
+def next_deck(old, seed=1, change_frac=0.05, add_frac=0.01, remove_frac=0.01):
+    """A NEW deck: ``old`` with some rates changed and codes added/removed."""
+    rng = np.random.default_rng(seed)
+    new = old.drop(old.sample(frac=remove_frac, random_state=seed).index)
+    changed = rng.random(len(new)) < change_frac
+    factor = np.where(changed, rng.uniform(0.8, 1.25, len(new)), 1.0)
+    for col in ("Interstate Rate", "Intrastate Rate", "Indeterminate Rate"):
+        new[col] = np.round(new[col].to_numpy() * factor, 5)
+    added = rate_deck(int(len(old) * add_frac) + 1, seed=seed + 1000, duplicate_frac=0, malformed_frac=0)
+    return pd.concat([new, added], ignore_index=True)
+
+
+def dialer_top_counts(n, seed=2):
+    """Top 7-digit codes (``1`` + 6 digits) with call counts."""
+    rng = np.random.default_rng(seed)
+    codes = np.unique(rng.integers(1_200_000, 2_000_000, int(n * 1.2)))[:n]
+    rng.shuffle(codes)
+    return pd.DataFrame({
+        "term_billed_prefix": codes,
+        "count": np.maximum(rng.lognormal(8.3, 1.2, len(codes)).astype(np.int64), 500),
+    })
+
+
+def comparison_file(n, top_codes, seed=3, hit_frac=0.6, malformed_frac=0.005):
+    """CDR-like rows; ``hit_frac`` of the code column comes from ``top_codes``."""
+    rng = np.random.default_rng(seed)
+    top_codes = np.asarray(top_codes)
+    hits = rng.random(n) < hit_frac
+    base = np.where(hits, rng.choice(top_codes, n), rng.integers(1_000_000, 10_000_000, n))
+    # Full 10/11-digit numbers; the portal keeps their first 7 digits
+    numbers = pd.Series(base * 10_000 + rng.integers(0, 10_000, n)).astype(str)
+    bad = rng.random(n) < malformed_frac
+    numbers[bad] = "unknown"
+    return pd.DataFrame({
+        "call_id": np.arange(n),
+        "dialed_number": numbers,
+        "duration_sec": rng.integers(0, 3600, n),
+        "carrier": rng.choice(np.array(["alpha", "bravo", "charlie"]), n),
+    })
+
+
+def write(df, path):
+    """Write ``df`` as CSV or XLSX depending on ``path``; returns ``path``."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".xlsx"):
+        if len(df) > EXCEL_MAX_ROWS:
+            raise ValueError(f"{len(df)} rows do not fit in an Excel sheet")
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
@@ -0,0 +1 @@
+"""Helpers shared by the Rate Comparison Portal pages."""
@@ -0,0 +1,265 @@
+"""
+Run the portal's comparisons from the command line, many file pairs at once.
+
+Usage (from the repository root)::
+
+    python -m portal.cli rates --old decks/old --new decks/new --out results
+    python -m portal.cli top --comp coverage/ --out results
+    python -m portal.cli carriers --first carrier_a/ --second carrier_b/ --format parquet
+
+``--old``/``--new`` (and ``--first``/``--second``) are files or folders.
+Folders are paired by file name without extension, so ``old/acme.csv`` is
+compared with ``new/acme.xlsx``. ``top`` checks the top-codes file (by
+default the pre-loaded workbook) against every comparison file given.
+Results are named after the input files, so inputs sharing a name (e.g. from
+two folders) are refused rather than overwriting each other.
+
+Columns default to the ones the app preselects. Every pair runs in a worker
+process (``--workers``, default: all cores) through ``portal.engine``, the
+same code the app runs, so the numbers match the UI. Result tables are
+written to ``--out`` under the app's download names, plus ``summary.csv``
+with one row per pair. A failing pair is reported in the summary and makes
+the exit status 1; the other pairs still complete.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from portal import engine
+from portal.exports import available_formats, export_file_name, write_table
+from portal.loaders import probe_table
+from portal.prefix import EXACT, LONGEST_PREFIX
+from portal.top_codes import PRELOADED_TOP_FILE, load_top_snapshot
+
+FORMATS = {
+    "csv": "CSV",
+    "csv.gz": "CSV (gzip)",
+    "zip": "CSV (zip)",
+    "parquet": "Parquet",
+    "xlsx": "Excel (xlsx)",
+}
+MATCH_MODES = {"longest": LONGEST_PREFIX, "exact": EXACT}
+INPUT_EXTENSIONS = (".csv", ".xlsx")
+# The pre-loaded workbook ships next to the app, wherever the CLI is run from
+DEFAULT_TOP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), PRELOADED_TOP_FILE)
+
+
+def _unique_names(files):
+    """Names (file names without extension) of ``files``, which results are written under."""
+    names = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    clashes = sorted({n for n in names if names.count(n) > 1})
+    if clashes:
+        same = "; ".join(", ".join(f for f, n in zip(files, names) if n == c) for c in clashes)
+        raise ValueError(f"files with the same name would overwrite each other's results: {same}")
+    return names
+
+
+def _input_files(folder):
+    paths = [os.path.join(folder, n) for n in sorted(os.listdir(folder)) if n.lower().endswith(INPUT_EXTENSIONS)]
+    return dict(zip(_unique_names(paths), paths))
+
+
+def pair_files(left, right):
+    """``(name, left_file, right_file)`` for two files, or for same-named files of two folders."""
+    if os.path.isdir(left) != os.path.isdir(right):
+        raise ValueError("give two files or two folders")
+    if not os.path.isdir(left):
+        return [(os.path.splitext(os.path.basename(right))[0], left, right)]
+    left_files, right_files = _input_files(left), _input_files(right)
+    for name in sorted(set(left_files) ^ set(right_files)):
+        print(f"skipping {name}: no counterpart in both folders", file=sys.stderr)
+    return [(name, left_files[name], right_files[name]) for name in sorted(set(left_files) & set(right_files))]
+
+
+def expand_files(paths):
+    """Files as given, with folders replaced by the CSV/XLSX files in them."""
+    files = []
+    for path in paths:
+        files.extend(_input_files(path).values() if os.path.isdir(path) else [path])
+    return files
+
+
+def _rate_pairs(specs, left_probe, right_probe):
+    """``OLD[:NEW]`` column specs as labelled pairs, or the app's suggestions when none are given."""
+    if not specs:
+        pairs = engine.default_rate_pairs(left_probe, right_probe)
+    else:
+        pairs = []
+        for i, spec in enumerate(specs):
+            left, _, right = spec.partition(":")
+            pairs.append((left, right or left, f"Rate {i + 1}"))
+    if not pairs:
+        raise ValueError("no rate columns found; pass --rate-col")
+    return pairs
+
+
+def _write(df, stem, out_dir, fmt):
+    path = os.path.join(out_dir, export_file_name(stem, fmt))
+    with open(path, "wb") as fh:
+        write_table(df, fmt, fh, name=f"{stem}.csv")
+    return path
+
+
+def run_rates(name, old_file, new_file, out_dir, fmt, match, code_col=None, rate_cols=None):
+    old_probe, new_probe = probe_table(old_file), probe_table(new_file)
+    result = engine.compare_rate_files(
+        old_file, new_file,
+        code_col or engine.default_code_col(old_probe), code_col or engine.default_code_col(new_probe),
+        _rate_pairs(rate_cols, old_probe, new_probe), MATCH_MODES[match],
+    )
+    written = [_write(result.comparison.to_frame(), f"{result.file_stem}_rate_comparison", out_dir, fmt)]
+    return result.summary(), written
+
+
+def run_top(name, top_file, comp_file, out_dir, fmt, top_col=None, count_col=None, comp_col=None):
+    snapshot = None
+    if top_file is None:
+        # The pre-loaded workbook, through the same snapshot the app uses
+        snapshot = load_top_snapshot(DEFAULT_TOP_FILE)
+        top_col, count_col = top_col or snapshot.code_col, count_col or snapshot.count_col
+    else:
+        top_probe = probe_table(top_file)
+        top_col = top_col or engine.default_code_col(top_probe)
+        count_col = count_col or engine.default_count_col(top_probe)
+    comp_col = comp_col or engine.default_code_col(probe_table(comp_file))
+    result = engine.match_top_codes(top_file, top_col, count_col, comp_file, comp_col, top_snapshot=snapshot)
+    written = [
+        _write(result.missing_df, f"{result.comp_base_name}_missing_codes", out_dir, fmt),
+        _write(result.found_df, f"{result.comp_base_name}_matched_codes", out_dir, fmt),
+    ]
+    return result.summary(), written
+
+
+def run_carriers(name, first_file, second_file, out_dir, fmt, match, code_col=None, rate_cols=None):
+    first_probe, second_probe = probe_table(first_file), probe_table(second_file)
+    names = tuple(os.path.splitext(os.path.basename(f))[0] for f in (first_file, second_file))
+    if names[0] == names[1]:
+        names = (f"{names[0]} (1)", f"{names[1]} (2)")
+    pairs = [p[:2] for p in _rate_pairs(rate_cols, first_probe, second_probe)]
+    result = engine.compare_carrier_files(
+        first_file, second_file,
+        code_col or engine.default_code_col(first_probe), code_col or engine.default_code_col(second_probe),
+        pairs, MATCH_MODES[match], names,
+    )
+    table = result.carrier_result.to_frame(*names)
+    written = [_write(table, f"{names[0]}_vs_{names[1]}_carrier_comparison", out_dir, fmt)]
+    return result.summary(), written
+
+
+RUNNERS = {"rates": run_rates, "top": run_top, "carriers": run_carriers}
+
+
+def run_task(task):
+    """Run one ``(kind, name, kwargs)`` task; failures become a summary row, never an exception."""
+    kind, name, kwargs = task
+    row = {"Kind": kind, "Name": name}
+    start = time.perf_counter()
+    try:
+        summary, written = RUNNERS[kind](name, **kwargs)
+        row.update(Status="ok", **summary, Outputs="; ".join(written))
+    except Exception as e:
+        row.update(Status="failed", Error=f"{type(e).__name__}: {e}")
+    row["Seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def run_tasks(tasks, workers=None):
+    """Run tasks in worker processes (inline with one worker); summary rows in task order."""
+    rows = [None] * len(tasks)
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+
+    def report(i, row):
+        rows[i] = row
+        done = sum(r is not None for r in rows)
+        print(f"[{done}/{len(tasks)}] {row['Kind']} {row['Name']}: {row['Status']} ({row['Seconds']:.1f}s)", file=sys.stderr)
+
+    if workers == 1:
+        for i, task in enumerate(tasks):
+            report(i, run_task(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_task, task): i for i, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                report(futures[future], future.result())
+    return pd.DataFrame(rows)
+
+
+def build_tasks(args):
+    fmt = FORMATS[args.format]
+    common = {"out_dir": args.out, "fmt": fmt}
+    if args.command == "rates":
+        return [
+            ("rates", name, {"old_file": old, "new_file": new, "match": args.match,
+                             "code_col": args.code_col, "rate_cols": args.rate_col, **common})
+            for name, old, new in pair_files(args.old, args.new)
+        ]
+    if args.command == "carriers":
+        return [
+            ("carriers", name, {"first_file": first, "second_file": second, "match": args.match,
+                                "code_col": args.code_col, "rate_cols": args.rate_col, **common})
+            for name, first, second in pair_files(args.first, args.second)
+        ]
+    comps = expand_files(args.comp)
+    return [
+        ("top", name,
+         {"top_file": args.top, "comp_file": comp, "top_col": args.top_col, "count_col": args.count_col,
+          "comp_col": args.comp_col, **common})
+        for name, comp in zip(_unique_names(comps), comps)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m portal.cli", description=__doc__.split("\n\n")[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--out", default="results", help="folder for result files and summary.csv")
+    formats = [alias for alias, name in FORMATS.items() if name in available_formats()]
+    common.add_argument("--format", choices=formats, default="csv", help="format of the result tables")
+    common.add_argument("--workers", type=int, help="worker processes, default: all cores")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rates = commands.add_parser("rates", parents=[common], help="OLD vs NEW rate decks")
+    rates.add_argument("--old", required=True, help="OLD deck, or a folder of them")
+    rates.add_argument("--new", required=True, help="NEW deck, or a folder of them")
+
+    carriers = commands.add_parser("carriers", parents=[common], help="two carriers' rate decks")
+    carriers.add_argument("--first", required=True, help="first carrier's deck, or a folder of them")
+    carriers.add_argument("--second", required=True, help="second carrier's deck, or a folder of them")
+
+    for sub in (rates, carriers):
+        sub.add_argument("--match", choices=list(MATCH_MODES), default="longest", help="code matching")
+        sub.add_argument("--code-col", help="code column of both files (default: detected)")
+        sub.add_argument("--rate-col", action="append", metavar="LEFT[:RIGHT]",
+                         help="rate column pair, repeatable (default: detected pairs)")
+
+    top = commands.add_parser("top", parents=[common], help="top codes vs comparison files")
+    top.add_argument("--top", help=f"top-codes file (default: {PRELOADED_TOP_FILE})")
+    top.add_argument("--top-col", help="code column of the top-codes file")
+    top.add_argument("--count-col", help="count column of the top-codes file")
+    top.add_argument("--comp", required=True, nargs="+", help="comparison files or folders")
+    top.add_argument("--comp-col", help="code column of the comparison files")
+
+    args = parser.parse_args(argv)
+    try:
+        tasks = build_tasks(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not tasks:
+        parser.error("no input files to compare")
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = run_tasks(tasks, workers=args.workers)
+    summary_path = os.path.join(args.out, "summary.csv")
+    summary.to_csv(summary_path, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary.drop(columns=["Outputs"], errors="ignore").to_string(index=False))
+    print(f"\nsummary written to {summary_path}", file=sys.stderr)
+    return 0 if (summary["Status"] == "ok").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Compact representation of dial codes.
+
+Codes are digit strings whose leading zeros matter (``0044`` is not ``44``),
+so a plain integer is not enough. A code is stored as a single int64 *key*:
+the code's digits with a sentinel ``1`` prepended, i.e. ``10**len + digits``.
+``"0044"`` becomes ``10044`` and ``"44"`` becomes ``144``. Keys are unique per
+code, compare with plain integer equality, and the prefix of length ``L`` of a
+key is obtained arithmetically, which is what the prefix engine relies on.
+
+Key ``0`` marks a missing/invalid code.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portal.diagnostics import stage
+
+try:
+    import pyarrow  # noqa: F401  (Arrow-backed strings for the text path)
+    TEXT_DTYPE = "string[pyarrow]"
+except ImportError:
+    TEXT_DTYPE = "string"
+
+MAX_CODE_DIGITS = 18
+INVALID_KEY = 0
+
+POW10 = 10 ** np.arange(MAX_CODE_DIGITS + 1, dtype=np.int64)
+
+
+def encode_keys(digits, lengths):
+    """Build keys from integer digit values and their digit counts."""
+    digits = np.asarray(digits, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    return POW10[lengths] + digits
+
+
+def key_lengths(keys):
+    """Number of digits of each key's code (0 for invalid keys)."""
+    keys = np.asarray(keys, dtype=np.int64)
+    lengths = np.searchsorted(POW10, keys, side="right") - 1
+    return np.where(keys > INVALID_KEY, lengths, 0).astype(np.int8)
+
+
+def key_digits(keys, lengths=None):
+    """Integer value of each key's digits (leading zeros dropped)."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if lengths is None:
+        lengths = key_lengths(keys)
+    return np.where(keys > INVALID_KEY, keys - POW10[lengths], 0)
+
+
+def unique_keys(*arrays):
+    """Sorted unique valid keys across one or more key arrays."""
+    keys = np.sort(np.concatenate([np.asarray(a, dtype=np.int64) for a in arrays]))
+    # sort + neighbour compare; np.unique's hash path is far slower on large int arrays
+    keep = np.empty(len(keys), dtype=bool)
+    keep[:1] = True
+    np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+    keep &= keys > INVALID_KEY
+    return keys[keep]
+
+
+def contains_keys(sorted_keys, keys):
+    """
+    Membership of ``keys`` in the sorted unique key array ``sorted_keys``, by
+    binary search (no Python set of codes is built).
+    """
+    sorted_keys = np.asarray(sorted_keys, dtype=np.int64)
+    keys = np.asarray(keys, dtype=np.int64)
+    pos = np.searchsorted(sorted_keys, keys)
+    found = np.zeros(len(keys), dtype=bool)
+    inside = pos < len(sorted_keys)
+    found[inside] = sorted_keys[pos[inside]] == keys[inside]
+    return found
+
+
+def keys_to_strings(keys):
+    """Render keys back to their digit strings (``""`` for invalid keys)."""
+    text = pd.Series(np.asarray(keys, dtype=np.int64)).astype(str).str.slice(1)
+    return text.where(np.asarray(keys) > INVALID_KEY, "")
+
+
+class NormalizedCodes(NamedTuple):
+    """Result of ``normalize_codes``: digit values, digit counts and a validity mask."""
+
+    digits: np.ndarray
+    lengths: np.ndarray
+    valid: np.ndarray
+
+    @property
+    def keys(self):
+        """Codes as keys, with ``INVALID_KEY`` where the code is not valid."""
+        return np.where(self.valid, encode_keys(self.digits, self.lengths), INVALID_KEY)
+
+
+def _digit_counts(digits):
+    return np.maximum(np.searchsorted(POW10, digits, side="right"), 1)
+
+
+def _normalize_numeric(values, truncate_to):
+    values = values.to_numpy()
+    if values.dtype.kind == "f":
+        finite = np.isfinite(values)
+        valid = finite & (values >= 0) & (values < POW10[MAX_CODE_DIGITS])
+        valid &= np.floor(np.where(finite, values, 0)) == np.where(finite, values, 0)
+        digits = np.where(valid, values, 0).astype(np.int64)
+    else:
+        digits = values.astype(np.int64)
+        valid = digits >= 0
+    lengths = _digit_counts(np.where(valid, digits, 0))
+    # Same limit as text codes: at most MAX_CODE_DIGITS once cut to ``truncate_to``
+    kept = lengths if truncate_to is None else np.minimum(lengths, truncate_to)
+    valid &= kept <= MAX_CODE_DIGITS
+    digits = np.where(valid, digits, 0)
+    return digits, lengths, valid
+
+
+def _normalize_text(values, truncate_to):
+    text = values.astype(TEXT_DTYPE).fillna("").str.strip()
+    # ASCII digits only: str.isdigit() also accepts "²" or "①", which int() rejects
+    messy = ~text.str.fullmatch(r"[0-9]+").to_numpy(dtype=bool, na_value=False)
+    if messy.any():
+        # "2125550.0" is an Excel float cell rendered as text, not the code 21255500
+        cleaned = text[messy].str.replace(r"\.0+$", "", regex=True).str.replace(r"[^0-9]+", "", regex=True)
+        text = text.where(~messy, cleaned)
+    if truncate_to is not None:
+        text = text.str.slice(0, truncate_to)
+    lengths = text.str.len().to_numpy(dtype=np.int64, na_value=0)
+    valid = (lengths > 0) & (lengths <= MAX_CODE_DIGITS)
+    digits = text.where(valid, "0").astype("int64").to_numpy(dtype=np.int64)
+    return digits, lengths, valid
+
+
+def normalize_codes(values, truncate_to=None, required_length=None):
+    """
+    Normalize a column of raw codes in bulk.
+
+    Non-digit characters are stripped, float artifacts such as ``2125550.0``
+    are undone, codes longer than ``truncate_to`` digits are cut down to
+    their first ``truncate_to`` digits, and when ``required_length`` is given
+    only codes of exactly that many digits are valid. Integer and float
+    columns never go through strings at all.
+    """
+    values = pd.Series(values)
+    with stage("normalize", rows=len(values)):
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            digits, lengths, valid = _normalize_numeric(values, truncate_to)
+        else:
+            digits, lengths, valid = _normalize_text(values, truncate_to)
+
+        if truncate_to is not None:
+            extra = np.clip(lengths - truncate_to, 0, None)
+            digits = digits // POW10[extra]
+            lengths = lengths - extra
+        if required_length is not None:
+            valid = valid & (lengths == required_length)
+
+        digits = np.where(valid, digits, 0)
+        lengths = np.where(valid, lengths, 0).astype(np.int8)
+    return NormalizedCodes(digits, lengths, valid)
+
+
+def code_keys(values):
+    """Convert a column of raw codes into keys (``INVALID_KEY`` where invalid)."""
+    return normalize_codes(values).keys
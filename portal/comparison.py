@@ -0,0 +1,266 @@
+"""
+Rate deck comparisons.
+
+A deck is reduced once to one row per valid code (first occurrence wins, so
+duplicate codes can never blow a join up into a cartesian product), with all
+selected rate columns side by side in a float32 matrix (a 5M-code deck takes
+half the memory), widened back to float64 with ``widen_rates`` for arithmetic
+and result tables. Two decks are then aligned a single time and every
+selected rate column is compared in one vectorized pass, however many rate
+columns are selected.
+
+Precision: rates are kept to 7 significant digits. Rates with at most 7
+(0.0125, 0.4, 12.34) compare exactly as they would in float64. Longer rates
+are rounded (0.012345678 becomes 0.01234568), so a change smaller than the
+7th significant digit reads as a 0% change, and a stored-baseline diff
+counts such a code as unchanged.
+"""
+
+import warnings
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from portal.codes import INVALID_KEY, code_keys, keys_to_strings
+from portal.diagnostics import stage
+from portal.loaders import iter_table_chunks, parallel_map
+from portal.prefix import LONGEST_PREFIX, align_keys
+
+RATE_DTYPE = np.float32
+
+
+class Deck(NamedTuple):
+    """
+    One row per code: sorted unique keys and a (codes x columns) rate matrix,
+    plus each code's effective date (``datetime64[D]``, NaT when unknown) when
+    an effective-date column was read.
+    """
+
+    keys: np.ndarray
+    rates: np.ndarray
+    columns: list
+    dates: np.ndarray = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rate_matrix(self, columns):
+        return self.rates[:, [self.columns.index(c) for c in columns]]
+
+
+def _unique_columns(columns):
+    return list(dict.fromkeys(columns))
+
+
+def date_format(values):
+    """
+    The format ``pd.to_datetime`` infers for a column: that of its first text
+    date, ``"mixed"`` (per-cell parsing) when it has none, or None when
+    ``values`` hold no text date at all.
+    """
+    for value in pd.Series(values).dropna():
+        if isinstance(value, str) and value.strip():
+            return guess_datetime_format(value.strip()) or "mixed"
+    return None
+
+
+def parse_dates(values, fmt=None):
+    """Effective dates as ``datetime64[D]``, in format ``fmt`` or an inferred one; unparseable cells become NaT."""
+    with warnings.catch_warnings():
+        # Columns without a consistent format fall back to per-cell parsing
+        warnings.simplefilter("ignore", UserWarning)
+        dates = pd.to_datetime(pd.Series(values), errors="coerce", format=fmt)
+    return dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+
+
+def prepare_deck(df, code_col, rate_cols, keys=None, date_col=None, date_fmt=None):
+    """
+    Normalize the code column, coerce rates to numbers and drop duplicate
+    codes. ``keys`` may be passed if the code column is already normalized.
+    With ``date_col`` each code also keeps its effective date, parsed with
+    ``date_fmt`` when given.
+    """
+    rate_cols = _unique_columns(rate_cols)
+    if keys is None:
+        keys = code_keys(df[code_col])
+    with stage("dedupe", rows=len(keys)):
+        # np.unique returns the first occurrence of each key, already sorted
+        unique_keys, first = np.unique(keys, return_index=True)
+        keep = unique_keys > INVALID_KEY
+        unique_keys, first = unique_keys[keep], first[keep]
+
+        rates = np.empty((len(first), len(rate_cols)), dtype=RATE_DTYPE)
+        for i, col in enumerate(rate_cols):
+            rates[:, i] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)[first]
+        dates = None if date_col is None else parse_dates(df[date_col], date_fmt)[first]
+    return Deck(unique_keys, rates, rate_cols, dates)
+
+
+def widen_rates(rates):
+    """
+    Rates as float64 for arithmetic and result tables. float32 values are
+    rounded to 7 significant digits on the way, so a 0.4 rate comes back as
+    0.4 rather than 0.4000000059604645 (see the module docstring for what
+    this means for rates with more digits).
+    """
+    rates = np.asarray(rates)
+    if rates.dtype != np.float32:
+        return rates.astype(np.float64, copy=False)
+    wide = rates.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        scale = 10.0 ** (6 - np.floor(np.log10(np.abs(wide))))
+        rounded = np.round(wide * scale) / scale
+    return np.where(np.isfinite(rounded), rounded, wide)
+
+
+def percent_change(old_rates, new_rates):
+    """``(new - old) / old * 100`` in float64, NaN where undefined (missing or zero OLD rate)."""
+    old_rates = widen_rates(old_rates)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (widen_rates(new_rates) - old_rates) / old_rates * 100
+    pct[~np.isfinite(pct)] = np.nan
+    return pct
+
+
+class RateComparison(NamedTuple):
+    """Per-code OLD/NEW rates and % change for every compared rate pair."""
+
+    keys: np.ndarray
+    old_rates: np.ndarray
+    new_rates: np.ndarray
+    pct_change: np.ndarray
+    labels: list
+    pairs: list
+
+    @property
+    def average_changes(self):
+        """Average % change per rate pair (NaN when no code has both rates)."""
+        counts = np.sum(~np.isnan(self.pct_change), axis=0)
+        totals = np.nansum(self.pct_change, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, totals / counts, np.nan)
+
+    def to_frame(self):
+        out = {"Code": keys_to_strings(self.keys).to_numpy()}
+        for i, (old_col, new_col, label) in enumerate(self.pairs):
+            out[f"{label} OLD ({old_col})"] = widen_rates(self.old_rates[:, i])
+            out[f"{label} NEW ({new_col})"] = widen_rates(self.new_rates[:, i])
+            out[f"{label} % Change"] = self.pct_change[:, i]
+        return pd.DataFrame(out)
+
+
+def compare_rates(old_deck, new_deck, pairs, match=LONGEST_PREFIX, alignment=None):
+    """
+    Compare OLD vs NEW rates for ``pairs`` of ``(old_col, new_col, label)``.
+
+    The decks are aligned once (or ``alignment`` from ``align_keys`` is
+    reused); % change is computed for all pairs at once. Changes from a zero
+    OLD rate are left as NaN.
+    """
+    if alignment is None:
+        alignment = align_keys(old_deck.keys, new_deck.keys, match=match)
+    keys, old_pos, new_pos = alignment
+    with stage("aggregate", rows=len(keys)):
+        old_rates = old_deck.rate_matrix([p[0] for p in pairs])[old_pos]
+        new_rates = new_deck.rate_matrix([p[1] for p in pairs])[new_pos]
+        pct_change = percent_change(old_rates, new_rates)
+    return RateComparison(keys, old_rates, new_rates, pct_change, [p[2] for p in pairs], list(pairs))
+
+
+class CarrierComparison(NamedTuple):
+    """
+    Average rate of each carrier over every code/rate pair both carriers
+    quote, plus the aligned per-code rates behind it.
+    """
+
+    average1: float
+    average2: float
+    rated_cells: int
+    keys: np.ndarray = None
+    rates1: np.ndarray = None
+    rates2: np.ndarray = None
+    pairs: list = None
+
+    def to_frame(self, name1="Carrier 1", name2="Carrier 2"):
+        """One row per aligned code with both carriers' rates and the cheaper carrier per pair."""
+        out = {"Code": keys_to_strings(self.keys).to_numpy()}
+        for i, (col1, col2) in enumerate(self.pairs):
+            r1, r2 = widen_rates(self.rates1[:, i]), widen_rates(self.rates2[:, i])
+            out[f"{name1} ({col1})"] = r1
+            out[f"{name2} ({col2})"] = r2
+            out[f"Difference {i + 1}"] = r2 - r1
+            out[f"Cheaper {i + 1}"] = np.select(
+                [np.isnan(r1) | np.isnan(r2), r1 < r2, r2 < r1], [None, name1, name2], default="Equal"
+            )
+        return pd.DataFrame(out)
+
+
+def compare_carriers(deck1, deck2, pairs, match=LONGEST_PREFIX):
+    """
+    Pool all selected ``(carrier1_col, carrier2_col)`` rate pairs and average
+    each carrier's rates over the cells where both carriers have a rate.
+    """
+    keys, pos1, pos2 = align_keys(deck1.keys, deck2.keys, match=match)
+    with stage("aggregate", rows=len(pos1)):
+        rates1 = deck1.rate_matrix([p[0] for p in pairs])[pos1]
+        rates2 = deck2.rate_matrix([p[1] for p in pairs])[pos2]
+        both = ~np.isnan(rates1) & ~np.isnan(rates2)
+        n = int(both.sum())
+    aligned = (keys, rates1, rates2, list(pairs))
+    if n == 0:
+        return CarrierComparison(np.nan, np.nan, 0, *aligned)
+    return CarrierComparison(
+        float(widen_rates(rates1[both]).sum() / n), float(widen_rates(rates2[both]).sum() / n), n, *aligned
+    )
+
+
+def concat_decks(decks):
+    """Combine decks read in order; a code keeps its rates from the first deck listing it."""
+    decks = [d for d in decks if d is not None]
+    if len(decks) == 1:
+        return decks[0]
+    keys = np.concatenate([d.keys for d in decks])
+    rates = np.concatenate([d.rates for d in decks])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    first = np.empty(len(keys), dtype=bool)
+    first[:1] = True
+    np.not_equal(keys[1:], keys[:-1], out=first[1:])
+    dates = None
+    if decks[0].dates is not None:
+        dates = np.concatenate([d.dates for d in decks])[order[first]]
+    return Deck(keys[first], rates[order[first]], decks[0].columns, dates)
+
+
+def load_deck(file, code_col, rate_cols, chunksize=None, date_col=None):
+    """
+    Read and prepare a deck straight from an upload.
+
+    Only the code and rate columns are parsed. Large CSVs are streamed in
+    chunks, each chunk reduced with ``prepare_deck`` and folded into the
+    running deck, so peak memory follows the number of distinct codes
+    rather than the file size. The result is identical to preparing the
+    whole table at once. ``date_col`` also reads each code's effective date.
+    """
+    rate_cols = _unique_columns(rate_cols)
+    columns = _unique_columns([code_col, *rate_cols] + ([date_col] if date_col is not None else []))
+    deck = date_fmt = None
+    for chunk in iter_table_chunks(file, columns, chunksize=chunksize):
+        if date_col is not None and date_fmt is None:
+            # Inferred once, from the first chunk holding a date, so that
+            # every chunk (and the whole-file path) reads 03/04 the same way
+            date_fmt = date_format(chunk[date_col])
+        part = prepare_deck(chunk, code_col, rate_cols, date_col=date_col, date_fmt=date_fmt)
+        if deck is None:
+            deck = part
+        else:
+            with stage("dedupe", rows=len(deck) + len(part)):
+                deck = concat_decks([deck, part])
+    return deck
+
+
+def load_decks(specs, max_workers=None):
+    """``load_deck`` for several ``(file, code_col, rate_cols)`` specs concurrently."""
+    return parallel_map(lambda spec: load_deck(*spec), specs, max_workers=max_workers)
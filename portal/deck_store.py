@@ -0,0 +1,324 @@
+"""
+Versioned rate decks per vendor, and incremental diffs against them.
+
+Each week's NEW deck becomes next week's OLD deck. Instead of uploading it
+again and re-merging both decks from scratch, a prepared ``Deck`` (sorted
+code keys, rate matrix, effective dates) is saved once as a version of its
+vendor: one ``.npy`` file per array plus a JSON manifest per vendor, the same
+layout as the top-codes snapshot. A stored baseline opens memory-mapped in
+milliseconds, and ``diff_decks`` compares a new deck against it code by code,
+only materializing the codes that were added, removed or re-priced.
+
+The store lives in ``.portal_cache/decks`` next to the app and can be moved
+with ``PORTAL_DECK_STORE_DIR``.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import keys_to_strings
+from portal.comparison import RATE_DTYPE, Deck, percent_change, widen_rates
+from portal.diagnostics import stage
+from portal.storage import CACHE_DIR, atomic_write, open_array
+
+STORE_DIR = os.environ.get("PORTAL_DECK_STORE_DIR", os.path.join(CACHE_DIR, "decks"))
+NOTICE_DAYS = 7
+
+INCREASE = "Increase"
+DECREASE = "Decrease"
+MIXED = "Mixed"
+RATE_REMOVED = "Rate Removed"
+NEW = "New"
+DELETED = "Deleted"
+
+_lock = threading.Lock()
+
+
+class DeckVersion(NamedTuple):
+    """Manifest entry of one stored deck."""
+
+    vendor: str
+    version: int
+    saved: str
+    source: str
+    codes: int
+    columns: list
+    has_dates: bool
+    fingerprint: str
+
+    @property
+    def label(self):
+        return f"v{self.version} · {self.saved[:10]} · {self.source or 'unknown source'} · {self.codes:,} codes"
+
+
+def vendor_slug(vendor):
+    """Directory name for a vendor (case-insensitive, filesystem safe)."""
+    slug = re.sub(r"[^a-z0-9]+", "-", vendor.strip().lower()).strip("-")
+    if not slug:
+        raise ValueError("vendor name must contain letters or digits")
+    return slug
+
+
+def _vendor_dir(vendor, store_dir):
+    return os.path.join(store_dir, vendor_slug(vendor))
+
+
+def _read_manifest(vendor_dir):
+    try:
+        with open(os.path.join(vendor_dir, "manifest.json")) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def list_vendors(store_dir=STORE_DIR):
+    """Names of vendors with at least one stored deck, alphabetically."""
+    if not os.path.isdir(store_dir):
+        return []
+    vendors = []
+    for name in os.listdir(store_dir):
+        manifest = _read_manifest(os.path.join(store_dir, name))
+        if manifest and manifest.get("versions"):
+            vendors.append(manifest["vendor"])
+    return sorted(vendors, key=str.lower)
+
+
+def list_versions(vendor, store_dir=STORE_DIR):
+    """Stored versions of a vendor's deck, oldest first."""
+    manifest = _read_manifest(_vendor_dir(vendor, store_dir))
+    if not manifest:
+        return []
+    return [DeckVersion(vendor=manifest["vendor"], **v) for v in manifest["versions"]]
+
+
+def deck_fingerprint(deck):
+    """Digest of a deck's codes, rates, columns and dates."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([str(c) for c in deck.columns]).encode())
+    for arr in (deck.keys, deck.rates, deck.dates):
+        if arr is not None:
+            h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def _version_path(vendor_dir, version, name):
+    return os.path.join(vendor_dir, f"v{version:04d}.{name}.npy")
+
+
+def save_deck(vendor, deck, source=None, store_dir=STORE_DIR):
+    """
+    Store ``deck`` as the next version of ``vendor``. A deck identical to the
+    latest version is not stored twice; that version is returned instead.
+    """
+    vendor_dir = _vendor_dir(vendor, store_dir)
+    fingerprint = deck_fingerprint(deck)
+    with _lock:
+        os.makedirs(vendor_dir, exist_ok=True)
+        manifest = _read_manifest(vendor_dir) or {"vendor": vendor.strip(), "versions": []}
+        versions = manifest["versions"]
+        if versions and versions[-1]["fingerprint"] == fingerprint:
+            return DeckVersion(vendor=manifest["vendor"], **versions[-1])
+
+        version = versions[-1]["version"] + 1 if versions else 1
+        entry = {
+            "version": version,
+            "saved": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "source": source,
+            "codes": len(deck.keys),
+            "columns": [str(c) for c in deck.columns],
+            "has_dates": deck.dates is not None,
+            "fingerprint": fingerprint,
+        }
+
+        # Arrays first, manifest last, so readers never see a version that is half written
+        arrays = {"keys": deck.keys, "rates": deck.rates}
+        if deck.dates is not None:
+            arrays["dates"] = deck.dates
+        for name, arr in arrays.items():
+            with atomic_write(_version_path(vendor_dir, version, name)) as fh:
+                np.save(fh, np.ascontiguousarray(arr))
+
+        versions.append(entry)
+        with atomic_write(os.path.join(vendor_dir, "manifest.json"), "w") as fh:
+            json.dump(manifest, fh, indent=1)
+        return DeckVersion(vendor=manifest["vendor"], **entry)
+
+
+def load_version(vendor, version=None, store_dir=STORE_DIR):
+    """Open a stored deck memory-mapped (the latest version by default)."""
+    versions = list_versions(vendor, store_dir)
+    if not versions:
+        raise KeyError(f"no stored decks for vendor {vendor!r}")
+    entry = versions[-1] if version is None else next((v for v in versions if v.version == version), None)
+    if entry is None:
+        raise KeyError(f"vendor {vendor!r} has no version {version}")
+    vendor_dir = _vendor_dir(vendor, store_dir)
+    dates = open_array(_version_path(vendor_dir, entry.version, "dates")) if entry.has_dates else None
+    return Deck(
+        open_array(_version_path(vendor_dir, entry.version, "keys")),
+        # Decks stored before rates were kept as float32 are converted on load
+        open_array(_version_path(vendor_dir, entry.version, "rates")).astype(RATE_DTYPE, copy=False),
+        list(entry.columns),
+        dates,
+    )
+
+
+class DeckDiff(NamedTuple):
+    """
+    Codes that changed between a baseline and a new deck, with per-pair
+    rates and effective dates. Unchanged codes are only counted.
+    """
+
+    keys: np.ndarray
+    change: np.ndarray
+    old_rates: np.ndarray
+    new_rates: np.ndarray
+    old_dates: np.ndarray
+    new_dates: np.ndarray
+    labels: list
+    pairs: list
+    unchanged: int
+    average_changes: np.ndarray
+    as_of: np.datetime64
+    notice_days: int
+
+    def counts(self):
+        """Number of codes per change type, unchanged included."""
+        labels, counts = np.unique(self.change, return_counts=True)
+        out = {label: 0 for label in (INCREASE, DECREASE, MIXED, RATE_REMOVED, NEW, DELETED)}
+        out.update({str(label): int(n) for label, n in zip(labels, counts)})
+        out["Unchanged"] = self.unchanged
+        return out
+
+    @property
+    def notice(self):
+        """Days between ``as_of`` and each code's new effective date (NaN if unknown)."""
+        days = (self.new_dates - self.as_of).astype("timedelta64[D]")
+        return np.where(np.isnat(days), np.nan, days.astype(np.float64))
+
+    @property
+    def short_notice(self):
+        """Increases taking effect sooner than ``notice_days`` after ``as_of``."""
+        raised = np.isin(self.change, [INCREASE, MIXED])
+        return raised & (self.notice < self.notice_days)
+
+    def to_frame(self):
+        pct = percent_change(self.old_rates, self.new_rates)
+        out = {"Code": keys_to_strings(self.keys).to_numpy(), "Change": self.change}
+        for i, (old_col, new_col, label) in enumerate(self.pairs):
+            out[f"{label} OLD ({old_col})"] = widen_rates(self.old_rates[:, i])
+            out[f"{label} NEW ({new_col})"] = widen_rates(self.new_rates[:, i])
+            out[f"{label} % Change"] = pct[:, i]
+        out["Old Effective"] = self.old_dates
+        out["New Effective"] = self.new_dates
+        out["Notice (days)"] = self.notice
+        out["Short Notice"] = self.short_notice
+        return pd.DataFrame(out)
+
+
+def _take(values, rows, fill):
+    """``values[rows]`` with ``fill`` where ``rows`` is -1."""
+    out = np.full((len(rows),) + values.shape[1:], fill, dtype=values.dtype)
+    present = rows >= 0
+    out[present] = values[rows[present]]
+    return out
+
+
+def _deck_dates(deck):
+    if deck.dates is None:
+        return np.full(len(deck.keys), np.datetime64("NaT"), dtype="datetime64[D]")
+    return np.asarray(deck.dates)
+
+
+def diff_decks(old_deck, new_deck, pairs, as_of=None, notice_days=NOTICE_DAYS):
+    """
+    Incremental comparison of ``new_deck`` against a baseline deck.
+
+    Codes are matched exactly. ``pairs`` are ``(old_col, new_col, label)``
+    as for ``compare_rates``. A code present in both decks is an increase or
+    decrease when any compared rate moved (``Mixed`` if some rates went up and
+    others down). A rate priced only in the new deck counts as an increase; a
+    code whose only change is a rate no longer priced is ``Rate Removed``.
+    Codes only in the new deck are ``New``, codes only in the baseline
+    ``Deleted``. Only those codes are materialized. Average % change
+    per pair is still taken over every common code, so it equals an exact-match
+    ``compare_rates``. Increases effective less than ``notice_days`` after
+    ``as_of`` (default: today) are flagged as short notice.
+    """
+    as_of = np.datetime64(as_of or date.today(), "D")
+    old_keys, new_keys = old_deck.keys, new_deck.keys
+    old_idx = [old_deck.columns.index(p[0]) for p in pairs]
+    new_idx = [new_deck.columns.index(p[1]) for p in pairs]
+
+    with stage("join", rows=len(old_keys) + len(new_keys)):
+        pos = np.searchsorted(old_keys, new_keys)
+        in_old = np.zeros(len(new_keys), dtype=bool)
+        inside = pos < len(old_keys)
+        in_old[inside] = old_keys[pos[inside]] == new_keys[inside]
+        common_new = np.flatnonzero(in_old)
+        common_old = pos[common_new]
+        added = np.flatnonzero(~in_old)
+        deleted_mask = np.ones(len(old_keys), dtype=bool)
+        deleted_mask[common_old] = False
+        deleted = np.flatnonzero(deleted_mask)
+
+    with stage("aggregate", rows=len(common_new)):
+        # One rate column at a time, so only boolean masks span all common codes
+        up = np.zeros(len(common_new), dtype=bool)
+        down = np.zeros(len(common_new), dtype=bool)
+        removed = np.zeros(len(common_new), dtype=bool)
+        averages = np.full(len(pairs), np.nan)
+        for i, (oi, ni) in enumerate(zip(old_idx, new_idx)):
+            old = np.asarray(old_deck.rates[:, oi])[common_old]
+            new = np.asarray(new_deck.rates[:, ni])[common_new]
+            old_missing, new_missing = np.isnan(old), np.isnan(new)
+            up |= (new > old) | (old_missing & ~new_missing)
+            down |= new < old
+            removed |= ~old_missing & new_missing
+            pct = percent_change(old, new)
+            pct = pct[~np.isnan(pct)]
+            if len(pct):
+                averages[i] = pct.mean()
+        changed = np.flatnonzero(up | down | removed)
+
+        change = np.select([up & down, up, down], [MIXED, INCREASE, DECREASE], RATE_REMOVED)[changed]
+        n_changed, n_added, n_deleted = len(changed), len(added), len(deleted)
+        change = np.concatenate([
+            change.astype(object),
+            np.full(n_added, NEW, dtype=object),
+            np.full(n_deleted, DELETED, dtype=object),
+        ])
+
+        # Row of each listed code in either deck, -1 where it is absent
+        old_rows = np.concatenate([common_old[changed], np.full(n_added, -1), deleted])
+        new_rows = np.concatenate([common_new[changed], added, np.full(n_deleted, -1)])
+        old_rates = _take(np.asarray(old_deck.rates)[:, old_idx], old_rows, np.nan)
+        new_rates = _take(np.asarray(new_deck.rates)[:, new_idx], new_rows, np.nan)
+        old_dates = _take(_deck_dates(old_deck), old_rows, np.datetime64("NaT"))
+        new_dates = _take(_deck_dates(new_deck), new_rows, np.datetime64("NaT"))
+
+        keys = np.concatenate([new_keys[common_new[changed]], new_keys[added], old_keys[deleted]])
+        order = np.argsort(keys, kind="stable")
+
+    return DeckDiff(
+        keys=keys[order],
+        change=change[order],
+        old_rates=old_rates[order],
+        new_rates=new_rates[order],
+        old_dates=old_dates[order],
+        new_dates=new_dates[order],
+        labels=[p[2] for p in pairs],
+        pairs=list(pairs),
+        unchanged=len(common_new) - n_changed,
+        average_changes=averages,
+        as_of=as_of,
+        notice_days=int(notice_days),
+    )
@@ -0,0 +1,262 @@
+"""
+Per-stage timing and memory diagnostics.
+
+Pipeline steps wrap their work in ``stage("parse")``, ``stage("normalize")``,
+... When a run is active (see ``begin_run``) each stage records wall time,
+rows processed and the peak resident memory of the process while it ran;
+stages inside worker threads started with ``parallel_map`` are attributed to
+the same run. With no active run ``stage`` returns a shared no-op object, so
+the instrumentation costs one context-variable lookup per call.
+
+Finished runs are summarized per stage for the diagnostics sidebar panel and
+appended to a JSON-lines log (one line per run and stage) that can be
+aggregated across sessions with ``pd.read_json(path, lines=True)``.
+
+Configuration (environment variables):
+
+- ``PORTAL_DIAGNOSTICS`` - ``1`` turns diagnostics on by default for every
+  session, default ``0``
+- ``PORTAL_DIAGNOSTICS_LOG`` - log file, default
+  ``.portal_cache/diagnostics.jsonl`` (empty disables the log)
+
+Memory is the resident set size of the whole process, sampled every
+``SAMPLE_INTERVAL`` seconds, so concurrent sessions show up in each other's
+numbers; the peak delta over the stage's starting RSS is the useful figure.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from portal.storage import CACHE_DIR
+
+try:
+    import psutil  # optional, used where /proc is not available
+    _PROCESS = psutil.Process()
+except ImportError:
+    _PROCESS = None
+
+ENABLED_BY_DEFAULT = os.environ.get("PORTAL_DIAGNOSTICS", "0") == "1"
+LOG_PATH = os.environ.get("PORTAL_DIAGNOSTICS_LOG", os.path.join(CACHE_DIR, "diagnostics.jsonl"))
+SAMPLE_INTERVAL = 0.01
+
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_active = contextvars.ContextVar("portal_diagnostics_run", default=None)
+_log_lock = threading.Lock()
+
+
+def current_rss():
+    """Resident set size of the process in bytes, or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if _PROCESS is not None:
+        return _PROCESS.memory_info().rss
+    return None
+
+
+class _NullStage:
+    """Stand-in returned by ``stage`` when no run is active."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """
+    One timed step. ``rows`` may be set inside the ``with`` block once it is
+    known (e.g. after parsing).
+    """
+
+    def __init__(self, run, name, rows):
+        self.run = run
+        self.name = name
+        self.rows = rows
+        self.seconds = None
+        self.start_rss = None
+        self.peak_rss = None
+        self._done = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            if rss is not None and rss > self.peak_rss:
+                self.peak_rss = rss
+
+    def __enter__(self):
+        if self.run.listener is not None:
+            self.run.listener(self, True)
+        self.start_rss = self.peak_rss = current_rss()
+        if self.start_rss is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self._done.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self.peak_rss = max(self.peak_rss, current_rss() or 0)
+        self.run._record(self)
+        if self.run.listener is not None:
+            self.run.listener(self, False)
+        return False
+
+
+class Run:
+    """
+    Stages recorded for one execution of a page. ``listener(stage, started)``,
+    if given, is called as each stage starts and ends (background jobs use it
+    to report progress and to stop cancelled work).
+    """
+
+    def __init__(self, page, session=None, listener=None):
+        self.page = page
+        self.session = session
+        self.listener = listener
+        self.id = uuid.uuid4().hex[:12]
+        self.started = datetime.now(timezone.utc)
+        self.context = {}
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def _record(self, stage):
+        with self._lock:
+            self.stages.append(stage)
+
+    def summary(self):
+        """Stages aggregated by name, in the order they first ran."""
+        columns = ["Stage", "Calls", "Seconds", "Rows", "Rows/s", "Peak RSS MB", "Peak Δ MB"]
+        if not self.stages:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame({
+            "Stage": [s.name for s in self.stages],
+            "Seconds": [s.seconds for s in self.stages],
+            "Rows": [s.rows for s in self.stages],
+            "Peak RSS MB": [None if s.peak_rss is None else s.peak_rss / _MB for s in self.stages],
+            "Peak Δ MB": [None if s.peak_rss is None else (s.peak_rss - s.start_rss) / _MB for s in self.stages],
+        })
+        out = df.groupby("Stage", sort=False).agg(
+            Calls=("Seconds", "size"),
+            Seconds=("Seconds", "sum"),
+            Rows=("Rows", lambda r: r.sum(min_count=1)),
+            **{"Peak RSS MB": ("Peak RSS MB", "max"), "Peak Δ MB": ("Peak Δ MB", "max")},
+        ).reset_index()
+        out["Rows/s"] = out["Rows"] / out["Seconds"].where(out["Seconds"] > 0)
+        return out[columns]
+
+    def log_records(self):
+        """One JSON-ready dict per stage name, as written to the log."""
+        header = {
+            "timestamp": self.started.isoformat(timespec="seconds"),
+            "session": self.session,
+            "run": self.id,
+            "page": self.page,
+            **self.context,
+        }
+        records = []
+        for row in self.summary().itertuples(index=False):
+            records.append({
+                **header,
+                "stage": row[0],
+                "calls": int(row[1]),
+                "seconds": round(float(row[2]), 6),
+                "rows": None if pd.isna(row[3]) else int(row[3]),
+                "peak_rss_mb": None if pd.isna(row[5]) else round(float(row[5]), 1),
+                "peak_delta_mb": None if pd.isna(row[6]) else round(float(row[6]), 1),
+            })
+        return records
+
+
+def stage(name, rows=None):
+    """Context manager timing ``name`` in the active run (a no-op without one)."""
+    run = _active.get()
+    if run is None:
+        return _NULL_STAGE
+    return Stage(run, name, rows)
+
+
+def note(**fields):
+    """Attach extra fields (input file sizes, options, ...) to the active run's log lines."""
+    run = _active.get()
+    if run is not None:
+        run.context.update(fields)
+
+
+def describe_files(*files):
+    """Name and size of uploads, for ``note``."""
+    described = []
+    for f in files:
+        if isinstance(f, (str, os.PathLike)):
+            described.append({"name": os.path.basename(f), "bytes": os.path.getsize(f) if os.path.exists(f) else None})
+        elif f is not None:
+            described.append({"name": getattr(f, "name", None), "bytes": getattr(f, "size", None)})
+    return described
+
+
+def begin_run(page, session=None, enabled=ENABLED_BY_DEFAULT, listener=None):
+    """
+    Start recording stages for ``page`` in the current context. Returns the
+    ``Run``, or None when ``enabled`` is false (which also clears any run left
+    active by an interrupted script).
+    """
+    run = Run(page, session, listener) if enabled else None
+    _active.set(run)
+    return run
+
+
+def timed_call(page, name, func, rows=None, session=None, enabled=ENABLED_BY_DEFAULT):
+    """
+    Call ``func`` as a separate run with a single stage ``name`` (e.g. a
+    deferred download generated after the page run), in a fresh context so
+    the caller's active run is left untouched.
+    """
+    def call():
+        run = begin_run(page, session=session, enabled=enabled)
+        try:
+            with stage(name, rows=rows):
+                return func()
+        finally:
+            finish_run(run)
+
+    return contextvars.Context().run(call)
+
+
+def finish_run(run, log_path=LOG_PATH):
+    """Stop recording and append the run's stages to the log (if it recorded any)."""
+    if _active.get() is run:
+        _active.set(None)
+    if run is None or not run.stages or not log_path:
+        return run
+    lines = "".join(json.dumps(r, default=str, ensure_ascii=False) + "\n" for r in run.log_records())
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        with _log_lock, open(log_path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+    except OSError:
+        pass  # diagnostics must never break a page
+    return run
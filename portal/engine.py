@@ -0,0 +1,258 @@
+"""
+Headless comparison engine.
+
+The comparisons behind the app's pages as plain functions over files
+(Streamlit uploads or paths on disk):
+
+- ``compare_rate_files``: OLD vs NEW rate deck (Rate Comparison)
+- ``diff_against_baseline``: NEW deck vs a stored vendor baseline
+- ``match_top_codes``: top codes vs one comparison file (Smart Top Code Check)
+- ``cover_top_codes``: top codes vs many comparison files (batch check)
+- ``compare_carrier_files``: two carriers' decks (Carrier-to-Carrier)
+- ``rank_carrier_files``: least-cost routing over many carriers' decks
+
+The app runs them as background jobs and renders their results; the batch
+command line (``python -m portal.cli``) runs them over folders of files and
+writes the same tables, so both report identical numbers. ``default_*``
+helpers pick the columns the pages preselect.
+"""
+
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import INVALID_KEY, contains_keys, keys_to_strings
+from portal.comparison import compare_carriers, compare_rates, load_deck, load_decks
+from portal.deck_store import NOTICE_DAYS, diff_decks, load_version, save_deck
+from portal.diagnostics import describe_files, note, stage
+from portal.lcr import least_cost_routing
+from portal.loaders import load_table, parallel_map, suggest_rate_pairs
+from portal.top_codes import (
+    PRELOADED_TOP_FILE,
+    coverage_matrix,
+    file_coverage,
+    load_code_set,
+    top_code_index,
+    top_code_keys,
+)
+
+
+def _name(file):
+    return os.path.basename(os.fspath(file) if isinstance(file, (str, os.PathLike)) else file.name)
+
+
+def _stem(file):
+    return os.path.splitext(_name(file))[0]
+
+
+def default_code_col(probe):
+    """Code column the pages preselect for a probed file."""
+    return probe.code_col if probe.code_col in probe.columns else probe.columns[0]
+
+
+def default_count_col(probe):
+    return probe.count_col if probe.count_col in probe.columns else probe.columns[0]
+
+
+def default_rate_pairs(old_probe, new_probe):
+    """Rate pairs the pages preselect, as ``(old_col, new_col, label)``."""
+    pairs = suggest_rate_pairs(old_probe.rate_cols, new_probe.rate_cols)
+    return [(old_col, new_col, f"Rate {i + 1}") for i, (old_col, new_col) in enumerate(pairs)]
+
+
+class RateFileComparison(NamedTuple):
+    comparison: object
+    rate_pairs: list
+    stored: object
+    file_stem: str
+
+    def summary(self):
+        """Headline numbers: matched codes and average % change per rate pair."""
+        out = {"Codes Matched": len(self.comparison.keys)}
+        for (_, _, label), avg_change in zip(self.rate_pairs, self.comparison.average_changes):
+            out[f"{label} Avg % Change"] = avg_change
+        return out
+
+
+def compare_rate_files(old_file, new_file, old_code_col, new_code_col, rate_pairs, match, save_vendor="", date_col=None):
+    """Rate Comparison of two decks; optionally stores the NEW deck as a vendor baseline."""
+    note(inputs=describe_files(old_file, new_file))
+    # One row per code in each deck, then a single join for all rate pairs
+    old_deck = load_deck(old_file, old_code_col, [p[0] for p in rate_pairs])
+    new_deck = load_deck(new_file, new_code_col, [p[1] for p in rate_pairs], date_col=date_col)
+    comparison = compare_rates(old_deck, new_deck, rate_pairs, match=match)
+    stored = save_deck(save_vendor, new_deck, source=_name(new_file)) if save_vendor.strip() else None
+    return RateFileComparison(comparison, list(rate_pairs), stored, _stem(new_file))
+
+
+class BaselineComparison(NamedTuple):
+    diff: object
+    baseline: object
+    stored: object
+    file_stem: str
+
+
+def diff_against_baseline(vendor, version, new_file, new_code_col, rate_pairs, notice_days=NOTICE_DAYS,
+                          date_col=None, save=False):
+    """
+    NEW deck against a stored ``version`` of ``vendor`` (see ``diff_decks``);
+    with ``save`` the NEW deck is stored as the vendor's next version.
+    """
+    note(inputs=describe_files(new_file), baseline=f"{vendor} v{version}")
+    baseline = load_version(vendor, version)
+    new_deck = load_deck(new_file, new_code_col, [p[1] for p in rate_pairs], date_col=date_col)
+    diff = diff_decks(baseline, new_deck, rate_pairs, notice_days=notice_days)
+    stored = save_deck(vendor, new_deck, source=_name(new_file)) if save else None
+    return BaselineComparison(diff, (vendor, version), stored, _stem(new_file))
+
+
+class TopCodeMatch(NamedTuple):
+    top_rows: int
+    top_valid_rows: int
+    comp_set: object
+    top_col: str
+    result_df: object
+    found_df: object
+    missing_df: object
+    comp_base_name: str
+
+    def summary(self):
+        return {
+            "Top Rows": self.top_rows,
+            "Top Valid Rows": self.top_valid_rows,
+            "Comparison Rows": self.comp_set.rows,
+            "Comparison Valid Rows": self.comp_set.valid_rows,
+            "Top Codes": len(self.result_df),
+            "Found": len(self.found_df),
+            "Missing": len(self.missing_df),
+        }
+
+
+def _top_codes(top_file, top_col, count_col, top_snapshot):
+    """
+    7-digit keys (``INVALID_KEY`` where invalid) and counts of every top row:
+    from ``top_snapshot`` (the pre-loaded workbook) when given, otherwise
+    only the two selected columns of ``top_file`` are parsed.
+    """
+    if top_snapshot is not None:
+        return top_snapshot.code_keys(top_col), top_snapshot.count_values(count_col)
+    top_df = load_table(top_file, columns=list(dict.fromkeys([top_col, count_col])))
+    # Vectorized cleaning: digits only, cut to 7 digits, keep exact 7-digit codes
+    return top_code_keys(top_df[top_col]), top_df[count_col].to_numpy()
+
+
+def match_top_codes(top_file, top_col, count_col, comp_file, comp_col, top_snapshot=None):
+    """
+    Exact 7-digit match of the top codes against one comparison file.
+    ``top_snapshot`` is the pre-loaded workbook's snapshot, used instead of
+    parsing ``top_file``.
+    """
+    note(inputs=describe_files(top_file or PRELOADED_TOP_FILE, comp_file))
+    top_keys, top_counts = _top_codes(top_file, top_col, count_col, top_snapshot)
+    # Comparison codes are read column-only (streamed in chunks for large CSVs)
+    comp_set = load_code_set(comp_file, comp_col)
+
+    # Duplicate top codes are counted once (first row wins)
+    with stage("dedupe", rows=len(top_keys)):
+        valid = top_keys != INVALID_KEY
+        keys, counts = top_keys[valid], top_counts[valid]
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        top_df_unique = pd.DataFrame({top_col: keys[first], count_col: counts[first]})
+
+    with stage("join", rows=len(top_df_unique) + len(comp_set.keys)):
+        # Integer keys against the comparison file's sorted unique keys
+        is_found = contains_keys(comp_set.keys, top_df_unique[top_col].to_numpy())
+
+    with stage("aggregate", rows=len(top_df_unique)):
+        result_df = top_df_unique.copy()
+        result_df["Status"] = np.where(is_found, "FOUND", "MISSING")
+        result_df[top_col] = keys_to_strings(result_df[top_col]).to_numpy()
+
+        found_df = result_df[result_df["Status"] == "FOUND"].copy()
+        missing_df = result_df[result_df["Status"] == "MISSING"].copy()
+
+    return TopCodeMatch(
+        len(top_keys), int(valid.sum()), comp_set, top_col, result_df, found_df, missing_df, _stem(comp_file)
+    )
+
+
+class TopCodeCoverage(NamedTuple):
+    top_index: object
+    coverage: object
+    scans: dict
+    scanned: int
+    reused: int
+
+
+def coverage_tag(top_index, file, code_col):
+    """Key of one file's scan against a top list, for reusing it in later batches."""
+    return (top_index.fingerprint, getattr(file, "file_id", None) or _name(file), code_col)
+
+
+def cover_top_codes(top_file, top_col, count_col, comp_files, comp_cols, top_snapshot=None, scans=None):
+    """
+    Coverage of the top codes by each comparison file. The top list is indexed
+    once and every file scanned once; ``scans`` are earlier results by
+    ``coverage_tag`` and only files missing from it are read. The result's
+    ``scans`` hold the scan of every file in this batch.
+    """
+    note(inputs=describe_files(top_file or PRELOADED_TOP_FILE, *comp_files))
+    top_index = top_code_index(*_top_codes(top_file, top_col, count_col, top_snapshot))
+
+    scans = dict(scans or {})
+    tags = [coverage_tag(top_index, f, c) for f, c in zip(comp_files, comp_cols)]
+    todo = [i for i, tag in enumerate(tags) if tag not in scans]
+    scanned = parallel_map(lambda i: file_coverage(top_index, comp_files[i], comp_cols[i]), todo)
+    scans.update(zip([tags[i] for i in todo], scanned))
+
+    names = [_stem(f) for f in comp_files]
+    names = [n if names.count(n) == 1 else f"{n} ({i + 1})" for i, n in enumerate(names)]
+    coverage = coverage_matrix(top_index, names, [scans[tag] for tag in tags])
+    return TopCodeCoverage(top_index, coverage, {tag: scans[tag] for tag in tags}, len(todo), len(tags) - len(todo))
+
+
+class CarrierFileComparison(NamedTuple):
+    carrier_result: object
+    names: tuple
+
+    @property
+    def more_expensive(self):
+        """``(carrier name, % more expensive on average)``, or None when both averages are equal."""
+        avg1, avg2 = self.carrier_result.average1, self.carrier_result.average2
+        if avg1 > avg2:
+            return self.names[0], (avg1 - avg2) / avg2 * 100
+        if avg2 > avg1:
+            return self.names[1], (avg2 - avg1) / avg1 * 100
+        return None
+
+    def summary(self):
+        rated = self.carrier_result.rated_cells > 0
+        verdict = self.more_expensive if rated else None
+        return {
+            "Codes Aligned": len(self.carrier_result.keys),
+            "Rated Cells": self.carrier_result.rated_cells,
+            f"{self.names[0]} Average": self.carrier_result.average1,
+            f"{self.names[1]} Average": self.carrier_result.average2,
+            "More Expensive": None if verdict is None else verdict[0],
+            "% More Expensive": verdict[1] if verdict is not None else (0.0 if rated else np.nan),
+        }
+
+
+def compare_carrier_files(carrier1_file, carrier2_file, carrier1_code_col, carrier2_code_col, rate_pairs, match, names):
+    """Two-carrier comparison: both decks aligned once, all ``(carrier1_col, carrier2_col)`` pairs pooled."""
+    note(inputs=describe_files(carrier1_file, carrier2_file))
+    # Pool all rates both carriers quote, across every selected rate pair
+    carrier1_deck = load_deck(carrier1_file, carrier1_code_col, [p[0] for p in rate_pairs])
+    carrier2_deck = load_deck(carrier2_file, carrier2_code_col, [p[1] for p in rate_pairs])
+    carrier_result = compare_carriers(carrier1_deck, carrier2_deck, rate_pairs, match=match)
+    return CarrierFileComparison(carrier_result, tuple(names))
+
+
+def rank_carrier_files(files, names, code_cols, rate_cols, match):
+    """Least-cost routing table over one rate column of each carrier's deck (parsed in parallel)."""
+    note(inputs=describe_files(*files))
+    decks = load_decks((f, code_col, [rate_col]) for f, code_col, rate_col in zip(files, code_cols, rate_cols))
+    return least_cost_routing(decks, list(names), list(rate_cols), match=match)
@@ -0,0 +1,186 @@
+"""
+Background jobs.
+
+Comparisons run on a worker pool instead of the Streamlit script thread, so
+the page stays responsive and a rerun from any widget no longer throws the
+work away. Jobs live in a process-wide ``JobStore`` rather than in a session:
+the page keeps only the job id and renders the result once it is done.
+
+Each job records its pipeline stages (``portal.diagnostics.stage``) in a run
+of its own, which gives live progress per stage. Cancelling a job stops it at
+the next stage boundary; streamed files pass one per chunk.
+
+Jobs whose inputs add up to more than ``HEAVY_JOB_MB`` run on a separate pool
+of ``MAX_HEAVY_JOBS`` workers, so huge decks queue behind each other instead
+of taking every worker while small comparisons from other users wait.
+
+Configuration (environment variables):
+
+- ``PORTAL_JOB_WORKERS`` - workers for regular jobs, default 4
+- ``PORTAL_MAX_HEAVY_JOBS`` - heavy jobs running at once, default 1
+- ``PORTAL_HEAVY_JOB_MB`` - total input size that makes a job heavy, default 50
+- ``PORTAL_JOB_TTL`` - seconds finished jobs are kept, default 3600
+"""
+
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from portal.diagnostics import LOG_PATH, begin_run, finish_run
+from portal.loaders import file_size
+
+JOB_WORKERS = int(os.environ.get("PORTAL_JOB_WORKERS", "4"))
+MAX_HEAVY_JOBS = int(os.environ.get("PORTAL_MAX_HEAVY_JOBS", "1"))
+HEAVY_JOB_BYTES = int(float(os.environ.get("PORTAL_HEAVY_JOB_MB", "50")) * 1024 * 1024)
+JOB_TTL = float(os.environ.get("PORTAL_JOB_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a cancelled job's work at its next stage boundary."""
+
+
+class Job:
+    """One submitted piece of work, its state, progress and result."""
+
+    def __init__(self, name, func, session=None, heavy=False, diagnostics=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.session = session
+        self.heavy = heavy
+        self.diagnostics = diagnostics
+        self.state = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.run = None
+        self.current_stage = None
+        self._func = func
+        self._cancel = threading.Event()
+        self._future = None
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def cancel(self):
+        """Ask the job to stop; a job still waiting in the queue never starts."""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+
+    def progress(self):
+        """Per-stage timings so far (see ``Run.summary``)."""
+        if self.run is None:
+            return pd.DataFrame()
+        return self.run.summary()
+
+    def derived(self, key, build):
+        """
+        Value built from the result once and kept with the job (e.g. a viewer
+        index), so reruns of the page do not rebuild it.
+        """
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = build()
+            return self._derived[key]
+
+    def _on_stage(self, stage, started):
+        if started:
+            if self._cancel.is_set():
+                raise JobCancelled()
+            self.current_stage = stage.name
+
+    def _finish(self, state):
+        self.state = state
+        self.finished = time.time()
+
+    def _execute(self):
+        if self._cancel.is_set():
+            self._finish(CANCELLED)
+            return
+        self.started = time.time()
+        self.state = RUNNING
+        run = self.run = begin_run(self.name, session=self.session, enabled=True, listener=self._on_stage)
+        try:
+            self.result = self._func()
+            self._finish(DONE)
+        except JobCancelled:
+            self._finish(CANCELLED)
+        except Exception as e:
+            self.error = e
+            self._finish(FAILED)
+        finally:
+            self.current_stage = None
+            finish_run(run, log_path=LOG_PATH if self.diagnostics else None)
+
+
+class JobStore:
+    """Process-wide registry of jobs and the pools running them."""
+
+    def __init__(self, workers=JOB_WORKERS, heavy_workers=MAX_HEAVY_JOBS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="portal-job")
+        self._heavy_pool = ThreadPoolExecutor(max_workers=heavy_workers, thread_name_prefix="portal-heavy-job")
+
+    def submit(self, name, func, session=None, inputs=(), diagnostics=False):
+        """
+        Queue ``func()`` as a job. ``inputs`` are the files it reads; their
+        total size decides whether it runs on the heavy-job pool.
+        """
+        heavy = sum(file_size(f) for f in inputs) > HEAVY_JOB_BYTES
+        job = Job(name, func, session=session, heavy=heavy, diagnostics=diagnostics)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        pool = self._heavy_pool if heavy else self._pool
+        # A fresh context per job, so its diagnostics run never leaks into the worker thread
+        job._future = pool.submit(contextvars.Context().run, job._execute)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, session=None):
+        """Jobs in submission order, optionally only those of one session."""
+        with self._lock:
+            return [j for j in self._jobs.values() if session is None or j.session == session]
+
+    def queued_ahead(self, job):
+        """Jobs on the same pool submitted earlier and not finished yet."""
+        with self._lock:
+            return sum(
+                1 for j in self._jobs.values()
+                if j.heavy == job.heavy and not j.done and j.submitted < job.submitted
+            )
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [i for i, j in self._jobs.items() if j.done and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+JOBS = JobStore()
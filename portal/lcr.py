@@ -0,0 +1,115 @@
+"""
+Least-cost routing across many carriers.
+
+All carrier decks are aligned on one common code index (the union of their
+codes), producing a carriers x codes rate matrix. Ranking, cheapest and
+second-cheapest carrier and the spread between them then come from a single
+``np.argsort`` down the carrier axis, so 15 decks of 500k codes are ranked
+in one vectorized pass.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import keys_to_strings, unique_keys
+from portal.comparison import RATE_DTYPE, percent_change, widen_rates
+from portal.diagnostics import stage
+from portal.prefix import EXACT, LONGEST_PREFIX, PrefixIndex
+
+
+class LCRResult(NamedTuple):
+    keys: np.ndarray
+    names: list
+    rates: np.ndarray
+    order: np.ndarray
+    quoted: np.ndarray
+
+    @property
+    def cheapest_rate(self):
+        return _ranked_rate(self, 0)
+
+    @property
+    def second_rate(self):
+        return _ranked_rate(self, 1)
+
+    def summary(self):
+        """Per-carrier coverage, number of codes won and average rate."""
+        names = np.asarray(self.names, dtype=object)
+        has_rate = np.isfinite(self.rates)
+        wins = np.bincount(self.order[0][self.quoted > 0], minlength=len(self.names))
+        with np.errstate(invalid="ignore"):
+            averages = np.where(has_rate, widen_rates(self.rates), 0).sum(axis=1) / has_rate.sum(axis=1)
+        return pd.DataFrame({
+            "Carrier": names,
+            "Codes Quoted": has_rate.sum(axis=1),
+            "Codes Cheapest": wins,
+            "Cheapest Share %": wins / max(len(self.keys), 1) * 100,
+            "Average Rate": averages,
+        }).sort_values("Codes Cheapest", ascending=False, ignore_index=True)
+
+    def to_frame(self, depth=3):
+        """The LCR table: per-carrier rates, ranked carriers and the spread per code."""
+        out = {"Code": keys_to_strings(self.keys).to_numpy()}
+        for name, row in zip(self.names, self.rates):
+            out[name] = np.where(np.isfinite(row), widen_rates(row), np.nan)
+        out["Carriers Quoting"] = self.quoted
+
+        categories = pd.Index(self.names).unique()
+        for rank in range(min(depth, len(self.names))):
+            carrier = self.order[rank]
+            codes = categories.get_indexer(np.asarray(self.names, dtype=object)[carrier])
+            codes = np.where(self.quoted > rank, codes, -1)
+            out[f"LCR {rank + 1}"] = pd.Categorical.from_codes(codes, categories=categories)
+
+        cheapest, second = widen_rates(self.cheapest_rate), widen_rates(self.second_rate)
+        out["Cheapest Rate"] = cheapest
+        out["Second Rate"] = second
+        out["Spread"] = second - cheapest
+        out["Spread %"] = percent_change(cheapest, second)
+        return pd.DataFrame(out)
+
+
+def _ranked_rate(result, rank):
+    if rank >= len(result.names):
+        return np.full(len(result.keys), np.nan)
+    cols = np.arange(len(result.keys))
+    rate = result.rates[result.order[rank], cols]
+    return np.where(result.quoted > rank, rate, np.nan)
+
+
+def least_cost_routing(decks, names, rate_cols, match=LONGEST_PREFIX, max_workers=None):
+    """
+    Rank carriers per code.
+
+    ``decks`` are ``Deck`` objects (see ``portal.comparison.prepare_deck``),
+    ``names`` the carrier names and ``rate_cols`` the rate column to rank on
+    for each deck. With longest-prefix matching each carrier's rate for a
+    code is the rate of its longest prefix covering that code.
+    """
+    def fill_row(i):
+        index = PrefixIndex(decks[i].keys)
+        pos = index.lookup_exact(keys) if match == EXACT else index.lookup(keys)
+        found = pos >= 0
+        deck_rates = decks[i].rate_matrix([rate_cols[i]])[:, 0]
+        rates[i, found] = deck_rates[pos[found]]
+
+    with stage("join", rows=sum(len(d) for d in decks)):
+        keys = unique_keys(*[d.keys for d in decks])
+
+        # Missing rates are +inf so they sort after every quoted rate
+        rates = np.full((len(decks), len(keys)), np.inf, dtype=RATE_DTYPE)
+
+        # numpy releases the GIL in sort/searchsorted, so decks resolve in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(fill_row, range(len(decks))))
+        rates[np.isnan(rates)] = np.inf
+
+    with stage("aggregate", rows=len(keys)):
+        quoted = np.isfinite(rates).sum(axis=0)
+        keep = quoted > 0
+        keys, rates, quoted = keys[keep], rates[:, keep], quoted[keep]
+        order = np.argsort(rates, axis=0, kind="stable")
+    return LCRResult(keys, list(names), rates, order, quoted)
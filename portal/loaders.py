@@ -0,0 +1,515 @@
+"""
+Loading uploaded rate files.
+
+Every widget interaction reruns ``streamlit_app.py``, so parsing a deck with
+``pd.read_csv`` / ``pd.read_excel`` on each rerun is the dominant cost of the
+portal. Parsed frames are cached here, keyed by a hash of the upload's bytes
+plus the parse options, in a size-bounded LRU shared by every session of the
+process. Optionally frames are also spilled to an on-disk Parquet cache so the
+same deck uploaded in another session (or after a restart) loads instantly.
+
+Files are read in two phases: ``probe_table`` parses only the header and a
+few rows to populate the column pickers, and once columns are chosen only
+those columns are parsed, as text (``iter_table_chunks`` / ``load_table``
+with ``columns=``). Excel files use the calamine reader when installed.
+
+Configuration (environment variables):
+
+- ``PORTAL_PARSE_CACHE_MB``  - in-memory budget, default 512 (0 disables)
+- ``PORTAL_PARSE_CACHE_DIR`` - directory for the on-disk cache, unset = off
+- ``PORTAL_PARSE_CACHE_DISK_MB`` - on-disk budget, default 2048; the least
+  recently used files are deleted beyond it
+- ``PORTAL_STREAMING_THRESHOLD_MB`` - CSVs above this size are streamed in
+  chunks instead of parsed whole, default 100
+- ``PORTAL_STREAMING_CHUNK_ROWS`` - rows per streamed chunk, default 250000
+"""
+
+import contextvars
+import hashlib
+import io
+import itertools
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import pandas as pd
+
+from portal.codes import normalize_codes
+from portal.diagnostics import stage
+from portal.storage import atomic_write
+
+try:
+    import pyarrow  # noqa: F401  (Parquet support for the disk cache)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+try:
+    import python_calamine  # noqa: F401  (Rust xlsx reader, much faster than openpyxl)
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+
+def file_digest(data):
+    """Return a stable hex digest for the raw bytes of an upload."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _file_bytes(file):
+    """Raw bytes of a Streamlit ``UploadedFile``, file-like object or path."""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fh:
+            return fh.read()
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    pos = file.tell()
+    file.seek(0)
+    data = file.read()
+    file.seek(pos)
+    return data
+
+
+def _file_name(file):
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    return getattr(file, "name", "")
+
+
+def is_csv(file):
+    return _file_name(file).lower().endswith(".csv")
+
+
+def _frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ParseCache:
+    """
+    Thread-safe LRU of parsed DataFrames bounded by their memory footprint,
+    with an optional Parquet spill directory bounded by ``max_disk_bytes``.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir if (disk_dir and HAS_PARQUET) else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        df = self._read_disk(key)
+        if df is not None:
+            self._store(key, df)
+            with self._lock:
+                self.hits += 1
+            return df
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, df):
+        self._store(key, df)
+        self._write_disk(key, df)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _store(self, key, df):
+        size = _frame_nbytes(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            self._entries[key] = (df, size)
+            self._nbytes += size
+            while self._nbytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.parquet")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception:
+            return None
+        _touch(path)
+        return df
+
+    def _write_disk(self, key, df):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        # Parquet needs string column names and homogeneous columns; decks
+        # that can't round-trip are simply kept in memory only.
+        if not all(isinstance(c, str) for c in df.columns):
+            return
+        try:
+            with atomic_write(path) as fh:
+                df.to_parquet(fh, index=False)
+        except Exception:
+            return
+        self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete the least recently used Parquet files until the directory fits ``max_disk_bytes``."""
+        if self.max_disk_bytes is None:
+            return
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".parquet"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def _touch(path):
+    # The mtime of a spilled file is its last use: atime is often not kept (noatime)
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+STREAMING_THRESHOLD_BYTES = int(float(os.environ.get("PORTAL_STREAMING_THRESHOLD_MB", "100")) * 1024 * 1024)
+STREAMING_CHUNK_ROWS = int(os.environ.get("PORTAL_STREAMING_CHUNK_ROWS", "250000"))
+
+parse_cache = ParseCache(
+    max_bytes=int(float(os.environ.get("PORTAL_PARSE_CACHE_MB", "512")) * 1024 * 1024),
+    disk_dir=os.environ.get("PORTAL_PARSE_CACHE_DIR") or None,
+    max_disk_bytes=int(float(os.environ.get("PORTAL_PARSE_CACHE_DISK_MB", "2048")) * 1024 * 1024),
+)
+
+
+def _cache_key(digest, csv, options):
+    opts = repr(sorted(options.items()))
+    kind = "csv" if csv else "xlsx"
+    return f"{digest}-{kind}-{hashlib.blake2b(opts.encode(), digest_size=8).hexdigest()}"
+
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+MAX_REMEMBERED_DIGESTS = 256
+
+
+def upload_digest(file, data=None):
+    """
+    Content digest of an upload, remembered per Streamlit upload id across
+    reruns (for the ``MAX_REMEMBERED_DIGESTS`` most recent uploads). Paths on
+    disk are identified by path, mtime and size instead.
+    """
+    if isinstance(file, (str, os.PathLike)) and data is None:
+        stat = os.stat(file)
+        return file_digest(f"{os.path.abspath(file)}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    file_id = getattr(file, "file_id", None)
+    memo_key = (file_id, getattr(file, "size", None))
+    if file_id is not None:
+        with _digests_lock:
+            if memo_key in _digests:
+                _digests.move_to_end(memo_key)
+                return _digests[memo_key]
+    digest = file_digest(_file_bytes(file) if data is None else data)
+    if file_id is not None:
+        with _digests_lock:
+            _digests[memo_key] = digest
+            while len(_digests) > MAX_REMEMBERED_DIGESTS:
+                _digests.popitem(last=False)
+    return digest
+
+
+def _keep_columns(columns):
+    # Match on stripped names, as shown in the column pickers
+    wanted = set(columns)
+    return lambda c: (c.strip() if isinstance(c, str) else c) in wanted
+
+
+def _parse(data, csv, options):
+    buf = io.BytesIO(data)
+    return pd.read_csv(buf, **options) if csv else pd.read_excel(buf, engine=EXCEL_ENGINE, **options)
+
+
+def _read_options(columns, as_text, options):
+    options = dict(options)
+    if columns is not None:
+        options["usecols"] = _keep_columns(columns)
+    if as_text:
+        options["dtype"] = str
+    return options
+
+
+def load_table(file, columns=None, as_text=False, strip_columns=True, **options):
+    """
+    Parse an uploaded CSV/XLSX file into a DataFrame, reusing a cached parse
+    of identical content when one exists.
+
+    ``columns`` limits the parse to those (stripped) column names and
+    ``as_text`` reads every cell as a string. Extra keyword arguments are
+    passed to ``pd.read_csv`` / ``pd.read_excel``. All of these are part of
+    the cache key. The returned frame is a private copy, so callers may
+    modify it freely.
+    """
+    csv = is_csv(file)
+    key_options = {
+        **options,
+        "columns": None if columns is None else tuple(columns),
+        "as_text": as_text,
+        "strip_columns": strip_columns,
+    }
+    with stage("parse") as timed:
+        # Uploads are digested once per upload id, paths by stat: bytes are only read on a miss
+        key = _cache_key(upload_digest(file), csv, key_options)
+
+        df = parse_cache.get(key)
+        if df is None:
+            df = _parse(_file_bytes(file), csv, _read_options(columns, as_text, options))
+            if strip_columns:
+                df.columns = _strip_names(df.columns)
+            parse_cache.put(key, df)
+        df = df.copy()
+        timed.rows = len(df)
+    return df
+
+
+def file_size(file):
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    size = getattr(file, "size", None)
+    return size if size is not None else len(_file_bytes(file))
+
+
+def _csv_source(file):
+    # Paths are read straight from disk; uploads are already held in memory
+    return file if isinstance(file, (str, os.PathLike)) else io.BytesIO(_file_bytes(file))
+
+
+def should_stream(file):
+    """Large CSV uploads are read in chunks instead of as one DataFrame."""
+    return is_csv(file) and file_size(file) > STREAMING_THRESHOLD_BYTES
+
+
+PROBE_ROWS = 200
+
+CODE_NAME = re.compile(r"code|prefix|dial|npa|nxx|lrn|destination", re.IGNORECASE)
+RATE_NAME = re.compile(r"rate|price|cost|inter|intra|indeterm|tariff|charge", re.IGNORECASE)
+COUNT_NAME = re.compile(r"count|calls|attempts|volume|hits|total", re.IGNORECASE)
+DATE_NAME = re.compile(r"effective|date", re.IGNORECASE)
+
+
+class TableProbe(NamedTuple):
+    """Header and first rows of an upload, with suggested code/rate/count/date columns."""
+
+    columns: list
+    sample: pd.DataFrame
+    code_col: object
+    rate_cols: list
+    count_col: object
+    date_col: object = None
+
+
+def _strip_names(columns):
+    return [c.strip() if isinstance(c, str) else c for c in columns]
+
+
+def _excel_head(file, nrows):
+    # openpyxl's read-only mode streams the sheet XML, so only the first
+    # rows are ever decoded, unlike a full read_excel.
+    from openpyxl import load_workbook
+
+    source = file if isinstance(file, (str, os.PathLike)) else io.BytesIO(_file_bytes(file))
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = list(itertools.islice(wb.worksheets[0].iter_rows(values_only=True), nrows + 1))
+    finally:
+        wb.close()
+    if not rows:
+        return pd.DataFrame()
+    header = [h if h is not None else f"Unnamed: {i}" for i, h in enumerate(rows[0])]
+    return pd.DataFrame(rows[1:], columns=header)
+
+
+def _numeric_share(series):
+    values = pd.to_numeric(series, errors="coerce")
+    present = series.notna().sum()
+    return (values.notna().sum() / present if present else 0.0), values
+
+
+def _suggest_columns(sample):
+    code_like, rate_like, count_like = [], [], []
+    for col in sample.columns:
+        series = sample[col].dropna()
+        if series.empty:
+            continue
+        share, values = _numeric_share(series)
+        integral = share > 0.9 and bool((values.dropna() % 1 == 0).all())
+        name = str(col)
+        if normalize_codes(series).valid.mean() > 0.9 and integral:
+            code_like.append((not CODE_NAME.search(name), col))
+        if share > 0.9 and RATE_NAME.search(name):
+            rate_like.append((0, col))
+        elif share > 0.9 and not integral:
+            rate_like.append((1, col))
+        if integral and COUNT_NAME.search(name):
+            count_like.append((0, col))
+        elif integral:
+            count_like.append((1, col))
+
+    code_col = min(code_like, key=lambda x: x[0])[1] if code_like else None
+    rate_cols = [c for _, c in sorted(rate_like, key=lambda x: x[0]) if c != code_col]
+    counts = [(rank, c) for rank, c in count_like if c != code_col]
+    count_col = min(counts, key=lambda x: x[0])[1] if counts else None
+    # "Effective Date" beats a plain "Date" column
+    dates = [(not re.search("effective", str(c), re.IGNORECASE), c) for c in sample.columns
+             if DATE_NAME.search(str(c)) and c not in (code_col, count_col) and c not in rate_cols]
+    date_col = min(dates, key=lambda x: x[0])[1] if dates else None
+    return code_col, rate_cols, count_col, date_col
+
+
+_probes = OrderedDict()
+_probes_lock = threading.Lock()
+
+
+def probe_table(file, nrows=PROBE_ROWS):
+    """
+    Read just the header and first ``nrows`` rows of an upload.
+
+    This is all the column pickers need, so a page is interactive long
+    before a big deck would have finished parsing. The probe also suggests
+    the code, rate and count columns. Probes are remembered per content hash.
+    """
+    key = (upload_digest(file), is_csv(file), nrows)
+    with _probes_lock:
+        if key in _probes:
+            _probes.move_to_end(key)
+            return _probes[key]
+
+    if is_csv(file):
+        sample = pd.read_csv(_csv_source(file), nrows=nrows)
+    else:
+        sample = _excel_head(file, nrows)
+    sample.columns = _strip_names(sample.columns)
+    probe = TableProbe(list(sample.columns), sample, *_suggest_columns(sample))
+
+    with _probes_lock:
+        _probes[key] = probe
+        while len(_probes) > 64:
+            _probes.popitem(last=False)
+    return probe
+
+
+def table_columns(file):
+    """Column names of an upload, from its header probe."""
+    return probe_table(file).columns
+
+
+def read_sample(file, nrows=5):
+    """First rows of an upload, from its header probe."""
+    return probe_table(file).sample.head(nrows)
+
+
+def column_index(columns, name, offset=0):
+    """Position of ``name`` in ``columns`` for a selectbox ``index`` (0 if absent)."""
+    columns = list(columns)
+    return columns.index(name) + offset if name in columns else 0
+
+
+def suggest_rate_pairs(left_rates, right_rates):
+    """Pair suggested rate columns of two decks, preferring identical names."""
+    pairs = []
+    for i, left in enumerate(left_rates):
+        if left in right_rates:
+            pairs.append((left, left))
+        elif i < len(right_rates):
+            pairs.append((left, right_rates[i]))
+    return pairs
+
+
+def iter_table_chunks(file, columns, chunksize=None):
+    """
+    Yield the selected ``columns`` of an upload as text DataFrames.
+
+    Large CSVs (see ``should_stream``) are read ``chunksize`` rows at a time
+    so only one chunk is ever materialized; anything else is yielded as a
+    single cached frame. Both paths parse cells identically, so reducing the
+    chunks gives exactly the result of reducing the whole table.
+    """
+    if not is_csv(file) or (chunksize is None and not should_stream(file)):
+        yield load_table(file, columns=columns, as_text=True)
+        return
+    reader = pd.read_csv(
+        _csv_source(file),
+        chunksize=chunksize or STREAMING_CHUNK_ROWS,
+        **_read_options(columns, True, {}),
+    )
+    with reader:
+        while True:
+            with stage("parse") as timed:
+                chunk = next(reader, None)
+                timed.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            chunk.columns = _strip_names(chunk.columns)
+            yield chunk
+
+
+def parallel_map(func, items, max_workers=None):
+    """
+    ``[func(item) for item in items]`` on a thread pool.
+
+    Parsing, hashing and numpy work release the GIL for most of their time,
+    so threads overlap per-file work without pickling whole decks between
+    processes. Each call runs in a copy of the caller's context, so
+    diagnostics stages inside ``func`` are recorded in the caller's run.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(items), (os.cpu_count() or 1) + 4)) as pool:
+        return list(pool.map(lambda ctx, item: ctx.run(func, item), contexts, items))
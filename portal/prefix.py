@@ -0,0 +1,111 @@
+"""
+Longest-prefix matching between rate decks.
+
+A deck lists rates per dial prefix and two decks rarely break a country down
+the same way: one may quote ``4420`` while the other quotes ``44207``. An
+exact join silently drops such rows. ``PrefixIndex`` is built once per deck
+and resolves whole arrays of codes to their longest matching prefix in that
+deck with one ``np.searchsorted`` per distinct prefix length, so a lookup of
+N codes costs O(N * lengths * log M) in vectorized numpy, never a Python loop
+per row.
+"""
+
+import numpy as np
+
+from portal.codes import INVALID_KEY, POW10, key_digits, key_lengths, unique_keys
+from portal.diagnostics import stage
+
+EXACT = "exact"
+LONGEST_PREFIX = "prefix"
+
+
+class PrefixIndex:
+    """
+    Sorted per-length index over the keys of one deck.
+
+    ``lookup`` returns, for each query key, the row position in the indexed
+    deck of its longest matching prefix, or ``-1`` when nothing matches. When
+    a code appears more than once in the deck its first row wins.
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        lengths = key_lengths(keys)
+        self._levels = {}
+        for length in np.unique(lengths[keys > INVALID_KEY]):
+            positions = np.flatnonzero(lengths == length)
+            order = np.argsort(keys[positions], kind="stable")
+            self._levels[int(length)] = (keys[positions][order], positions[order])
+        self.size = len(keys)
+
+    @property
+    def lengths(self):
+        return sorted(self._levels)
+
+    def _search(self, length, prefixes):
+        sorted_keys, positions = self._levels[length]
+        idx = np.searchsorted(sorted_keys, prefixes)
+        idx = np.minimum(idx, len(sorted_keys) - 1)
+        hit = sorted_keys[idx] == prefixes
+        return hit, positions[idx]
+
+    def lookup_exact(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        lengths = key_lengths(keys)
+        for length in self._levels:
+            idx = np.flatnonzero(lengths == length)
+            if idx.size:
+                hit, pos = self._search(length, keys[idx])
+                result[idx[hit]] = pos[hit]
+        return result
+
+    def lookup(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        result = np.full(len(keys), -1, dtype=np.int64)
+        lengths = key_lengths(keys).astype(np.int64)
+        digits = key_digits(keys, lengths)
+        pending = np.flatnonzero(keys > INVALID_KEY)
+        for length in sorted(self._levels, reverse=True):
+            candidates = pending[lengths[pending] >= length]
+            if not candidates.size:
+                continue
+            prefixes = digits[candidates] // POW10[lengths[candidates] - length] + POW10[length]
+            hit, pos = self._search(length, prefixes)
+            result[candidates[hit]] = pos[hit]
+            pending = pending[result[pending] < 0]
+            if not pending.size:
+                break
+        return result
+
+
+def align_keys(left_keys, right_keys, match=LONGEST_PREFIX, left_index=None, right_index=None):
+    """
+    Line up two decks on a common set of codes.
+
+    With ``match="exact"`` the result is the codes present in both decks.
+    With ``match="prefix"`` every code of either deck is resolved to its
+    longest matching prefix in the other deck, so the comparison covers the
+    whole dial plan. Prebuilt indexes can be passed in to avoid rebuilding
+    them. Returns ``(keys, left_pos, right_pos)`` for the codes that resolve
+    on both sides.
+    """
+    left_keys = np.asarray(left_keys, dtype=np.int64)
+    right_keys = np.asarray(right_keys, dtype=np.int64)
+    with stage("join", rows=len(left_keys) + len(right_keys)):
+        if left_index is None:
+            left_index = PrefixIndex(left_keys)
+        if right_index is None:
+            right_index = PrefixIndex(right_keys)
+
+        if match == EXACT:
+            keys = unique_keys(left_keys)
+            left_pos = left_index.lookup_exact(keys)
+            right_pos = right_index.lookup_exact(keys)
+        else:
+            keys = unique_keys(left_keys, right_keys)
+            left_pos = left_index.lookup(keys)
+            right_pos = right_index.lookup(keys)
+
+        both = (left_pos >= 0) & (right_pos >= 0)
+    return keys[both], left_pos[both], right_pos[both]
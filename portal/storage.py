@@ -0,0 +1,42 @@
+"""
+Files the portal keeps on disk: the top-codes snapshot, stored vendor decks,
+the Parquet parse cache and the diagnostics log.
+
+Everything defaults to ``.portal_cache`` next to the app (``CACHE_DIR``).
+Writers go through ``atomic_write``, so a reader in another session or worker
+process never sees a half-written file, and arrays are opened memory-mapped
+with ``open_array``.
+"""
+
+import contextlib
+import os
+import threading
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".portal_cache")
+TMP_SUFFIX = ".tmp"
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb"):
+    """
+    Open a temporary file next to ``path`` for writing and rename it to
+    ``path`` once the block completes; on error the temporary file is removed.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}"
+    try:
+        with open(tmp, mode) as fh:
+            yield fh
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def open_array(path):
+    """Memory-mapped, read-only ``.npy`` array."""
+    # Plain ndarray view over the mapping; np.memmap instances leak into
+    # pandas results as 0-d memmaps, which break hashing and set().
+    return np.load(path, mmap_mode="r").view(np.ndarray)
@@ -0,0 +1,328 @@
+"""
+Pre-loaded dialer top-codes file.
+
+Parsing ``dialer_top_counts_updated.xlsx`` through openpyxl is the slowest
+step of the Smart Top Code Check page. The workbook is compiled once (and
+again whenever its mtime or size changes) into a binary snapshot. The code
+and count columns detected as the pickers' defaults are stored ready to use:
+the 7-digit code keys (one int64 per row) and the counts as numbers, so
+checking against the defaults normalizes nothing. Every sheet column is also
+kept as parsed, one ``.npy`` array each (numbers as numbers, text as UTF-8
+bytes so codes stored as text keep a leading zero), and is only cleaned when
+another column is picked. A small JSON manifest names the columns.
+Snapshots are opened memory-mapped, so every session and every worker process
+on the host shares the same pages and a page load costs milliseconds
+regardless of the file's size.
+
+The snapshot directory defaults to ``.portal_cache`` next to the app and can
+be moved with ``PORTAL_SNAPSHOT_DIR``.
+
+For batch checks against many comparison files the top list is indexed once
+(``top_code_index``) and each file is scanned on its own (``file_coverage``),
+so adding a file costs only that file's scan. ``coverage_matrix`` packs the
+per-file results into a codes x files bitmap, one bit per code and file.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import INVALID_KEY, contains_keys, keys_to_strings, normalize_codes, unique_keys
+from portal.diagnostics import stage
+from portal.loaders import EXCEL_ENGINE, iter_table_chunks
+from portal.storage import CACHE_DIR, TMP_SUFFIX, atomic_write, open_array
+
+PRELOADED_TOP_FILE = "dialer_top_counts_updated.xlsx"
+TOP_CODE_DIGITS = 7
+# Bumped whenever the snapshot layout changes, so older snapshots are recompiled
+SNAPSHOT_FORMAT = 3
+
+SNAPSHOT_DIR = os.environ.get("PORTAL_SNAPSHOT_DIR", CACHE_DIR)
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+class TopCodesSnapshot(NamedTuple):
+    columns: list
+    arrays: list
+    code_col: str
+    count_col: str
+    keys: np.ndarray
+    counts: np.ndarray
+    source_rows: int
+    valid_rows: int
+
+    def column(self, col, stop=None):
+        """One sheet column (its first ``stop`` rows) as a Series, empty text cells as missing values."""
+        arr = self.arrays[self.columns.index(col)][:stop]
+        if arr.dtype.kind != "S":
+            return pd.Series(arr, name=col, copy=False)
+        text = np.char.decode(arr, "utf-8").astype(object)
+        text[text == ""] = np.nan
+        return pd.Series(text, name=col)
+
+    def head(self, n=5):
+        """The first ``n`` rows of the sheet, for previews."""
+        return pd.DataFrame({col: self.column(col, n) for col in self.columns})
+
+    def code_keys(self, col):
+        """7-digit keys of column ``col``; the stored keys when it is the detected code column."""
+        return self.keys if col == self.code_col else top_code_keys(self.column(col))
+
+    def count_values(self, col):
+        """Column ``col`` as counts; the stored counts when it is the detected count column."""
+        return self.counts if col == self.count_col else self.column(col).to_numpy()
+
+
+def top_code_digits(values):
+    """Codes cut to 7 digits, as ``(digits, valid)``, matching the page's cleaning."""
+    norm = normalize_codes(values, truncate_to=TOP_CODE_DIGITS, required_length=TOP_CODE_DIGITS)
+    return norm.digits, norm.valid
+
+
+def top_code_keys(values):
+    """Codes cut to 7 digits as keys, ``INVALID_KEY`` where not a valid 7-digit code."""
+    return normalize_codes(values, truncate_to=TOP_CODE_DIGITS, required_length=TOP_CODE_DIGITS).keys
+
+
+class CodeSet(NamedTuple):
+    """Distinct valid 7-digit codes of a file (sorted keys) and its row counts."""
+
+    keys: np.ndarray
+    rows: int
+    valid_rows: int
+
+
+def load_code_set(file, code_col, chunksize=None):
+    """
+    Distinct valid 7-digit code keys of an upload's code column.
+
+    Large CSVs are streamed: each chunk is normalized and only its distinct
+    codes are merged into the running set, so memory is bounded by the
+    number of distinct codes.
+    """
+    keys = np.empty(0, dtype=np.int64)
+    rows = valid_rows = 0
+    for chunk in iter_table_chunks(file, [code_col], chunksize=chunksize):
+        norm = normalize_codes(chunk[code_col], truncate_to=TOP_CODE_DIGITS, required_length=TOP_CODE_DIGITS)
+        rows += len(chunk)
+        valid_rows += int(norm.valid.sum())
+        with stage("dedupe", rows=len(chunk)):
+            keys = unique_keys(keys, norm.keys[norm.valid])
+    return CodeSet(keys, rows, valid_rows)
+
+
+class TopCodes(NamedTuple):
+    """Distinct valid 7-digit top codes (sorted keys) with the count of each code's first row."""
+
+    keys: np.ndarray
+    counts: np.ndarray
+    rows: int
+    valid_rows: int
+
+    @property
+    def fingerprint(self):
+        return hashlib.sha1(self.keys.tobytes() + self.counts.tobytes()).hexdigest()
+
+
+def top_code_index(keys, counts):
+    """
+    Index a top-codes list (keys from ``top_code_keys`` and the count of each
+    row) once for checking against any number of comparison files.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    valid = keys != INVALID_KEY
+    with stage("dedupe", rows=len(keys)):
+        counts = pd.to_numeric(pd.Series(counts), errors="coerce").to_numpy(dtype=np.float64)[valid]
+        # np.unique returns the first occurrence of each key, like drop_duplicates
+        keys, first = np.unique(keys[valid], return_index=True)
+    return TopCodes(keys, counts[first], len(valid), int(valid.sum()))
+
+
+class FileCoverage(NamedTuple):
+    """Which top codes one comparison file contains, plus its row counts."""
+
+    covered: np.ndarray
+    rows: int
+    valid_rows: int
+
+
+def file_coverage(top, file, code_col, chunksize=None):
+    """Scan one comparison file's code column against an indexed top list."""
+    code_set = load_code_set(file, code_col, chunksize=chunksize)
+    with stage("join", rows=len(top.keys) + len(code_set.keys)):
+        covered = contains_keys(code_set.keys, top.keys)
+    return FileCoverage(covered, code_set.rows, code_set.valid_rows)
+
+
+# Set bits per byte value, for counting covering files straight from the packed bitmap
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Coverage(NamedTuple):
+    """
+    Top codes x comparison files coverage. ``bits`` is a packed
+    ``(codes, ceil(files / 8))`` uint8 bitmap; bit ``7 - f % 8`` of byte
+    ``f // 8`` is set when file ``f`` contains the code.
+    """
+
+    top: TopCodes
+    names: list
+    bits: np.ndarray
+    files: list
+
+    def covered(self, i):
+        """Boolean column of the top codes file ``i`` contains."""
+        return (self.bits[:, i >> 3] >> (7 - (i & 7))) & 1 == 1
+
+    @property
+    def covered_by(self):
+        """Number of files containing each top code."""
+        return _POPCOUNT[self.bits].sum(axis=1, dtype=np.int64)
+
+    def summary(self):
+        """Per-file coverage of the top codes, by code and weighted by count."""
+        counts = np.nan_to_num(self.top.counts)
+        total_codes, total_count = max(len(self.top.keys), 1), counts.sum()
+        rows = []
+        for i, (name, f) in enumerate(zip(self.names, self.files)):
+            covered = self.covered(i)
+            covered_count = counts[covered].sum()
+            rows.append({
+                "File": name,
+                "Rows": f.rows,
+                "Valid Rows": f.valid_rows,
+                "Top Codes Covered": int(covered.sum()),
+                "Coverage %": covered.sum() / total_codes * 100,
+                "Count Covered": covered_count,
+                "Count-Weighted Coverage %": covered_count / total_count * 100 if total_count else np.nan,
+            })
+        return pd.DataFrame(rows)
+
+    def to_frame(self, code_col="Code", count_col="Count"):
+        """One row per top code: its count, a column per file and how many files cover it."""
+        out = {code_col: keys_to_strings(self.top.keys).to_numpy(), count_col: self.top.counts}
+        for i, name in enumerate(self.names):
+            out[name] = self.covered(i)
+        out["Covered By"] = self.covered_by
+        return pd.DataFrame(out)
+
+
+def coverage_matrix(top, names, files):
+    """Pack per-file ``FileCoverage`` results (in ``names`` order) into a ``Coverage`` bitmap."""
+    with stage("aggregate", rows=len(top.keys) * len(files)):
+        bits = np.zeros((len(top.keys), (len(files) + 7) // 8), dtype=np.uint8)
+        for i, f in enumerate(files):
+            bits[:, i >> 3] |= f.covered.astype(np.uint8) << np.uint8(7 - (i & 7))
+    return Coverage(top, list(names), bits, list(files))
+
+
+def _detect_columns(df):
+    """Pick the code column (mostly 7+ digit codes) and the first numeric count column."""
+    code_col = None
+    for col in df.columns:
+        _, valid = top_code_digits(df[col].head(1000))
+        if valid.mean() > 0.5:
+            code_col = col
+            break
+    if code_col is None:
+        raise ValueError("no column with 7-digit codes found")
+    for col in df.columns:
+        if col != code_col and pd.api.types.is_numeric_dtype(df[col]):
+            return code_col, col
+    raise ValueError("no numeric count column found")
+
+
+def _column_array(values):
+    """A sheet column as a memory-mappable array: numbers, booleans and dates as is, the rest as UTF-8 text."""
+    if values.dtype.kind in "biufM":
+        return values.to_numpy()
+    # Bytes rather than numpy's 4-bytes-per-character unicode arrays
+    return np.char.encode(values.where(values.notna(), "").astype(str).to_numpy(dtype=str), "utf-8")
+
+
+def _snapshot_tag(path):
+    stat = os.stat(path)
+    base = os.path.splitext(os.path.basename(path))[0]
+    return base, f"{base}-v{SNAPSHOT_FORMAT}-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _is_snapshot_of(name, base):
+    """Whether ``name`` is a snapshot file of workbook ``base`` (any version), not of e.g. ``{base}-2024``."""
+    return re.fullmatch(rf"{re.escape(base)}-v\d+-\d+-\d+\..+", name) is not None
+
+
+def compile_top_snapshot(path, snapshot_dir=SNAPSHOT_DIR):
+    """Parse the workbook and write its snapshot files; returns the manifest path."""
+    base, tag = _snapshot_tag(path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    # Cells as stored: text codes keep their leading zeros, numeric columns are inferred afterwards
+    df = pd.read_excel(path, engine=EXCEL_ENGINE, dtype=object).infer_objects()
+    df.columns = [str(c).strip() for c in df.columns]
+    code_col, count_col = _detect_columns(df)
+    keys = top_code_keys(df[code_col])
+    counts = pd.to_numeric(df[count_col], errors="coerce").to_numpy()
+
+    # Arrays first, manifest last, so concurrent workers never see a half-written snapshot
+    manifest_path = os.path.join(snapshot_dir, f"{tag}.json")
+    arrays = {f"col{i}": _column_array(df[col]) for i, col in enumerate(df.columns)}
+    for name, arr in {**arrays, "keys": keys, "counts": counts}.items():
+        with atomic_write(os.path.join(snapshot_dir, f"{tag}.{name}.npy")) as fh:
+            np.save(fh, arr)
+    manifest = {
+        "columns": list(df.columns),
+        "code_col": code_col,
+        "count_col": count_col,
+        "source_rows": len(df),
+        "valid_rows": int((keys != INVALID_KEY).sum()),
+    }
+    with atomic_write(manifest_path, "w") as fh:
+        json.dump(manifest, fh)
+
+    # Drop snapshots of older versions of the same workbook
+    for name in os.listdir(snapshot_dir):
+        if _is_snapshot_of(name, base) and not name.startswith(f"{tag}.") and not name.endswith(TMP_SUFFIX):
+            try:
+                os.remove(os.path.join(snapshot_dir, name))
+            except OSError:
+                pass
+    return manifest_path
+
+
+def load_top_snapshot(path=PRELOADED_TOP_FILE, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Return the memory-mapped snapshot of a top-codes workbook, compiling it
+    first if the workbook is new or has changed since the last compile.
+    """
+    _, tag = _snapshot_tag(path)
+    key = os.path.abspath(path)
+    with _lock:
+        cached = _loaded.get(key)
+        if cached is not None and cached[0] == tag:
+            return cached[1]
+
+        manifest_path = os.path.join(snapshot_dir, f"{tag}.json")
+        if not os.path.exists(manifest_path):
+            compile_top_snapshot(path, snapshot_dir)
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+        snapshot = TopCodesSnapshot(
+            columns=manifest["columns"],
+            arrays=[open_array(os.path.join(snapshot_dir, f"{tag}.col{i}.npy")) for i in range(len(manifest["columns"]))],
+            code_col=manifest["code_col"],
+            count_col=manifest["count_col"],
+            keys=open_array(os.path.join(snapshot_dir, f"{tag}.keys.npy")),
+            counts=open_array(os.path.join(snapshot_dir, f"{tag}.counts.npy")),
+            source_rows=manifest["source_rows"],
+            valid_rows=manifest["valid_rows"],
+        )
+        _loaded[key] = (tag, snapshot)
+        return snapshot
@@ -0,0 +1,140 @@
+"""
+Server-side paging over large result tables.
+
+Sending a 2M-row frame to the browser freezes it, so results stay on the
+server in a ``ResultIndex`` and only one page of rows is rendered at a time.
+The index is built once per result: code keys sorted for prefix search, the
+status column factorized, and a sort order per column computed the first
+time it is requested. A query (prefix, statuses, value range, sort) then
+costs one pass over boolean masks, and its row ids are remembered, so
+flipping pages is a slice.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import MAX_CODE_DIGITS, POW10, code_keys
+
+
+class ResultIndex:
+    """
+    Filter/sort/page index over a result DataFrame.
+
+    ``code_col`` holds the codes searched by prefix, ``status_col`` an optional
+    column of a few distinct labels to filter on (FOUND/MISSING, change type,
+    cheapest carrier, ...).
+    """
+
+    def __init__(self, df, code_col="Code", status_col=None, max_cached_queries=16):
+        self.df = df.reset_index(drop=True)
+        self.code_col = code_col
+        self.status_col = status_col
+
+        keys = code_keys(self.df[code_col])
+        self._key_order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._key_order]
+
+        self.statuses = []
+        if status_col is not None:
+            status_codes, labels = pd.factorize(self.df[status_col], sort=True)
+            self._status_codes = status_codes
+            self.statuses = [str(label) for label in labels]
+
+        self._orders = {}
+        self._queries = OrderedDict()
+        self._max_cached_queries = max_cached_queries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def columns(self):
+        return list(self.df.columns)
+
+    @property
+    def numeric_columns(self):
+        return [c for c in self.df.columns if pd.api.types.is_numeric_dtype(self.df[c]) and not pd.api.types.is_bool_dtype(self.df[c])]
+
+    def _sort_values(self, col):
+        values = self.df[col]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            return values.to_numpy(dtype=np.float64, na_value=np.nan)
+        codes, _ = pd.factorize(values, sort=True)
+        return np.where(codes < 0, np.nan, codes.astype(np.float64))
+
+    def _order(self, col, descending):
+        """Row ids sorted by ``col`` (missing values last either way), built once per column."""
+        if col is None or col == self.code_col:
+            order, valid = self._key_order, len(self._key_order)
+        else:
+            if col not in self._orders:
+                values = self._sort_values(col)
+                order = np.argsort(values, kind="stable")  # NaN sorts last
+                self._orders[col] = (order, int(np.count_nonzero(~np.isnan(values))))
+            order, valid = self._orders[col]
+        if not descending:
+            return order
+        return np.concatenate([order[:valid][::-1], order[valid:]])
+
+    def prefix_rows(self, prefix):
+        """Row ids of codes starting with the digits of ``prefix``, in code order."""
+        digits = "".join(ch for ch in str(prefix) if ch.isdigit())
+        if not digits:
+            return self._key_order
+        n = len(digits)
+        if n > MAX_CODE_DIGITS:
+            return self._key_order[:0]
+        value = int(digits)
+        # Codes of length L starting with the prefix form one contiguous key range
+        starts = POW10[n:] + value * POW10[: MAX_CODE_DIGITS + 1 - n]
+        stops = starts + POW10[: MAX_CODE_DIGITS + 1 - n]
+        lo = np.searchsorted(self._sorted_keys, starts)
+        hi = np.searchsorted(self._sorted_keys, stops)
+        return np.concatenate([self._key_order[a:b] for a, b in zip(lo, hi)])
+
+    def rows(self, prefix="", statuses=None, sort_by=None, descending=False, value_range=None):
+        """
+        Row ids matching the filters, in display order. ``value_range`` is
+        ``(column, low, high)`` with ``None`` for an open bound. Results of
+        recent queries are cached.
+        """
+        query = (prefix, tuple(statuses or ()), sort_by, descending, value_range)
+        with self._lock:
+            if query in self._queries:
+                self._queries.move_to_end(query)
+                return self._queries[query]
+
+            mask = None
+            if prefix and any(ch.isdigit() for ch in str(prefix)):
+                mask = np.zeros(len(self.df), dtype=bool)
+                mask[self.prefix_rows(prefix)] = True
+            if statuses and self.status_col is not None:
+                wanted = [self.statuses.index(s) for s in statuses if s in self.statuses]
+                keep = np.isin(self._status_codes, wanted)
+                mask = keep if mask is None else mask & keep
+            if value_range is not None:
+                col, low, high = value_range
+                values = self._sort_values(col)
+                keep = ~np.isnan(values)
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+                mask = keep if mask is None else mask & keep
+
+            order = self._order(sort_by, descending)
+            result = order if mask is None else order[mask[order]]
+
+            self._queries[query] = result
+            while len(self._queries) > self._max_cached_queries:
+                self._queries.popitem(last=False)
+            return result
+
+    def page(self, rows, page, page_size):
+        """The ``page``-th (0-based) slice of ``rows`` as a DataFrame."""
+        start = page * page_size
+        return self.df.iloc[rows[start:start + page_size]]
@@ -1,13 +1,406 @@
 import streamlit as st
-import pandas as pd
-import io
+import functools
 import os
-import re
+import uuid
+
+import numpy as np
+
+from portal import engine
+from portal.deck_store import (
+    DECREASE,
+    DELETED,
+    INCREASE,
+    MIXED,
+    RATE_REMOVED,
+    NEW,
+    NOTICE_DAYS,
+    list_vendors,
+    list_versions,
+)
+from portal.diagnostics import (
+    ENABLED_BY_DEFAULT,
+    LOG_PATH,
+    begin_run,
+    finish_run,
+    timed_call,
+)
+from portal.exports import EXPORT_FORMATS, available_formats, export_file_name, export_table
+from portal.jobs import CANCELLED, FAILED, JOBS, QUEUED
+from portal.loaders import (
+    TableProbe,
+    column_index,
+    parallel_map,
+    probe_table,
+    should_stream,
+    suggest_rate_pairs,
+)
+from portal.prefix import EXACT, LONGEST_PREFIX
+from portal.top_codes import PRELOADED_TOP_FILE, load_top_snapshot
+from portal.viewer import ResultIndex
+
+MATCH_MODES = {"🌳 Longest prefix": LONGEST_PREFIX, "🎯 Exact code": EXACT}
+
+
+def download_table(label, table, file_stem, key, rows=None):
+    """
+    Download button for a result table (or a callable building it), in the
+    sidebar's download format. Nothing is serialized until the button is
+    clicked, and clicking does not rerun the page, so results stay on screen.
+    """
+    fmt = st.session_state.get("export_format", "CSV")
+    rows = len(table) if rows is None else rows
+    # Runs on Streamlit's download thread after the page run, so it is logged as a run of its own
+    build = functools.partial(
+        timed_call, f"{page} (download)", "export", functools.partial(export_table, table, fmt, name=f"{file_stem}.csv"),
+        rows=rows, session=st.session_state.get("session_id"), enabled=st.session_state.get("diagnostics", False),
+    )
+
+    st.download_button(
+        label=f"{label} ({rows})",
+        data=build,
+        file_name=export_file_name(file_stem, fmt),
+        mime=EXPORT_FORMATS[fmt].mime,
+        on_click="ignore",
+        key=key,
+    )
+
+
+@st.fragment
+def result_viewer(index, key, status_label="Status"):
+    """
+    Paginated view of a ``ResultIndex``. Only the current page is sent to the
+    browser, and changing a filter or page reruns just this fragment, so the
+    results and their indexes are not recomputed.
+    """
+    controls = st.columns([2, 2, 2, 1])
+    prefix = controls[0].text_input("🔎 Code starts with", key=f"{key}_prefix")
+    statuses = []
+    if index.statuses:
+        statuses = controls[1].multiselect(status_label, index.statuses, key=f"{key}_status")
+    sort_by = controls[2].selectbox("↕️ Sort by", index.columns, key=f"{key}_sort")
+    descending = controls[3].toggle("Descending", key=f"{key}_desc")
+
+    value_range = None
+    numeric = index.numeric_columns
+    if numeric:
+        with st.expander("🎚️ Filter by value"):
+            bounds = st.columns(3)
+            range_col = bounds[0].selectbox("Column", numeric, key=f"{key}_range_col")
+            low = bounds[1].number_input("Min", value=None, key=f"{key}_range_min")
+            high = bounds[2].number_input("Max", value=None, key=f"{key}_range_max")
+            if low is not None or high is not None:
+                value_range = (range_col, low, high)
+
+    rows = index.rows(prefix, statuses, sort_by, descending, value_range)
+
+    paging = st.columns([1, 1, 4])
+    page_size = paging[0].selectbox("Rows per page", [50, 100, 250, 500], key=f"{key}_page_size")
+    pages = max(1, -(-len(rows) // page_size))
+    # A narrower filter can leave the remembered page past the end
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page_no = paging[1].number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+
+    st.dataframe(index.page(rows, page_no - 1, page_size), hide_index=True)
+    start = (page_no - 1) * page_size
+    st.caption(f"Rows {min(start + 1, len(rows))}–{min(start + page_size, len(rows))} of {len(rows):,} matching ({len(index):,} total)")
+
+
+# ======================================================
+# ⚙️ BACKGROUND JOBS
+# ======================================================
+def job_params(files, *options):
+    """What a job's result depends on: its uploads (by file id) and options such as the selected columns."""
+    return tuple(getattr(f, "file_id", None) or getattr(f, "name", f) for f in files) + options
+
+
+def submit_job(slot, func, inputs=(), params=None):
+    """
+    Run ``func`` as a background job for this session and remember it in
+    ``st.session_state[slot]``; a job still running in that slot is cancelled.
+    ``params`` (see ``job_params``) are kept with it, so ``show_job`` can tell
+    when the page no longer shows the inputs the job ran on.
+    """
+    previous = JOBS.get(st.session_state.get(slot))
+    if previous is not None and not previous.done:
+        previous.cancel()
+    job = JOBS.submit(
+        page, func, session=st.session_state.get("session_id"), inputs=inputs,
+        diagnostics=st.session_state.get("diagnostics", False),
+    )
+    st.session_state[slot] = job.id
+    st.session_state[f"{slot}_params"] = params
+    return job
+
+
+def clear_jobs(*slots):
+    """Cancel and forget the session's jobs in ``slots``."""
+    for slot in slots:
+        job = JOBS.get(st.session_state.pop(slot, None))
+        if job is not None and not job.done:
+            job.cancel()
+        st.session_state.pop(f"{slot}_params", None)
+
+
+@st.fragment(run_every=1.0)
+def job_progress(job_id):
+    """Live status of a job with a cancel button; reruns the page once the job has finished."""
+    job = JOBS.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    if job.state == QUEUED:
+        ahead = JOBS.queued_ahead(job)
+        waiting = f" behind {ahead} job(s)" if ahead else ""
+        st.info(f"⏳ Queued{waiting}" + (" · large inputs are processed one at a time" if job.heavy else ""))
+    else:
+        running = f"⚙️ Running for {job.elapsed:.0f}s"
+        st.info(running + (f" · stage: **{job.current_stage}**" if job.current_stage else ""))
+    progress = job.progress()
+    if len(progress):
+        st.dataframe(
+            progress[["Stage", "Calls", "Seconds", "Rows"]],
+            hide_index=True,
+            column_config={"Seconds": st.column_config.NumberColumn(format="%.2f")},
+        )
+    if st.button("⏹️ Cancel", key=f"cancel_{job_id}"):
+        job.cancel()
+
+
+def show_job(slot, render, params=None):
+    """
+    Progress of the session's job in ``slot`` while it runs, then ``render(job)``
+    on every rerun, as long as it ran on ``params`` (the current uploads and
+    selections); otherwise nothing is shown until it is run again.
+    """
+    job = JOBS.get(st.session_state.get(slot))
+    if job is None or st.session_state.get(f"{slot}_params") != params:
+        return
+    if not job.done:
+        job_progress(job.id)
+    elif job.state == CANCELLED:
+        st.warning("⏹️ Cancelled")
+    elif job.state == FAILED:
+        st.error(f"❌ Error while processing: {job.error}")
+    else:
+        if job.diagnostics and job.run is not None and job.run.stages:
+            st.session_state["diagnostics_last"] = job.run
+        render(job)
+
+
+def show_rate_results(job):
+    comparison, rate_pairs = job.result.comparison, job.result.rate_pairs
+    st.markdown("---")
+    st.markdown("### 📈 Rate Comparison Results")
+    st.caption(f"🔗 {len(comparison.keys)} codes matched between OLD and NEW files")
+    download_table(
+        "📥 Download Comparison", comparison.to_frame,
+        f"{job.result.file_stem}_rate_comparison", key="download_rates",
+        rows=len(comparison.keys),
+    )
+    result_viewer(job.derived("index", lambda: ResultIndex(comparison.to_frame())), key="view_rates")
+    
+    for (old_rate_col, new_rate_col, rate_name), avg_change in zip(rate_pairs, comparison.average_changes):
+        st.markdown(f"#### 📊 {rate_name} Comparison: `{old_rate_col}` vs `{new_rate_col}`")
+        
+        # Display summary
+        if avg_change > 0:
+            st.success(f"🟢 **{rate_name}**: New rates are on average **{avg_change:.2f}%** higher than Old rates.")
+        elif avg_change < 0:
+            st.warning(f"🔴 **{rate_name}**: New rates are on average **{abs(avg_change):.2f}%** lower than Old rates.")
+        else:
+            st.info(f"⚪ **{rate_name}**: No average change detected (0.00%).")
+        
+        st.markdown("---")
+
+    stored = job.result.stored
+    if stored is not None:
+        st.success(f"💾 NEW deck stored as **{stored.vendor}** v{stored.version} ({stored.codes:,} codes)")
+
+
+def show_baseline_results(job):
+    diff, (store_vendor, baseline_version) = job.result.diff, job.result.baseline
+    st.markdown("---")
+    st.markdown(f"### 📈 Changes since {store_vendor} v{baseline_version}")
+    counts = diff.counts()
+
+    metrics = st.columns(5)
+    metrics[0].metric("🔺 Increases", f"{counts[INCREASE] + counts[MIXED]:,}")
+    metrics[1].metric("🔻 Decreases", f"{counts[DECREASE]:,}")
+    metrics[2].metric("🆕 New", f"{counts[NEW]:,}")
+    metrics[3].metric("🗑️ Deleted", f"{counts[DELETED]:,}")
+    metrics[4].metric("✔️ Unchanged", f"{counts['Unchanged']:,}")
+    if counts[MIXED]:
+        st.caption(f"↕️ {counts[MIXED]} codes went up on some rates and down on others (listed as Mixed)")
+    if counts[RATE_REMOVED]:
+        st.caption(f"➖ {counts[RATE_REMOVED]} codes are no longer priced on some rates (listed as Rate Removed)")
+
+    for (old_rate_col, new_rate_col, rate_name), avg_change in zip(diff.pairs, diff.average_changes):
+        if avg_change > 0:
+            st.success(f"🟢 **{rate_name}** (`{old_rate_col}` vs `{new_rate_col}`): New rates are on average **{avg_change:.2f}%** higher than the baseline.")
+        elif avg_change < 0:
+            st.warning(f"🔴 **{rate_name}** (`{old_rate_col}` vs `{new_rate_col}`): New rates are on average **{abs(avg_change):.2f}%** lower than the baseline.")
+        else:
+            st.info(f"⚪ **{rate_name}** (`{old_rate_col}` vs `{new_rate_col}`): No average change detected (0.00%).")
+
+    short_notice = int(diff.short_notice.sum())
+    if short_notice:
+        st.error(f"⏰ {short_notice} increases take effect less than {diff.notice_days} days from today")
+
+    changes_df = job.derived("table", diff.to_frame)
+    download_table("📥 Download Changes", changes_df, f"{job.result.file_stem}_changes", key="download_changes")
+    st.subheader("📋 Changes")
+    index = job.derived("index", lambda: ResultIndex(changes_df, status_col="Change"))
+    result_viewer(index, key="view_changes", status_label="Change")
+
+    stored = job.result.stored
+    if stored is not None:
+        st.success(f"💾 Stored as **{stored.vendor}** v{stored.version} ({stored.codes:,} codes)")
+
+
+def show_top_results(job):
+    result = job.result
+    comp_set, result_df = result.comp_set, result.result_df
+    found_df, missing_df = result.found_df, result.missing_df
+    
+    st.write(f"📊 Top File: {result.top_rows} rows loaded")
+    st.write(f"📊 Comparison File: {comp_set.rows} rows loaded")
+    st.write(f"✅ After filtering (7-digit codes only):")
+    st.write(f"   - Top File: {result.top_valid_rows} valid rows")
+    st.write(f"   - Comparison File: {comp_set.valid_rows} valid rows")
+    st.write(f"🔍 Unique codes in Top File: {len(result_df)}")
+
+    st.markdown(f"""
+    **📊 Smart Top Code Check Summary**
+    ✅ Total Top Codes: {len(result_df)}  
+    🟢 Found in Comparison: {len(found_df)}  
+    🔴 Missing in Comparison: {len(missing_df)}
+    """)
+
+    # ✅ Download options (Found or Missing)
+    st.subheader("📥 Download Options")
+    comp_base_name = result.comp_base_name
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        download_table("🔴 Download Missing Codes", missing_df, f"{comp_base_name}_missing_codes", key="download_missing")
+    with col2:
+        download_table("🟢 Download Matched Codes", found_df, f"{comp_base_name}_matched_codes", key="download_matched")
+
+    st.success("✅ Process completed successfully!")
+    
+    # Show results table
+    st.subheader("📋 Results")
+    st.caption(f"🔍 All Results ({len(result_df)}) · 🟢 Found ({len(found_df)}) · 🔴 Missing ({len(missing_df)})")
+    index = job.derived("index", lambda: ResultIndex(result_df, code_col=result.top_col, status_col="Status"))
+    result_viewer(index, key="view_top")
+
+
+def show_batch_results(job, top_col, count_col):
+    top_index, coverage = job.result.top_index, job.result.coverage
+    # Scans of this batch are reused by the next one (e.g. after adding a file)
+    st.session_state["top_coverage_cache"] = job.result.scans
+    if job.result.reused:
+        st.caption(f"♻️ Reused {job.result.reused} earlier file scans, scanned {job.result.scanned}")
+
+    covered_by = coverage.covered_by
+    counts = np.nan_to_num(top_index.counts)
+    uncovered = covered_by == 0
+    metrics = st.columns(3)
+    metrics[0].metric("✅ Total Top Codes", f"{len(top_index.keys):,}")
+    metrics[1].metric("🟢 Covered by Any File", f"{int((~uncovered).sum()):,}")
+    metrics[2].metric("🔴 Covered by None", f"{int(uncovered.sum()):,}")
+    if counts.sum():
+        st.caption(f"📞 {counts[~uncovered].sum() / counts.sum() * 100:.2f}% of the total count is covered by at least one file")
+
+    st.subheader("📊 Coverage per File")
+    coverage_summary = job.derived("summary", coverage.summary)
+    st.dataframe(coverage_summary, hide_index=True)
+
+    coverage_df = job.derived("table", lambda: coverage.to_frame(top_col, count_col))
+    col1, col2 = st.columns(2)
+    with col1:
+        download_table("📥 Download Coverage Matrix", coverage_df, "top_code_coverage", key="download_coverage")
+    with col2:
+        download_table("📥 Download Coverage Summary", coverage_summary, "top_code_coverage_summary", key="download_coverage_summary")
+
+    st.subheader("📋 Coverage by Code")
+    result_viewer(
+        job.derived("index", lambda: ResultIndex(coverage_df, code_col=top_col, status_col="Covered By")),
+        key="view_coverage", status_label="Covered by N files",
+    )
+
+
+def show_carrier_results(job):
+    carrier_result = job.result.carrier_result
+    carrier1_name, carrier2_name = job.result.names
+    
+    # ======================================================
+    # 🏆 MANUAL FORMULA RESULT
+    # ======================================================
+    if carrier_result.rated_cells > 0:
+        st.markdown("---")
+        st.markdown("---")
+        st.markdown("# 🏆 RESULT")
+    
+        # Compare average rates: which carrier is more expensive?
+        verdict = job.result.more_expensive
+        if verdict is not None:
+            expensive_name, diff_percent = verdict
+            st.error(f"## ❌ **{expensive_name}** is **{diff_percent:.2f}%** more Expensive")
+        
+        else:
+            # Both are equal
+            st.info(f"## ⚪ **Both carriers have EQUAL rates** (0.00% difference)")
+
+        download_table(
+            "📥 Download Carrier Comparison",
+            lambda: carrier_result.to_frame(carrier1_name, carrier2_name),
+            "carrier_comparison", key="download_carriers", rows=len(carrier_result.keys),
+        )
+        index = job.derived(
+            "index", lambda: ResultIndex(carrier_result.to_frame(carrier1_name, carrier2_name), status_col="Cheaper 1")
+        )
+        result_viewer(index, key="view_carriers", status_label="Cheaper (first rate pair)")
+    else:
+        st.error("❌ No common codes found to compare across selected rate types.")
+
+def show_lcr_results(job, depth):
+    lcr = job.result
+    st.markdown("---")
+    st.markdown("# 🏆 LCR RESULT")
+    st.write(f"📊 {len(lcr.keys)} codes ranked across {len(lcr.names)} carriers")
+    st.dataframe(job.derived("summary", lcr.summary))
+
+    # The table depends on the ranks slider, so it is rebuilt (and re-indexed) per depth
+    lcr_table = job.derived(("table", depth), lambda: lcr.to_frame(depth=depth))
+    download_table("📥 Download LCR Table", lcr_table, "lcr_table", key="download_lcr")
+
+    st.subheader("📋 LCR Table")
+    index = job.derived(("index", depth), lambda: ResultIndex(lcr_table, status_col="LCR 1"))
+    result_viewer(index, key="view_lcr", status_label="Cheapest carrier")
 
 st.set_page_config(page_title="Rate Comparison Portal", layout="wide")
 
 st.sidebar.title("📂 Portal Navigation")
 page = st.sidebar.radio("Go to:", ["📊 Rate Comparison", "🧩 Smart Top Code Check", "🏢 Carrier-to-Carrier Comparison"])
+st.sidebar.selectbox(
+    "📦 Download format",
+    available_formats(),
+    key="export_format",
+    help="Format of every download button. Files are only generated when you click download.",
+)
+
+st.sidebar.markdown("---")
+diagnostics_on = st.sidebar.toggle(
+    "🩺 Diagnostics",
+    value=ENABLED_BY_DEFAULT,
+    key="diagnostics",
+    help="Time every stage (parsing, code cleaning, joins, exports) with rows processed and peak memory.",
+)
+diagnostics_panel = st.sidebar.container()
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex[:12]
+diagnostics_run = begin_run(page, session=st.session_state["session_id"], enabled=diagnostics_on)
 
 # ======================================================
 # 📊 PAGE 1: RATE COMPARISON
@@ -15,104 +408,188 @@ page = st.sidebar.radio("Go to:", ["📊 Rate Comparison", "🧩 Smart Top Code
 if page == "📊 Rate Comparison":
     st.title("📊 Rate Comparison Portal")
 
-    old_file = st.file_uploader("📂 Upload OLD Rate File", type=["csv", "xlsx"])
-    new_file = st.file_uploader("📂 Upload NEW Rate File", type=["csv", "xlsx"])
-
-    if old_file and new_file:
-        try:
-            old_df = pd.read_csv(old_file) if old_file.name.endswith(".csv") else pd.read_excel(old_file)
-            new_df = pd.read_csv(new_file) if new_file.name.endswith(".csv") else pd.read_excel(new_file)
-
-            old_df.columns = old_df.columns.str.strip()
-            new_df.columns = new_df.columns.str.strip()
+    old_source = st.radio(
+        "OLD deck",
+        ["📤 Upload OLD file", "🗄️ Stored vendor baseline"],
+        horizontal=True,
+        key="old_source",
+        help="A stored baseline is a vendor's previously saved NEW deck: only added, removed and re-priced codes are computed.",
+    )
 
-            st.markdown("### 🔧 Select Columns to Compare")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**OLD File Columns**")
-                old_code_col = st.selectbox("Select Code/Prefix Column (OLD)", old_df.columns, key="old_code")
-                
-            with col2:
-                st.markdown("**NEW File Columns**")
-                new_code_col = st.selectbox("Select Code/Prefix Column (NEW)", new_df.columns, key="new_code")
-            
-            st.markdown("---")
-            st.markdown("### 📊 Select Rate Columns to Compare")
-            st.markdown("*Select up to 3 rate pairs to compare*")
-            
-            # Rate pair 1
-            col1, col2 = st.columns(2)
-            with col1:
-                old_rate1 = st.selectbox("OLD File - Rate 1", ["None"] + list(old_df.columns), key="old_rate1")
-            with col2:
-                new_rate1 = st.selectbox("NEW File - Rate 1", ["None"] + list(new_df.columns), key="new_rate1")
-            
-            # Rate pair 2
-            col1, col2 = st.columns(2)
-            with col1:
-                old_rate2 = st.selectbox("OLD File - Rate 2 (Optional)", ["None"] + list(old_df.columns), key="old_rate2")
-            with col2:
-                new_rate2 = st.selectbox("NEW File - Rate 2 (Optional)", ["None"] + list(new_df.columns), key="new_rate2")
-            
-            # Rate pair 3
+    if old_source == "🗄️ Stored vendor baseline":
+        vendors = list_vendors()
+        if not vendors:
+            st.info("🗄️ No stored decks yet. Compare with an uploaded OLD file and save the NEW deck under a vendor name to start its history.")
+        else:
             col1, col2 = st.columns(2)
             with col1:
-                old_rate3 = st.selectbox("OLD File - Rate 3 (Optional)", ["None"] + list(old_df.columns), key="old_rate3")
+                store_vendor = st.selectbox("Vendor", vendors, key="baseline_vendor")
+            versions = list_versions(store_vendor)[::-1]
             with col2:
-                new_rate3 = st.selectbox("NEW File - Rate 3 (Optional)", ["None"] + list(new_df.columns), key="new_rate3")
+                baseline_version = st.selectbox(
+                    "Baseline version", versions, format_func=lambda v: v.label, key="baseline_version"
+                )
+            new_file = st.file_uploader("📂 Upload NEW Rate File", type=["csv", "xlsx"], key="baseline_new")
 
-            if st.button("🚀 Compare Rates"):
-                # Collect rate pairs
-                rate_pairs = []
-                if old_rate1 != "None" and new_rate1 != "None":
-                    rate_pairs.append((old_rate1, new_rate1, "Rate 1"))
-                if old_rate2 != "None" and new_rate2 != "None":
-                    rate_pairs.append((old_rate2, new_rate2, "Rate 2"))
-                if old_rate3 != "None" and new_rate3 != "None":
-                    rate_pairs.append((old_rate3, new_rate3, "Rate 3"))
+            if new_file:
+                try:
+                    new_probe = probe_table(new_file)
+                    new_columns = new_probe.columns
+                    if should_stream(new_file):
+                        st.caption(f"🌊 {new_file.name} is large: it will be streamed in chunks, reading only the selected columns")
+
+                    st.markdown("### 🔧 Select Columns to Compare")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        new_code_col = st.selectbox(
+                            "Select Code/Prefix Column (NEW)", new_columns,
+                            index=column_index(new_columns, new_probe.code_col), key="baseline_code"
+                        )
+                    with col2:
+                        new_date_col = st.selectbox(
+                            "Effective Date Column (NEW)", ["None"] + list(new_columns),
+                            index=column_index(new_columns, new_probe.date_col, offset=1), key="baseline_date"
+                        )
+
+                    st.markdown("### 📊 Select Rate Columns to Compare")
+                    suggested_pairs = dict(suggest_rate_pairs(baseline_version.columns, new_probe.rate_cols))
+                    selected_rates = []
+                    for i, stored_col in enumerate(baseline_version.columns, start=1):
+                        new_rate = st.selectbox(
+                            f"Baseline `{stored_col}` vs NEW File - Rate {i}", ["None"] + list(new_columns),
+                            index=column_index(new_columns, suggested_pairs.get(stored_col), offset=1),
+                            key=f"baseline_rate{i}",
+                        )
+                        selected_rates.append((stored_col, new_rate, f"Rate {i}"))
+
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        notice_days = st.number_input(
+                            "Required notice for increases (days)", min_value=0, value=NOTICE_DAYS, key="notice_days"
+                        )
+                    with col2:
+                        save_new = st.checkbox(
+                            f"💾 Save NEW deck as the next version of {store_vendor}", value=True, key="baseline_save"
+                        )
+
+                    rate_pairs = [pair for pair in selected_rates if pair[1] != "None"]
+                    date_col = None if new_date_col == "None" else new_date_col
+                    baseline_params = job_params(
+                        [new_file], store_vendor, baseline_version.version, new_code_col, rate_pairs, date_col, notice_days,
+                    )
+
+                    if st.button("🚀 Compare with Baseline"):
+                        if len(rate_pairs) == 0:
+                            st.error("❌ Please select at least one rate pair to compare.")
+                        else:
+                            submit_job("baseline_job", functools.partial(
+                                engine.diff_against_baseline, store_vendor, baseline_version.version, new_file,
+                                new_code_col, rate_pairs, notice_days=notice_days, date_col=date_col, save=save_new,
+                            ), inputs=[new_file], params=baseline_params)
+
+                    show_job("baseline_job", show_baseline_results, baseline_params)
+
+                except Exception as e:
+                    st.error(f"❌ Error while processing: {e}")
+
+    else:
+        old_file = st.file_uploader("📂 Upload OLD Rate File", type=["csv", "xlsx"])
+        new_file = st.file_uploader("📂 Upload NEW Rate File", type=["csv", "xlsx"])
+
+        if old_file and new_file:
+            try:
+                # Header + sample only; the selected columns are parsed when comparing
+                old_probe = probe_table(old_file)
+                new_probe = probe_table(new_file)
+                old_columns = old_probe.columns
+                new_columns = new_probe.columns
+                suggested_pairs = suggest_rate_pairs(old_probe.rate_cols, new_probe.rate_cols)
+                for upload in (old_file, new_file):
+                    if should_stream(upload):
+                        st.caption(f"🌊 {upload.name} is large: it will be streamed in chunks, reading only the selected columns")
+
+                st.markdown("### 🔧 Select Columns to Compare")
                 
-                if len(rate_pairs) == 0:
-                    st.error("❌ Please select at least one rate pair to compare.")
-                else:
-                    st.markdown("---")
-                    st.markdown("### 📈 Rate Comparison Results")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.markdown("**OLD File Columns**")
+                    old_code_col = st.selectbox(
+                        "Select Code/Prefix Column (OLD)", old_columns,
+                        index=column_index(old_columns, old_probe.code_col), key="old_code"
+                    )
                     
-                    for old_rate_col, new_rate_col, rate_name in rate_pairs:
-                        st.markdown(f"#### 📊 {rate_name} Comparison: `{old_rate_col}` vs `{new_rate_col}`")
-                        
-                        # Prepare data for merging
-                        old_subset = old_df[[old_code_col, old_rate_col]].copy()
-                        new_subset = new_df[[new_code_col, new_rate_col]].copy()
-                        
-                        merged = pd.merge(
-                            old_subset,
-                            new_subset,
-                            left_on=old_code_col,
-                            right_on=new_code_col,
-                            how="inner",
-                            suffixes=("_old", "_new")
+                with col2:
+                    st.markdown("**NEW File Columns**")
+                    new_code_col = st.selectbox(
+                        "Select Code/Prefix Column (NEW)", new_columns,
+                        index=column_index(new_columns, new_probe.code_col), key="new_code"
+                    )
+
+                match_label = st.radio(
+                    "Code matching",
+                    list(MATCH_MODES),
+                    horizontal=True,
+                    key="rate_match_mode",
+                    help="Longest prefix lines up codes like 4420 and 44207 across decks; exact only compares identical codes.",
+                )
+                
+                st.markdown("---")
+                st.markdown("### 📊 Select Rate Columns to Compare")
+                num_rate_pairs = st.number_input(
+                    "Number of rate pairs",
+                    min_value=1,
+                    max_value=max(len(old_columns), len(new_columns), 1),
+                    value=min(max(3, len(suggested_pairs)), max(len(old_columns), len(new_columns), 1)),
+                    key="num_rate_pairs",
+                )
+                
+                # One row of selectors per rate pair (interstate/intrastate/indeterminate, tiers, ...)
+                selected_rates = []
+                for i in range(1, int(num_rate_pairs) + 1):
+                    optional = "" if i == 1 else " (Optional)"
+                    old_default, new_default = suggested_pairs[i - 1] if i <= len(suggested_pairs) else (None, None)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        old_rate = st.selectbox(
+                            f"OLD File - Rate {i}{optional}", ["None"] + list(old_columns),
+                            index=column_index(old_columns, old_default, offset=1), key=f"old_rate{i}"
                         )
-                        
-                        # Calculate percentage change
-                        merged["%_change"] = ((merged[f"{new_rate_col}_new"] - merged[f"{old_rate_col}_old"]) /
-                                              merged[f"{old_rate_col}_old"]) * 100
-                        
-                        avg_change = merged["%_change"].mean()
-                        
-                        # Display summary
-                        if avg_change > 0:
-                            st.success(f"🟢 **{rate_name}**: New rates are on average **{avg_change:.2f}%** higher than Old rates.")
-                        elif avg_change < 0:
-                            st.warning(f"🔴 **{rate_name}**: New rates are on average **{abs(avg_change):.2f}%** lower than Old rates.")
-                        else:
-                            st.info(f"⚪ **{rate_name}**: No average change detected (0.00%).")
-                        
-                        st.markdown("---")
+                    with col2:
+                        new_rate = st.selectbox(
+                            f"NEW File - Rate {i}{optional}", ["None"] + list(new_columns),
+                            index=column_index(new_columns, new_default, offset=1), key=f"new_rate{i}"
+                        )
+                    selected_rates.append((old_rate, new_rate, f"Rate {i}"))
 
-        except Exception as e:
-            st.error(f"❌ Error while processing: {e}")
+                with st.expander("🗄️ Save NEW deck as a vendor baseline"):
+                    save_vendor = st.text_input(
+                        "Vendor name (leave empty to skip)", key="save_vendor",
+                        help="Next time, pick this vendor's stored baseline instead of uploading the OLD file again.",
+                    )
+                    save_date_col = st.selectbox(
+                        "Effective Date Column (NEW)", ["None"] + list(new_columns),
+                        index=column_index(new_columns, new_probe.date_col, offset=1), key="save_date"
+                    )
+
+                # Collect rate pairs
+                rate_pairs = [pair for pair in selected_rates if pair[0] != "None" and pair[1] != "None"]
+                rate_params = job_params([old_file, new_file], old_code_col, new_code_col, rate_pairs, match_label)
+
+                if st.button("🚀 Compare Rates"):
+                    if len(rate_pairs) == 0:
+                        st.error("❌ Please select at least one rate pair to compare.")
+                    else:
+                        date_col = None if not save_vendor.strip() or save_date_col == "None" else save_date_col
+                        submit_job("rate_job", functools.partial(
+                            engine.compare_rate_files, old_file, new_file, old_code_col, new_code_col, rate_pairs,
+                            MATCH_MODES[match_label], save_vendor=save_vendor, date_col=date_col,
+                        ), inputs=[old_file, new_file], params=rate_params)
+
+                show_job("rate_job", show_rate_results, rate_params)
+
+            except Exception as e:
+                st.error(f"❌ Error while processing: {e}")
 
 # ======================================================
 # 🧩 PAGE 2: SMART TOP CODE CHECK (WITH COUNTS ✅) - NOW WITH PRE-LOADED EXCEL OPTION
@@ -122,6 +599,8 @@ elif page == "🧩 Smart Top Code Check":
     
     # Clear Results Button
     if st.button("🔄 Clear All & Reset", key="clear_page2"):
+        clear_jobs("top_job", "batch_job")
+        st.session_state.pop("top_coverage_cache", None)
         st.rerun()
 
     # ============== NEW: PRE-LOADED EXCEL OPTION ==============
@@ -135,7 +614,9 @@ elif page == "🧩 Smart Top Code Check":
     )
     
     # Initialize variables
-    top_df = None
+    top_snapshot = None
+    top_file = None
+    top_probe = None
     top_file_name = ""
     
     # Handle file source selection
@@ -143,24 +624,29 @@ elif page == "🧩 Smart Top Code Check":
         top_file = st.file_uploader("📂 Upload Top Codes File (CSV or Excel)", type=["csv", "xlsx"], key="top")
         if top_file:
             st.success(f"✅ Top Codes File Loaded: **{top_file.name}** ({top_file.size / 1024:.1f} KB)")
-            top_df = pd.read_csv(top_file) if top_file.name.endswith(".csv") else pd.read_excel(top_file)
+            # Header + sample only; the chosen columns are parsed when matching
+            top_probe = probe_table(top_file)
             top_file_name = top_file.name
             
     else:  # Use pre-loaded Excel
         # ⚠️ IMPORTANT: For deployment, this file needs to be included in your GitHub repo
-        excel_path = "dialer_top_counts_updated.xlsx"  # Changed to relative path
+        excel_path = PRELOADED_TOP_FILE  # Changed to relative path
         
         if os.path.exists(excel_path):
             try:
-                top_df = pd.read_excel(excel_path)
+                # Compiled once into a memory-mapped snapshot shared by all sessions
+                top_snapshot = load_top_snapshot(excel_path)
+                top_probe = TableProbe(
+                    top_snapshot.columns, top_snapshot.head(), top_snapshot.code_col, [], top_snapshot.count_col
+                )
                 file_size = os.path.getsize(excel_path) / 1024
-                top_file_name = "dialer_top_counts_updated.xlsx"
+                top_file_name = PRELOADED_TOP_FILE
                 st.success(f"✅ Pre-loaded Excel File Loaded: **{top_file_name}** ({file_size:.1f} KB)")
                 
                 # Show preview of the Excel file
                 with st.expander("👀 Preview Your Excel Data (First 5 rows)"):
-                    st.dataframe(top_df.head())
-                    st.info(f"📊 Total rows in Excel: **{len(top_df)}** | Columns: **{len(top_df.columns)}**")
+                    st.dataframe(top_probe.sample)
+                    st.info(f"📊 Total rows in Excel: **{top_snapshot.source_rows}** | Valid 7-digit codes: **{top_snapshot.valid_rows}**")
                     
             except Exception as e:
                 st.error(f"❌ Error loading pre-loaded Excel file: {e}")
@@ -169,17 +655,35 @@ elif page == "🧩 Smart Top Code Check":
             st.error(f"❌ Pre-loaded Excel file not found at: `{excel_path}`")
             st.warning("💡 Please check the file path or use the upload option instead.")
 
-    # Comparison file uploader (remains the same)
-    comp_file = st.file_uploader("📂 Upload Comparison File (CSV or Excel)", type=["csv", "xlsx"], key="comp")
+    top_mode = st.radio(
+        "Comparison Mode",
+        ["📄 One Comparison File", "📚 Batch: Many Comparison Files"],
+        horizontal=True,
+        key="top_mode",
+    )
+    comp_file = None
+    comp_files = []
     
-    # Show uploaded comparison file name
-    if comp_file:
-        st.success(f"✅ Comparison File Loaded: **{comp_file.name}** ({comp_file.size / 1024:.1f} KB)")
+    if top_mode == "📄 One Comparison File":
+        comp_file = st.file_uploader("📂 Upload Comparison File (CSV or Excel)", type=["csv", "xlsx"], key="comp")
+        
+        # Show uploaded comparison file name
+        if comp_file:
+            st.success(f"✅ Comparison File Loaded: **{comp_file.name}** ({comp_file.size / 1024:.1f} KB)")
+    else:
+        comp_files = st.file_uploader(
+            "📂 Upload Comparison Files (CSV or Excel)", type=["csv", "xlsx"], accept_multiple_files=True, key="comp_files"
+        ) or []
+        if comp_files:
+            st.success(f"✅ {len(comp_files)} comparison files loaded")
 
     # Process files if both are available
-    if top_df is not None and comp_file is not None:
+    if top_probe is not None and comp_file is not None:
         try:
-            comp_df = pd.read_csv(comp_file) if comp_file.name.endswith(".csv") else pd.read_excel(comp_file)
+            comp_probe = probe_table(comp_file)
+            comp_columns = comp_probe.columns
+            if should_stream(comp_file):
+                st.caption(f"🌊 {comp_file.name} is large: it will be streamed in chunks, reading only the code column")
 
             st.subheader("🧠 Select Columns to Compare")
             
@@ -188,111 +692,84 @@ elif page == "🧩 Smart Top Code Check":
             
             with col1:
                 st.markdown(f"**📋 {top_file_name} Columns**")
-                top_col = st.selectbox("Top File – Area Code Column", top_df.columns, key="top_col_select")
-                count_col = st.selectbox("Top File – Count Column", top_df.columns, key="count_col_select")
+                top_col = st.selectbox(
+                    "Top File – Area Code Column", top_probe.columns,
+                    index=column_index(top_probe.columns, top_probe.code_col), key="top_col_select"
+                )
+                count_col = st.selectbox(
+                    "Top File – Count Column", top_probe.columns,
+                    index=column_index(top_probe.columns, top_probe.count_col), key="count_col_select"
+                )
                 
             with col2:
                 st.markdown(f"**📂 {comp_file.name} Columns**")
-                comp_col = st.selectbox("Comparison File – Area Code Column", comp_df.columns, key="comp_col_select")
+                comp_col = st.selectbox(
+                    "Comparison File – Area Code Column", comp_columns,
+                    index=column_index(comp_columns, comp_probe.code_col), key="comp_col_select"
+                )
 
             # Show column preview
             with st.expander("📊 Column Data Preview"):
                 col1, col2 = st.columns(2)
                 with col1:
                     st.write("**Top File Sample Data:**")
-                    st.write(f"Area Code Column ({top_col}): {list(top_df[top_col].head(3))}")
-                    st.write(f"Count Column ({count_col}): {list(top_df[count_col].head(3))}")
+                    st.write(f"Area Code Column ({top_col}): {list(top_probe.sample[top_col].head(3))}")
+                    st.write(f"Count Column ({count_col}): {list(top_probe.sample[count_col].head(3))}")
                 with col2:
                     st.write("**Comparison File Sample Data:**")
-                    st.write(f"Area Code Column ({comp_col}): {list(comp_df[comp_col].head(3))}")
+                    st.write(f"Area Code Column ({comp_col}): {list(comp_probe.sample[comp_col].head(3))}")
 
+            top_params = job_params([top_file or PRELOADED_TOP_FILE, comp_file], top_col, count_col, comp_col)
             if st.button("✅ Run Exact 7-Digit Match"):
                 st.info(f"🔍 Processing: **{top_file_name}** vs **{comp_file.name}**")
-                
-                def clean_code(x):
-                    if pd.isna(x):
-                        return ""
-                    x = re.sub(r"[^\d]", "", str(x).strip())
-                    return x[:7]
-
-                top_df[top_col] = top_df[top_col].astype(str).map(clean_code)
-                comp_df[comp_col] = comp_df[comp_col].astype(str).map(clean_code)
-                
-                st.write(f"📊 Top File: {len(top_df)} rows loaded")
-                st.write(f"📊 Comparison File: {len(comp_df)} rows loaded")
-
-                top_df = top_df[top_df[top_col].str.len() == 7]
-                comp_df = comp_df[comp_df[comp_col].str.len() == 7]
-                
-                st.write(f"✅ After filtering (7-digit codes only):")
-                st.write(f"   - Top File: {len(top_df)} valid rows")
-                st.write(f"   - Comparison File: {len(comp_df)} valid rows")
-
-                # ✅ FIX: Remove duplicates from top_df before creating sets
-                top_df_unique = top_df[[top_col, count_col]].drop_duplicates(subset=[top_col]).reset_index(drop=True)
-                
-                st.write(f"🔍 Unique codes in Top File: {len(top_df_unique)}")
-                
-                # ✅ FIX: Convert to sets properly using .values for pandas Series
-                top_codes = set(top_df_unique[top_col].values)
-                comp_codes = set(comp_df[comp_col].unique())
+                submit_job("top_job", functools.partial(
+                    engine.match_top_codes, top_file, top_col, count_col, comp_file, comp_col, top_snapshot=top_snapshot,
+                ), inputs=[f for f in (top_file, comp_file) if f is not None], params=top_params)
 
-                found = top_codes & comp_codes
-                missing = top_codes - comp_codes
+            show_job("top_job", show_top_results, top_params)
 
-                st.markdown(f"""
-                **📊 Smart Top Code Check Summary**
-                ✅ Total Top Codes: {len(top_codes)}  
-                🟢 Found in Comparison: {len(found)}  
-                🔴 Missing in Comparison: {len(missing)}
-                """)
+        except Exception as e:
+            st.error(f"❌ Error while processing: {e}")
+            st.error(f"Debug info: {str(e)}")
 
-                result_df = top_df_unique.copy()
-                result_df["Status"] = result_df[top_col].apply(lambda x: "FOUND" if x in found else "MISSING")
+    # Batch mode: the top list is indexed once, each comparison file is scanned once
+    if top_probe is not None and comp_files:
+        try:
+            comp_probes = parallel_map(probe_table, comp_files)
 
-                found_df = result_df[result_df["Status"] == "FOUND"].copy()
-                missing_df = result_df[result_df["Status"] == "MISSING"].copy()
+            st.subheader("🧠 Select Columns to Compare")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"**📋 {top_file_name} Columns**")
+                top_col = st.selectbox(
+                    "Top File – Area Code Column", top_probe.columns,
+                    index=column_index(top_probe.columns, top_probe.code_col), key="batch_top_col"
+                )
+                count_col = st.selectbox(
+                    "Top File – Count Column", top_probe.columns,
+                    index=column_index(top_probe.columns, top_probe.count_col), key="batch_count_col"
+                )
+            with col2:
+                comp_cols = []
+                for i, (batch_file, batch_probe) in enumerate(zip(comp_files, comp_probes)):
+                    comp_cols.append(st.selectbox(
+                        f"{batch_file.name} – Area Code Column", batch_probe.columns,
+                        index=column_index(batch_probe.columns, batch_probe.code_col), key=f"batch_comp_col{i}"
+                    ))
 
-                # ✅ Download options (Found or Missing)
-                st.subheader("📥 Download Options")
-                
-                # Extract base name from comparison file (without extension)
-                comp_base_name = os.path.splitext(comp_file.name)[0]
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    csv = missing_df.to_csv(index=False).encode("utf-8")
-                    st.download_button(
-                        label=f"🔴 Download Missing Codes ({len(missing_df)})",
-                        data=csv,
-                        file_name=f"{comp_base_name}_missing_codes.csv",
-                        mime="text/csv"
-                    )
-                with col2:
-                    csv2 = found_df.to_csv(index=False).encode("utf-8")
-                    st.download_button(
-                        label=f"🟢 Download Matched Codes ({len(found_df)})",
-                        data=csv2,
-                        file_name=f"{comp_base_name}_matched_codes.csv",
-                        mime="text/csv"
-                    )
+            batch_params = job_params([top_file or PRELOADED_TOP_FILE, *comp_files], top_col, count_col, comp_cols)
+            if st.button("✅ Run Batch 7-Digit Match", key="run_batch"):
+                st.info(f"🔍 Processing: **{top_file_name}** vs **{len(comp_files)}** comparison files")
+                # Coverage columns are kept per (top list, file, column): adding a file scans only that file
+                submit_job("batch_job", functools.partial(
+                    engine.cover_top_codes, top_file, top_col, count_col, comp_files, comp_cols, top_snapshot=top_snapshot,
+                    scans=st.session_state.get("top_coverage_cache"),
+                ), inputs=[f for f in (top_file, *comp_files) if f is not None], params=batch_params)
 
-                st.success("✅ Process completed successfully!")
-                
-                # Show results table
-                st.subheader("📋 Results Preview")
-                tab1, tab2, tab3 = st.tabs([f"🔍 All Results ({len(result_df)})", f"🟢 Found ({len(found_df)})", f"🔴 Missing ({len(missing_df)})"])
-                
-                with tab1:
-                    st.dataframe(result_df.head(50))
-                with tab2:
-                    st.dataframe(found_df.head(50))
-                with tab3:
-                    st.dataframe(missing_df.head(50))
+            show_job("batch_job", functools.partial(show_batch_results, top_col=top_col, count_col=count_col), batch_params)
 
         except Exception as e:
             st.error(f"❌ Error while processing: {e}")
-            st.error(f"Debug info: {str(e)}")
 
 # ======================================================
 # 🏢 PAGE 3: CARRIER-TO-CARRIER COMPARISON
@@ -303,142 +780,236 @@ elif page == "🏢 Carrier-to-Carrier Comparison":
     
     # Clear Results Button
     if st.button("🔄 Clear All & Reset", key="clear_page3"):
+        clear_jobs("carrier_job", "lcr_job")
         st.rerun()
     
     st.markdown("---")
-    st.subheader("📂 Upload Carrier Rate Files")
+    carrier_mode = st.radio(
+        "Comparison Mode",
+        ["🤝 Two Carriers", "🏁 Multi-Carrier LCR"],
+        horizontal=True,
+        key="carrier_mode",
+    )
     
-    # File uploaders for 2 carriers
-    col1, col2 = st.columns(2)
+    if carrier_mode == "🏁 Multi-Carrier LCR":
+        st.subheader("📂 Upload Carrier Rate Files")
+        lcr_files = st.file_uploader(
+            "📤 Carrier Files (2 or more)", type=["csv", "xlsx"], accept_multiple_files=True, key="lcr_files"
+        )
+        
+        if lcr_files and len(lcr_files) >= 2:
+            st.success(f"✅ {len(lcr_files)} carrier files uploaded successfully!")
+            
+            try:
+                # Probe all headers in parallel; decks are parsed (or streamed) in parallel on demand
+                lcr_probes = parallel_map(probe_table, lcr_files)
+                
+                st.markdown("---")
+                st.subheader("🔧 Configure Carriers")
+                
+                lcr_match_label = st.radio(
+                    "Code matching",
+                    list(MATCH_MODES),
+                    horizontal=True,
+                    key="lcr_match_mode",
+                    help="Longest prefix rates every code with each carrier's most specific covering prefix; exact only uses identical codes.",
+                )
+                
+                carrier_specs = []
+                for i, (lcr_file, lcr_probe) in enumerate(zip(lcr_files, lcr_probes)):
+                    lcr_cols = lcr_probe.columns
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        name = st.text_input(f"Carrier {i + 1} Name", value=os.path.splitext(lcr_file.name)[0], key=f"lcr_name{i}")
+                    with col2:
+                        code_col = st.selectbox(
+                            f"{name} - Code Column", lcr_cols, index=column_index(lcr_cols, lcr_probe.code_col), key=f"lcr_code{i}"
+                        )
+                    with col3:
+                        rate_col = st.selectbox(
+                            f"{name} - Rate Column", lcr_cols,
+                            index=column_index(lcr_cols, (lcr_probe.rate_cols or [None])[0]), key=f"lcr_rate{i}"
+                        )
+                    carrier_specs.append((name, code_col, rate_col))
+                
+                lcr_depth = st.slider("LCR ranks to list per code", 1, len(carrier_specs), min(3, len(carrier_specs)), key="lcr_depth")
+                
+                st.markdown("---")
+                
+                carrier_names = [spec[0] for spec in carrier_specs]
+                lcr_params = job_params(lcr_files, carrier_specs, lcr_match_label)
+                if st.button("🏁 Build LCR Table", key="build_lcr"):
+                    if len(set(carrier_names)) != len(carrier_names):
+                        st.error("❌ Please give every carrier a unique name.")
+                    else:
+                        st.info(f"🔍 Ranking {len(carrier_specs)} carriers...")
+                        submit_job("lcr_job", functools.partial(
+                            engine.rank_carrier_files, lcr_files, carrier_names,
+                            [spec[1] for spec in carrier_specs], [spec[2] for spec in carrier_specs],
+                            MATCH_MODES[lcr_match_label],
+                        ), inputs=lcr_files, params=lcr_params)
+
+                show_job("lcr_job", functools.partial(show_lcr_results, depth=lcr_depth), lcr_params)
+            
+            except Exception as e:
+                st.error(f"❌ Error while processing: {e}")
+        else:
+            st.info("👆 Upload at least 2 carrier files above to build an LCR table")
     
-    with col1:
-        carrier1_file = st.file_uploader("📤 Carrier 1 File", type=["csv", "xlsx"], key="carrier1")
+    else:
+        st.subheader("📂 Upload Carrier Rate Files")
     
-    with col2:
-        carrier2_file = st.file_uploader("📤 Carrier 2 File", type=["csv", "xlsx"], key="carrier2")
+        # File uploaders for 2 carriers
+        col1, col2 = st.columns(2)
+    
+        with col1:
+            carrier1_file = st.file_uploader("📤 Carrier 1 File", type=["csv", "xlsx"], key="carrier1")
     
-    if carrier1_file and carrier2_file:
-        st.success(f"✅ 2 carrier files uploaded successfully!")
+        with col2:
+            carrier2_file = st.file_uploader("📤 Carrier 2 File", type=["csv", "xlsx"], key="carrier2")
+    
+        if carrier1_file and carrier2_file:
+            st.success(f"✅ 2 carrier files uploaded successfully!")
         
-        try:
-            # Load carrier dataframes
-            carrier1_df = pd.read_csv(carrier1_file) if carrier1_file.name.endswith(".csv") else pd.read_excel(carrier1_file)
-            carrier2_df = pd.read_csv(carrier2_file) if carrier2_file.name.endswith(".csv") else pd.read_excel(carrier2_file)
+            try:
+                # Load carrier dataframes
+                # Header + sample only; the selected columns are parsed when comparing
+                carrier1_probe = probe_table(carrier1_file)
+                carrier2_probe = probe_table(carrier2_file)
+                carrier1_columns = carrier1_probe.columns
+                carrier2_columns = carrier2_probe.columns
+                suggested_carrier_pairs = suggest_rate_pairs(carrier1_probe.rate_cols, carrier2_probe.rate_cols)
+                for upload in (carrier1_file, carrier2_file):
+                    if should_stream(upload):
+                        st.caption(f"🌊 {upload.name} is large: it will be streamed in chunks, reading only the selected columns")
             
-            carrier1_df.columns = carrier1_df.columns.str.strip()
-            carrier2_df.columns = carrier2_df.columns.str.strip()
+                st.markdown("---")
+                st.subheader("🔧 Configure Carrier Comparison")
             
-            st.markdown("---")
-            st.subheader("🔧 Configure Carrier Comparison")
+                # Carrier Names
+                col1, col2 = st.columns(2)
+                with col1:
+                    carrier1_name = st.text_input("Carrier 1 Name", value="Carrier 1", key="c1_name")
+                with col2:
+                    carrier2_name = st.text_input("Carrier 2 Name", value="Carrier 2", key="c2_name")
             
-            # Carrier Names
-            col1, col2 = st.columns(2)
-            with col1:
-                carrier1_name = st.text_input("Carrier 1 Name", value="Carrier 1", key="c1_name")
-            with col2:
-                carrier2_name = st.text_input("Carrier 2 Name", value="Carrier 2", key="c2_name")
+                st.markdown("---")
             
-            st.markdown("---")
+                # Code Columns
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown(f"**🔑 {carrier1_name} - Code Column**")
+                    carrier1_code_col = st.selectbox(
+                        "Code/Prefix Column", carrier1_columns,
+                        index=column_index(carrier1_columns, carrier1_probe.code_col), key="c1_code"
+                    )
+                with col2:
+                    st.markdown(f"**🔑 {carrier2_name} - Code Column**")
+                    carrier2_code_col = st.selectbox(
+                        "Code/Prefix Column", carrier2_columns,
+                        index=column_index(carrier2_columns, carrier2_probe.code_col), key="c2_code"
+                    )
+
+                carrier_match_label = st.radio(
+                    "Code matching",
+                    list(MATCH_MODES),
+                    horizontal=True,
+                    key="carrier_match_mode",
+                    help="Longest prefix lines up codes like 4420 and 44207 across decks; exact only compares identical codes.",
+                )
             
-            # Code Columns
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown(f"**🔑 {carrier1_name} - Code Column**")
-                carrier1_code_col = st.selectbox("Code/Prefix Column", carrier1_df.columns, key="c1_code")
-            with col2:
-                st.markdown(f"**🔑 {carrier2_name} - Code Column**")
-                carrier2_code_col = st.selectbox("Code/Prefix Column", carrier2_df.columns, key="c2_code")
+                st.markdown("---")
             
-            st.markdown("---")
+                # Rate Columns - Simple naming
+                st.markdown("### 📊 Select Rate Columns to Compare")
             
-            # Rate Columns - Simple naming
-            st.markdown("### 📊 Select Rate Columns to Compare")
+                num_carrier_rates = st.number_input(
+                    "Number of rate columns",
+                    min_value=1,
+                    max_value=max(len(carrier1_columns), len(carrier2_columns), 1),
+                    value=min(max(3, len(suggested_carrier_pairs)), max(len(carrier1_columns), len(carrier2_columns), 1)),
+                    key="num_carrier_rates",
+                )
             
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown(f"**{carrier1_name} - Rate Columns**")
-                carrier1_rate1 = st.selectbox("Rate Column 1", ["None"] + list(carrier1_df.columns), key="c1_rate1")
-                carrier1_rate2 = st.selectbox("Rate Column 2 (Optional)", ["None"] + list(carrier1_df.columns), key="c1_rate2")
-                carrier1_rate3 = st.selectbox("Rate Column 3 (Optional)", ["None"] + list(carrier1_df.columns), key="c1_rate3")
-            with col2:
-                st.markdown(f"**{carrier2_name} - Rate Columns**")
-                carrier2_rate1 = st.selectbox("Rate Column 1", ["None"] + list(carrier2_df.columns), key="c2_rate1")
-                carrier2_rate2 = st.selectbox("Rate Column 2 (Optional)", ["None"] + list(carrier2_df.columns), key="c2_rate2")
-                carrier2_rate3 = st.selectbox("Rate Column 3 (Optional)", ["None"] + list(carrier2_df.columns), key="c2_rate3")
+                col1, col2 = st.columns(2)
+                carrier1_rates = []
+                carrier2_rates = []
+                with col1:
+                    st.markdown(f"**{carrier1_name} - Rate Columns**")
+                    for i in range(1, int(num_carrier_rates) + 1):
+                        optional = "" if i == 1 else " (Optional)"
+                        default = suggested_carrier_pairs[i - 1][0] if i <= len(suggested_carrier_pairs) else None
+                        carrier1_rates.append(st.selectbox(
+                            f"Rate Column {i}{optional}", ["None"] + list(carrier1_columns),
+                            index=column_index(carrier1_columns, default, offset=1), key=f"c1_rate{i}"
+                        ))
+                with col2:
+                    st.markdown(f"**{carrier2_name} - Rate Columns**")
+                    for i in range(1, int(num_carrier_rates) + 1):
+                        optional = "" if i == 1 else " (Optional)"
+                        default = suggested_carrier_pairs[i - 1][1] if i <= len(suggested_carrier_pairs) else None
+                        carrier2_rates.append(st.selectbox(
+                            f"Rate Column {i}{optional}", ["None"] + list(carrier2_columns),
+                            index=column_index(carrier2_columns, default, offset=1), key=f"c2_rate{i}"
+                        ))
             
-            st.markdown("---")
+                st.markdown("---")
             
-            if st.button("🚀 Compare Carriers", key="compare_carriers"):
                 # Collect selected rate pairs
-                rate_pairs = []
-                if carrier1_rate1 != "None" and carrier2_rate1 != "None":
-                    rate_pairs.append((carrier1_rate1, carrier2_rate1))
-                if carrier1_rate2 != "None" and carrier2_rate2 != "None":
-                    rate_pairs.append((carrier1_rate2, carrier2_rate2))
-                if carrier1_rate3 != "None" and carrier2_rate3 != "None":
-                    rate_pairs.append((carrier1_rate3, carrier2_rate3))
-                
-                if len(rate_pairs) == 0:
-                    st.error("❌ Please select at least one rate pair to compare.")
-                else:
-                    st.info(f"🔍 Comparing {len(rate_pairs)} rate pair(s) between {carrier1_name} and {carrier2_name}...")
-                    
-                    # ✅ MANUAL FORMULA: Collect all rates from both carriers
-                    carrier1_all_rates = []
-                    carrier2_all_rates = []
-                    
-                    for c1_rate, c2_rate in rate_pairs:
-                        # Prepare data
-                        c1_subset = carrier1_df[[carrier1_code_col, c1_rate]].copy()
-                        c2_subset = carrier2_df[[carrier2_code_col, c2_rate]].copy()
-                        
-                        c1_subset.columns = ['Code', carrier1_name]
-                        c2_subset.columns = ['Code', carrier2_name]
-                        
-                        # Convert to numeric
-                        c1_subset[carrier1_name] = pd.to_numeric(c1_subset[carrier1_name], errors='coerce')
-                        c2_subset[carrier2_name] = pd.to_numeric(c2_subset[carrier2_name], errors='coerce')
-                        
-                        # Merge
-                        merged = pd.merge(c1_subset, c2_subset, on='Code', how='inner')
-                        merged = merged.dropna()
-                        
-                        if len(merged) > 0:
-                            # Collect all rates from both carriers
-                            carrier1_all_rates.extend(merged[carrier1_name].tolist())
-                            carrier2_all_rates.extend(merged[carrier2_name].tolist())
-                    
-                    # ======================================================
-                    # 🏆 MANUAL FORMULA RESULT
-                    # ======================================================
-                    if len(carrier1_all_rates) > 0 and len(carrier2_all_rates) > 0:
-                        st.markdown("---")
-                        st.markdown("---")
-                        st.markdown("# 🏆 RESULT")
-                        
-                        # Calculate average rates for both carriers
-                        avg_carrier1 = sum(carrier1_all_rates) / len(carrier1_all_rates)
-                        avg_carrier2 = sum(carrier2_all_rates) / len(carrier2_all_rates)
-                        
-                        # Compare averages: which carrier is more expensive?
-                        if avg_carrier1 > avg_carrier2:
-                            # Carrier1 is expensive
-                            diff_percent = ((avg_carrier1 - avg_carrier2) / avg_carrier2) * 100
-                            st.error(f"## ❌ **{carrier1_name}** is **{diff_percent:.2f}%** more Expensive")
-                            
-                        elif avg_carrier2 > avg_carrier1:
-                            # Carrier2 is expensive
-                            diff_percent = ((avg_carrier2 - avg_carrier1) / avg_carrier1) * 100
-                            st.error(f"## ❌ **{carrier2_name}** is **{diff_percent:.2f}%** more Expensive")
-                            
-                        else:
-                            # Both are equal
-                            st.info(f"## ⚪ **Both carriers have EQUAL rates** (0.00% difference)")
+                rate_pairs = [
+                    (c1_rate, c2_rate)
+                    for c1_rate, c2_rate in zip(carrier1_rates, carrier2_rates)
+                    if c1_rate != "None" and c2_rate != "None"
+                ]
+                carrier_params = job_params(
+                    [carrier1_file, carrier2_file], carrier1_code_col, carrier2_code_col, rate_pairs,
+                    carrier_match_label, carrier1_name, carrier2_name,
+                )
+
+                if st.button("🚀 Compare Carriers", key="compare_carriers"):
+                    if len(rate_pairs) == 0:
+                        st.error("❌ Please select at least one rate pair to compare.")
                     else:
-                        st.error("❌ No common codes found to compare across selected rate types.")
+                        st.info(f"🔍 Comparing {len(rate_pairs)} rate pair(s) between {carrier1_name} and {carrier2_name}...")
+                        submit_job("carrier_job", functools.partial(
+                            engine.compare_carrier_files, carrier1_file, carrier2_file, carrier1_code_col, carrier2_code_col,
+                            rate_pairs, MATCH_MODES[carrier_match_label], (carrier1_name, carrier2_name),
+                        ), inputs=[carrier1_file, carrier2_file], params=carrier_params)
+
+                show_job("carrier_job", show_carrier_results, carrier_params)
         
-        except Exception as e:
-            st.error(f"❌ Error while processing: {e}")
-            st.error(f"Debug info: {str(e)}")
-    else:
-        st.info("👆 Upload 2 carrier files above to begin comparison")
+            except Exception as e:
+                st.error(f"❌ Error while processing: {e}")
+                st.error(f"Debug info: {str(e)}")
+        else:
+            st.info("👆 Upload 2 carrier files above to begin comparison")
+
+# ======================================================
+# 🩺 DIAGNOSTICS PANEL
+# ======================================================
+finish_run(diagnostics_run)
+if diagnostics_run is not None and diagnostics_run.stages:
+    # Keep the last run that did work, so the panel survives later reruns
+    st.session_state["diagnostics_last"] = diagnostics_run
+
+if diagnostics_on:
+    with diagnostics_panel:
+        last_run = st.session_state.get("diagnostics_last")
+        if last_run is None:
+            st.caption("⏱️ Run a comparison to see per-stage timings")
+        else:
+            diagnostics_summary = last_run.summary()
+            st.markdown(f"**⏱️ Last run:** {last_run.page}")
+            st.caption(f"{diagnostics_summary['Seconds'].sum():.2f}s across {len(diagnostics_summary)} stages")
+            st.dataframe(
+                diagnostics_summary,
+                hide_index=True,
+                column_config={
+                    "Seconds": st.column_config.NumberColumn(format="%.3f"),
+                    "Rows/s": st.column_config.NumberColumn(format="%.0f"),
+                    "Peak RSS MB": st.column_config.NumberColumn(format="%.1f"),
+                    "Peak Δ MB": st.column_config.NumberColumn(format="%.1f"),
+                },
+            )
+            if LOG_PATH:
+                st.caption(f"📝 Logged to `{LOG_PATH}`")
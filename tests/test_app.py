@@ -0,0 +1,36 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def open_page(name):
+    at = AppTest.from_file(APP, default_timeout=60).run()
+    at.sidebar.radio[0].set_value(name).run()
+    return at
+
+
+def click(at, key):
+    [b for b in at.button if b.key == key][0].click().run()
+
+
+def test_top_code_reset_clears_jobs_and_cached_scans():
+    at = open_page("🧩 Smart Top Code Check")
+    at.session_state["top_job"] = "gone"
+    at.session_state["batch_job"] = "gone"
+    at.session_state["batch_job_params"] = ("comp.csv",)
+    at.session_state["top_coverage_cache"] = {"comp.csv-tag": object()}
+    click(at, "clear_page2")
+    assert not at.exception
+    for key in ("top_job", "batch_job", "batch_job_params", "top_coverage_cache"):
+        assert key not in at.session_state
+
+
+def test_carrier_reset_clears_jobs():
+    at = open_page("🏢 Carrier-to-Carrier Comparison")
+    at.session_state["carrier_job"] = "gone"
+    at.session_state["lcr_job"] = "gone"
+    click(at, "clear_page3")
+    assert not at.exception
+    assert "carrier_job" not in at.session_state and "lcr_job" not in at.session_state
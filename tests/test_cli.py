@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+import pytest
+
+from portal import cli
+
+
+def write_csv(path, codes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"Code": codes, "Rate": [0.1] * len(codes)}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_default_top_file_does_not_depend_on_working_directory():
+    assert os.path.isabs(cli.DEFAULT_TOP_FILE)
+    assert os.path.exists(cli.DEFAULT_TOP_FILE)
+
+
+def test_same_named_comparison_files_are_refused(tmp_path, capsys):
+    write_csv(tmp_path / "east" / "comp.csv", ["1201201"])
+    write_csv(tmp_path / "west" / "comp.csv", ["1201203"])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(["top", "--comp", str(tmp_path / "east"), str(tmp_path / "west"), "--out", str(tmp_path / "out")])
+    assert exit_info.value.code == 2
+    assert "overwrite" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
+
+
+def test_same_named_files_in_one_folder_are_refused(tmp_path):
+    write_csv(tmp_path / "old" / "acme.csv", ["44"])
+    write_csv(tmp_path / "new" / "acme.csv", ["44"])
+    (tmp_path / "old" / "acme.xlsx").write_bytes(b"")
+    with pytest.raises(ValueError, match="acme.csv.*acme.xlsx"):
+        cli.pair_files(str(tmp_path / "old"), str(tmp_path / "new"))
+
+
+def test_folders_pair_by_name_and_skip_unmatched(tmp_path, capsys):
+    old = write_csv(tmp_path / "old" / "acme.csv", ["44"])
+    write_csv(tmp_path / "old" / "only_old.csv", ["44"])
+    new = write_csv(tmp_path / "new" / "acme.csv", ["44"])
+    (tmp_path / "new" / "notes.txt").write_text("not a deck")
+    assert cli.pair_files(str(tmp_path / "old"), str(tmp_path / "new")) == [("acme", old, new)]
+    assert "only_old" in capsys.readouterr().err
+    assert cli.pair_files(old, new) == [("acme", old, new)]
+    with pytest.raises(ValueError):
+        cli.pair_files(old, str(tmp_path / "new"))
+
+
+def test_failing_pair_is_reported_and_sets_exit_status(tmp_path):
+    write_csv(tmp_path / "old" / "acme.csv", ["44", "1"])
+    write_csv(tmp_path / "new" / "acme.csv", ["44", "1"])
+    (tmp_path / "old" / "broken.csv").write_text("Code,Other\n44,x\n")
+    write_csv(tmp_path / "new" / "broken.csv", ["44"])
+    out = tmp_path / "out"
+    argv = ["rates", "--old", str(tmp_path / "old"), "--new", str(tmp_path / "new"),
+            "--rate-col", "Rate", "--out", str(out), "--workers", "1"]
+    assert cli.main(argv) == 1
+    summary = pd.read_csv(out / "summary.csv").set_index("Name")
+    assert summary["Status"].to_dict() == {"acme": "ok", "broken": "failed"}
+    assert "KeyError" in summary.loc["broken", "Error"]
+    assert (out / "acme_rate_comparison.csv").exists()
+
+    (tmp_path / "old" / "broken.csv").unlink()
+    assert cli.main(argv) == 0
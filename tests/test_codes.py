@@ -0,0 +1,55 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from portal.codes import INVALID_KEY, code_keys, keys_to_strings, normalize_codes
+
+
+def clean_code(x):
+    """The Smart Top Code Check page's original per-cell cleaning."""
+    if pd.isna(x):
+        return ""
+    x = re.sub(r"[^\d]", "", str(x).strip())
+    return x[:7]
+
+
+def assert_matches_clean_code(values):
+    expected = pd.Series(values).astype(str).map(clean_code)
+    norm = normalize_codes(values, truncate_to=7, required_length=7)
+    np.testing.assert_array_equal(norm.valid, (expected.str.len() == 7).to_numpy())
+    assert keys_to_strings(norm.keys[norm.valid]).tolist() == expected[norm.valid].tolist()
+
+
+def test_normalize_codes_matches_clean_code_on_text():
+    assert_matches_clean_code(pd.Series([
+        "2125550123", "212-555-0123", " +1 (212) 555 ", "0044207", "0044", "12345",
+        "2125550.0", "abc", "", None, "1201201", "12012019999999999999999", "1201201²", "①2125550",
+    ], dtype=object))
+
+
+def test_normalize_codes_matches_clean_code_on_numbers():
+    assert_matches_clean_code(pd.Series([2125550123, 1201201, 12345, 0, 99999999], dtype=np.int64))
+    assert_matches_clean_code(pd.Series([2125550123.0, 1201201.0, np.nan, 12345.0]))
+
+
+def test_non_ascii_digits_are_stripped_not_cast():
+    keys = code_keys(pd.Series(["12²", "①234", "²"], dtype=object))
+    assert keys_to_strings(keys).tolist() == ["12", "234", ""]
+
+
+def test_code_keys_keep_leading_zeros():
+    keys = code_keys(pd.Series(["0044", "44", "044"]))
+    assert len(set(keys.tolist())) == 3
+    assert keys_to_strings(keys).tolist() == ["0044", "44", "044"]
+
+
+def test_integer_codes_longer_than_max_digits_are_invalid():
+    keys = code_keys(pd.Series([1234567890123456789, 123456789012345678], dtype=np.int64))
+    assert keys[0] == INVALID_KEY
+    assert keys_to_strings(keys[1:]).tolist() == ["123456789012345678"]
+
+
+def test_long_integer_codes_are_valid_once_truncated():
+    norm = normalize_codes(pd.Series([1234567890123456789], dtype=np.int64), truncate_to=7)
+    assert keys_to_strings(norm.keys).tolist() == ["1234567"]
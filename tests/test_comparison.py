@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portal.codes import keys_to_strings
+from portal.comparison import load_deck
+
+
+@pytest.fixture
+def deck_csv(tmp_path):
+    path = tmp_path / "deck.csv"
+    pd.DataFrame({
+        "Code": ["44", "0044", "1201", "44", "abc", "", "4420", "1201", "0044", "9"],
+        "Rate A": ["0.1", "0.2", "0.3", "0.9", "0.5", "0.6", "", "0.8", "0.7", "x"],
+        "Rate B": ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"],
+        "Effective": ["2026-01-01", "", "2026-02-01", "2026-03-01", "", "", "2026-04-01", "", "", "2026-05-01"],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunksize", [1, 3, 4])
+def test_streamed_load_deck_matches_in_memory(deck_csv, chunksize):
+    whole = load_deck(deck_csv, "Code", ["Rate A", "Rate B"], date_col="Effective")
+    streamed = load_deck(deck_csv, "Code", ["Rate A", "Rate B"], chunksize=chunksize, date_col="Effective")
+    np.testing.assert_array_equal(streamed.keys, whole.keys)
+    np.testing.assert_array_equal(streamed.rates, whole.rates)
+    np.testing.assert_array_equal(streamed.dates, whole.dates)
+    assert streamed.columns == whole.columns
+
+
+def test_load_deck_keeps_first_row_per_code(deck_csv):
+    deck = load_deck(deck_csv, "Code", ["Rate A"])
+    rates = dict(zip(keys_to_strings(deck.keys), deck.rates[:, 0].tolist()))
+    assert list(rates) == ["9", "44", "0044", "1201", "4420"]
+    assert rates["44"] == pytest.approx(0.1)
+    assert rates["0044"] == pytest.approx(0.2)
+    assert np.isnan(rates["4420"]) and np.isnan(rates["9"])
+
+
+def test_streamed_dates_use_one_inferred_format(tmp_path):
+    path = tmp_path / "dates.csv"
+    pd.DataFrame({
+        "Code": ["1", "2", "3", "4"],
+        "Rate": ["0.1", "0.2", "0.3", "0.4"],
+        "Effective": ["03/04/2026", "05/06/2026", "13/04/2026", "07/08/2026"],
+    }).to_csv(path, index=False)
+    whole = load_deck(str(path), "Code", ["Rate"], date_col="Effective")
+    streamed = load_deck(str(path), "Code", ["Rate"], chunksize=2, date_col="Effective")
+    expected = np.array(["2026-03-04", "2026-05-06", "NaT", "2026-07-08"], dtype="datetime64[D]")
+    np.testing.assert_array_equal(whole.dates, expected)
+    np.testing.assert_array_equal(streamed.dates, expected)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portal.codes import code_keys, keys_to_strings
+from portal.comparison import RATE_DTYPE, Deck
+from portal.deck_store import (
+    DECREASE,
+    DELETED,
+    INCREASE,
+    MIXED,
+    NEW,
+    RATE_REMOVED,
+    diff_decks,
+    list_versions,
+    load_version,
+    save_deck,
+)
+
+PAIRS = [("A", "A", "Rate 1"), ("B", "B", "Rate 2")]
+
+
+def deck(rows, dates=None):
+    """Deck from ``{code: (rate A, rate B)}``, codes sorted by key as ``prepare_deck`` leaves them."""
+    keys = code_keys(pd.Series(list(rows), dtype=object))
+    order = np.argsort(keys)
+    rates = np.array(list(rows.values()), dtype=RATE_DTYPE)[order]
+    if dates is not None:
+        dates = np.array([dates.get(code, "NaT") for code in rows], dtype="datetime64[D]")[order]
+    return Deck(keys[order], rates, ["A", "B"], dates)
+
+
+def changes(diff):
+    return dict(zip(keys_to_strings(diff.keys), diff.change))
+
+
+def test_diff_classifies_every_kind_of_change():
+    old = deck({
+        "1": (0.1, 1.0), "2": (0.2, 2.0), "3": (0.3, 3.0), "4": (0.4, 4.0),
+        "5": (np.nan, 5.0), "6": (0.6, 6.0), "7": (np.nan, 7.0), "8": (0.8, 8.0),
+    })
+    new = deck({
+        "1": (0.1, 1.0), "2": (0.3, 2.0), "3": (0.2, 3.0), "4": (0.5, 3.0),
+        "5": (0.5, 5.0), "6": (np.nan, 6.0), "7": (np.nan, 7.0), "9": (0.9, 9.0),
+    })
+    diff = diff_decks(old, new, PAIRS, as_of="2026-01-01")
+    assert changes(diff) == {
+        "2": INCREASE, "3": DECREASE, "4": MIXED, "5": INCREASE, "6": RATE_REMOVED, "9": NEW, "8": DELETED,
+    }
+    assert diff.unchanged == 2
+    counts = diff.counts()
+    assert counts[INCREASE] == 2 and counts[DECREASE] == 1 and counts[RATE_REMOVED] == 1
+
+
+def test_diff_averages_cover_all_common_codes():
+    old = deck({"1": (0.1, 1.0), "2": (0.2, 2.0)})
+    new = deck({"1": (0.1, 1.0), "2": (0.3, 2.0)})
+    diff = diff_decks(old, new, PAIRS, as_of="2026-01-01")
+    np.testing.assert_allclose(diff.average_changes, [25.0, 0.0])
+
+
+def test_short_notice_flags_only_early_increases():
+    old = deck({"1": (0.1, 1.0), "2": (0.2, 2.0), "3": (0.3, 3.0), "4": (np.nan, 4.0)})
+    new = deck(
+        {"1": (0.2, 1.0), "2": (0.3, 2.0), "3": (0.1, 3.0), "4": (0.4, 4.0)},
+        dates={"1": "2026-01-03", "2": "2026-02-01", "3": "2026-01-02", "4": "2026-01-05"},
+    )
+    diff = diff_decks(old, new, PAIRS, as_of="2026-01-01", notice_days=7)
+    flagged = dict(zip(keys_to_strings(diff.keys), diff.short_notice))
+    assert flagged == {"1": True, "2": False, "3": False, "4": True}
+
+
+def test_stored_deck_round_trips(tmp_path):
+    stored = deck({"44": (0.1, 1.0), "0044": (np.nan, 2.0)}, dates={"44": "2026-01-01"})
+    first = save_deck("Acme Telecom", stored, source="acme.csv", store_dir=str(tmp_path))
+    again = save_deck("acme telecom", stored, store_dir=str(tmp_path))
+    assert first.version == again.version == 1
+    assert [v.version for v in list_versions("Acme Telecom", store_dir=str(tmp_path))] == [1]
+
+    loaded = load_version("Acme Telecom", store_dir=str(tmp_path))
+    np.testing.assert_array_equal(loaded.keys, stored.keys)
+    np.testing.assert_array_equal(loaded.rates, stored.rates)
+    np.testing.assert_array_equal(loaded.dates, stored.dates)
+    assert loaded.columns == ["A", "B"]
+    with pytest.raises(KeyError):
+        load_version("Acme Telecom", version=2, store_dir=str(tmp_path))
@@ -0,0 +1,71 @@
+import gzip
+import io
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+from portal import exports
+from portal.exports import available_formats, export_file_name, export_table, write_table
+
+
+def table(rows=5):
+    return pd.DataFrame({
+        "Code": [f"0{i}44" for i in range(rows)],
+        "Rate": np.linspace(0.1, 0.5, rows),
+        "Status": ["FOUND", None, "MISSING", "FOUND", "MISSING"][:rows],
+    })
+
+
+def written(fmt, df, **kwargs):
+    buf = io.BytesIO()
+    write_table(df, fmt, buf, chunk_rows=2, **kwargs)
+    return buf.getvalue()
+
+
+def read_csv(data):
+    return pd.read_csv(io.BytesIO(data), dtype={"Code": str})
+
+
+@pytest.mark.parametrize("fmt, unpack", [
+    ("CSV", lambda data, name: data),
+    ("CSV (gzip)", lambda data, name: gzip.decompress(data)),
+    ("CSV (zip)", lambda data, name: zipfile.ZipFile(io.BytesIO(data)).read(name)),
+])
+def test_csv_formats_round_trip_across_chunks(fmt, unpack):
+    df = table()
+    data = written(fmt, df, name="out.csv")
+    pd.testing.assert_frame_equal(read_csv(unpack(data, "out.csv")), df)
+
+
+def test_parquet_round_trips_across_chunks():
+    if "Parquet" not in available_formats():
+        pytest.skip("Parquet export needs pyarrow")
+    df = table()
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(written("Parquet", df))), df, check_dtype=False)
+
+
+def test_excel_splits_rows_over_sheets(monkeypatch):
+    monkeypatch.setattr(exports, "EXCEL_MAX_ROWS", 3)
+    book = openpyxl.load_workbook(io.BytesIO(written("Excel (xlsx)", table())))
+    assert book.sheetnames == ["Results", "Results 2"]
+    rows = [list(sheet.values) for sheet in book]
+    assert rows[0][0] == ("Code", "Rate", "Status") == rows[1][0]
+    assert [len(r) for r in rows] == [4, 3]
+    assert rows[0][1][0] == "0044" and rows[0][2][2] is None
+
+
+def test_empty_tables_keep_their_header():
+    assert read_csv(written("CSV", table(0))).columns.tolist() == ["Code", "Rate", "Status"]
+    book = openpyxl.load_workbook(io.BytesIO(written("Excel (xlsx)", table(0))))
+    assert list(book["Results"].values) == [("Code", "Rate", "Status")]
+
+
+def test_export_table_runs_callables_and_rejects_unknown_formats():
+    buf = export_table(lambda: table(2), "CSV")
+    assert buf.tell() == 0 and len(read_csv(buf.read())) == 2
+    assert export_file_name("acme_rate_comparison", "CSV (gzip)") == "acme_rate_comparison.csv.gz"
+    with pytest.raises(ValueError):
+        export_table(table(), "JSON")
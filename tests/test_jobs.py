@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from portal import jobs
+from portal.diagnostics import stage
+from portal.jobs import CANCELLED, DONE, FAILED, QUEUED, JobStore
+
+
+@pytest.fixture
+def store():
+    return JobStore(workers=1, heavy_workers=1)
+
+
+def wait(job, timeout=10):
+    deadline = time.time() + timeout
+    while not job.done:
+        assert time.time() < deadline, f"job still {job.state}"
+        time.sleep(0.01)
+    return job
+
+
+def test_job_result_and_stage_progress(store):
+    def work():
+        with stage("parse", rows=3):
+            return 42
+
+    job = wait(store.submit("page", work, session="s1"))
+    assert (job.state, job.result, job.error) == (DONE, 42, None)
+    assert job.progress()["Stage"].tolist() == ["parse"]
+    assert store.jobs(session="s1") == [job] and store.jobs(session="s2") == []
+
+
+def test_failing_job_keeps_its_error(store):
+    job = wait(store.submit("page", lambda: 1 / 0))
+    assert job.state == FAILED and isinstance(job.error, ZeroDivisionError)
+
+
+def test_cancel_stops_a_running_job_at_the_next_stage(store):
+    started, release, reached = threading.Event(), threading.Event(), []
+
+    def work():
+        with stage("parse"):
+            started.set()
+            release.wait(5)
+        with stage("join"):
+            reached.append("join")
+
+    job = store.submit("page", work)
+    assert started.wait(5)
+    job.cancel()
+    release.set()
+    assert wait(job).state == CANCELLED
+    assert reached == [] and job.result is None
+
+
+def test_cancelled_queued_job_never_starts(store):
+    release, ran = threading.Event(), []
+    blocker = store.submit("page", lambda: release.wait(5))
+    queued = store.submit("page", lambda: ran.append(True))
+    assert queued.state == QUEUED and store.queued_ahead(queued) == 1
+    queued.cancel()
+    assert queued.state == CANCELLED
+    release.set()
+    wait(blocker)
+    time.sleep(0.05)
+    assert ran == [] and queued.started is None
+
+
+def test_large_inputs_run_on_the_heavy_pool(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "HEAVY_JOB_BYTES", 10)
+    small, large = tmp_path / "small.csv", tmp_path / "large.csv"
+    small.write_text("Code\n1\n")
+    large.write_text("Code\n" + "1\n" * 20)
+    assert not store.submit("page", lambda: None, inputs=[str(small)]).heavy
+    assert store.submit("page", lambda: None, inputs=[str(small), str(large)]).heavy
+
+
+def test_derived_values_are_built_once(store):
+    job = wait(store.submit("page", lambda: [3, 1, 2]))
+    builds = []
+    for _ in range(3):
+        assert job.derived("sorted", lambda: builds.append(1) or sorted(job.result)) == [1, 2, 3]
+    assert len(builds) == 1
+
+
+def test_finished_jobs_expire_after_ttl():
+    store = JobStore(workers=1, heavy_workers=1, ttl=0)
+    old = wait(store.submit("page", lambda: None))
+    old.finished -= 1
+    new = store.submit("page", lambda: None)
+    assert store.get(old.id) is None and store.get(new.id) is new
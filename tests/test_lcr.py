@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portal.comparison import prepare_deck
+from portal.lcr import least_cost_routing
+from portal.prefix import EXACT
+
+
+def deck(rates):
+    return prepare_deck(pd.DataFrame({"Code": list(rates), "Rate": list(rates.values())}), "Code", ["Rate"])
+
+
+@pytest.fixture
+def decks():
+    return [deck({"44": 0.10, "1": 0.05}), deck({"4420": 0.08, "1": 0.05}), deck({"44": 0.12, "33": 0.20})]
+
+
+def table(result):
+    return result.to_frame().set_index("Code")
+
+
+def test_carriers_ranked_per_code_on_longest_prefix(decks):
+    out = table(least_cost_routing(decks, ["A", "B", "C"], ["Rate"] * 3))
+    assert out.index.tolist() == ["1", "33", "44", "4420"]
+    assert out["Carriers Quoting"].tolist() == [2, 1, 2, 3]
+    assert out.loc["4420", ["LCR 1", "LCR 2", "LCR 3"]].tolist() == ["B", "A", "C"]
+    assert out.loc["4420", "A"] == pytest.approx(0.10)  # via A's 44 prefix
+    assert out.loc["44", ["LCR 1", "LCR 2"]].tolist() == ["A", "C"]
+    assert out.loc["44", "Spread"] == pytest.approx(0.02)
+    assert out.loc["44", "Spread %"] == pytest.approx(20.0)
+
+
+def test_ties_keep_carrier_order_and_single_quotes_have_no_runner_up(decks):
+    out = table(least_cost_routing(decks, ["A", "B", "C"], ["Rate"] * 3))
+    assert out.loc["1", ["LCR 1", "LCR 2"]].tolist() == ["A", "B"]
+    assert out.loc["1", "Spread"] == 0
+    assert out.loc["33", "LCR 1"] == "C"
+    assert pd.isna(out.loc["33", "LCR 2"]) and np.isnan(out.loc["33", "Second Rate"])
+
+
+def test_exact_matching_ignores_shorter_prefixes(decks):
+    out = table(least_cost_routing(decks, ["A", "B", "C"], ["Rate"] * 3, match=EXACT))
+    assert out.loc["4420", "Carriers Quoting"] == 1
+    assert np.isnan(out.loc["4420", "A"])
+
+
+def test_summary_counts_codes_won(decks):
+    summary = least_cost_routing(decks, ["A", "B", "C"], ["Rate"] * 3).summary().set_index("Carrier")
+    assert summary["Codes Cheapest"].to_dict() == {"A": 2, "B": 1, "C": 1}
+    assert summary["Codes Quoted"].to_dict() == {"A": 3, "B": 2, "C": 3}
+    assert summary.loc["B", "Average Rate"] == pytest.approx(0.065)
@@ -0,0 +1,127 @@
+import io
+import os
+from collections import OrderedDict
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from portal import loaders
+from portal.loaders import HAS_PARQUET, ParseCache, load_table, probe_table, upload_digest
+
+
+def frame():
+    return pd.DataFrame({"Code": ["44", "0044", "1201"], "Rate": ["0.1", "0.2", "0.3"]})
+
+
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit ``UploadedFile``, counting reads of its bytes."""
+
+    def __init__(self, data, name="deck.csv", file_id="upload-1"):
+        super().__init__(data)
+        self.name, self.file_id, self.size = name, file_id, len(data)
+        self.reads = 0
+
+    def getvalue(self):
+        self.reads += 1
+        return super().getvalue()
+
+
+DECK = b"Code,Rate\n0044,0.1\n44,0.2\n1201,0.3\n"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ParseCache(max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(loaders, "parse_cache", cache)
+    monkeypatch.setattr(loaders, "_digests", OrderedDict())
+    return cache
+
+
+def test_repeat_parse_is_a_cache_hit_without_reading_the_upload(cache):
+    upload = Upload(DECK)
+    first = load_table(upload, as_text=True)
+    reads = upload.reads
+    first.loc[0, "Code"] = "changed"  # callers get private copies
+
+    again = load_table(upload, as_text=True)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert upload.reads == reads
+    assert again["Code"].tolist() == ["0044", "44", "1201"]
+
+
+def test_cache_is_keyed_by_content_and_options(cache):
+    load_table(Upload(DECK), as_text=True)
+    load_table(Upload(DECK, file_id="upload-2"), as_text=True)  # same bytes, new upload
+    assert cache.hits == 1
+    load_table(Upload(DECK), columns=["Code"], as_text=True)
+    load_table(Upload(DECK + b"9,0.4\n", file_id="upload-3"), as_text=True)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_memory_tier_evicts_least_recently_used_frames():
+    size = loaders._frame_nbytes(frame())
+    cache = ParseCache(max_bytes=2 * size)
+    cache.put("a", frame())
+    cache.put("b", frame())
+    assert cache.get("a") is not None
+    cache.put("c", frame())
+    assert cache.get("b") is None and cache.get("a") is not None
+    assert len(cache) == 2 and cache.nbytes == 2 * size
+
+
+def test_upload_digests_are_remembered_for_a_bounded_number_of_uploads(cache, monkeypatch):
+    monkeypatch.setattr(loaders, "MAX_REMEMBERED_DIGESTS", 2)
+    uploads = [Upload(DECK, file_id=f"upload-{i}") for i in range(3)]
+    digests = {upload_digest(u) for u in uploads}
+    assert len(digests) == 1 and len(loaders._digests) == 2
+
+
+@pytest.mark.skipif(not HAS_PARQUET, reason="the on-disk cache needs pyarrow")
+def test_disk_cache_evicts_least_recently_used_files(tmp_path):
+    cache = ParseCache(max_bytes=0, disk_dir=str(tmp_path))  # memory tier off: every hit reads the disk
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, frame())
+        os.utime(tmp_path / f"{key}.parquet", (1000 + i, 1000 + i))
+    assert cache.get("a") is not None  # now the most recently used
+
+    cache.max_disk_bytes = 3 * os.path.getsize(tmp_path / "a.parquet")
+    cache.put("d", frame())
+    assert sorted(os.listdir(tmp_path)) == ["a.parquet", "c.parquet", "d.parquet"]
+    assert cache.get("b") is None
+
+
+HEADER = [" Dial Code ", "Inter Rate", "Intra Rate", "Calls", "Effective Date", "Note"]
+ROWS = [["0044", 0.1, 0.2, 10, "2026-01-01", "a"], ["1201", 0.3, 0.4, 20, "2026-02-01", "b"]] * 5
+
+
+@pytest.fixture(params=["csv", "xlsx"])
+def rate_file(request, tmp_path):
+    path = tmp_path / f"deck.{request.param}"
+    if request.param == "csv":
+        pd.DataFrame(ROWS, columns=HEADER).to_csv(path, index=False)
+    else:
+        book = openpyxl.Workbook()
+        for row in [HEADER, *ROWS]:
+            book.active.append(row)
+        book.save(path)
+    return str(path)
+
+
+def test_probe_reads_header_and_first_rows_and_suggests_columns(rate_file):
+    probe = probe_table(rate_file, nrows=3)
+    assert probe.columns == ["Dial Code", "Inter Rate", "Intra Rate", "Calls", "Effective Date", "Note"]
+    assert len(probe.sample) == 3
+    assert probe.code_col == "Dial Code"
+    assert probe.rate_cols == ["Inter Rate", "Intra Rate"]
+    assert probe.count_col == "Calls"
+    assert probe.date_col == "Effective Date"
+    assert probe_table(rate_file, nrows=3) is probe
+
+
+def test_chosen_columns_are_parsed_alone_as_text(rate_file):
+    df = load_table(rate_file, columns=["Dial Code", "Intra Rate"], as_text=True)
+    assert df.columns.tolist() == ["Dial Code", "Intra Rate"]
+    assert len(df) == len(ROWS)
+    assert df["Dial Code"].tolist()[:2] == ["0044", "1201"]
+    assert df["Intra Rate"].tolist()[:2] == ["0.2", "0.4"]
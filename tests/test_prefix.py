@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from portal.codes import INVALID_KEY, code_keys
+from portal.prefix import PrefixIndex
+
+
+def keys(*codes):
+    return code_keys(pd.Series(codes, dtype=object))
+
+
+def test_lookup_returns_longest_matching_prefix():
+    index = PrefixIndex(keys("1", "44", "4420", "44207"))
+    found = index.lookup(keys("442071234", "44208", "4421", "44", "1212", "5"))
+    np.testing.assert_array_equal(found, [3, 2, 1, 1, 0, -1])
+
+
+def test_lookup_respects_leading_zeros():
+    index = PrefixIndex(keys("44", "0044"))
+    np.testing.assert_array_equal(index.lookup(keys("004420", "4420", "044")), [1, 0, -1])
+
+
+def test_lookup_first_row_wins_for_duplicate_codes():
+    index = PrefixIndex(keys("44", "1", "44"))
+    np.testing.assert_array_equal(index.lookup(keys("4420")), [0])
+
+
+def test_invalid_keys_never_match():
+    index = PrefixIndex(np.array([INVALID_KEY, *keys("44")], dtype=np.int64))
+    query = np.array([INVALID_KEY, *keys("4420")], dtype=np.int64)
+    np.testing.assert_array_equal(index.lookup(query), [-1, 1])
+
+
+def test_lookup_exact_ignores_prefixes():
+    index = PrefixIndex(keys("44", "4420"))
+    np.testing.assert_array_equal(index.lookup_exact(keys("4420", "44207", "44")), [1, -1, 0])
@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+from portal import engine
+from portal.codes import INVALID_KEY, keys_to_strings
+from portal.top_codes import (
+    compile_top_snapshot,
+    coverage_matrix,
+    file_coverage,
+    load_top_snapshot,
+    top_code_index,
+    top_code_keys,
+)
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "top.xlsx"
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["Prefix", "Calls", "Note"])
+    for row in [
+        ["0212555", 10, "leading zero"],
+        ["2125550123", 20, None],
+        ["12345", 30, "too short"],
+        ["3105551", 40, "café"],
+        ["0212555", 50, None],
+    ]:
+        sheet.append(row)
+    book.save(path)
+    return str(path)
+
+
+def test_snapshot_stores_keys_and_counts_of_detected_columns(workbook, tmp_path):
+    snapshot = load_top_snapshot(workbook, snapshot_dir=str(tmp_path / "snap"))
+    assert (snapshot.code_col, snapshot.count_col) == ("Prefix", "Calls")
+    assert (snapshot.source_rows, snapshot.valid_rows) == (5, 4)
+    assert keys_to_strings(snapshot.keys).tolist() == ["0212555", "2125550", "", "3105551", "0212555"]
+    assert snapshot.keys[2] == INVALID_KEY
+    assert snapshot.counts.tolist() == [10, 20, 30, 40, 50]
+    assert snapshot.code_keys("Prefix") is snapshot.keys
+    assert snapshot.count_values("Calls") is snapshot.counts
+
+
+def test_snapshot_keeps_other_columns_as_parsed(workbook, tmp_path):
+    snapshot = load_top_snapshot(workbook, snapshot_dir=str(tmp_path / "snap"))
+    note = snapshot.column("Note")
+    assert note[0] == "leading zero" and note[3] == "café" and note.isna().tolist() == [False, True, False, False, True]
+    assert snapshot.column("Prefix", 2).tolist() == ["0212555", "2125550123"]
+    assert snapshot.head(2).columns.tolist() == ["Prefix", "Calls", "Note"]
+    np.testing.assert_array_equal(snapshot.code_keys("Note"), INVALID_KEY)
+
+
+def test_recompile_drops_only_this_workbooks_old_snapshots(workbook, tmp_path):
+    snap_dir = tmp_path / "snap"
+    snap_dir.mkdir()
+    stale = ["top-v1-1-2.json", "top-v2-5-6.col0.npy"]
+    others = ["top-2024-v3-1-2.json", "top-v2024.json", "topical-v3-1-2.json"]
+    for name in stale + others:
+        (snap_dir / name).write_text("{}")
+    compile_top_snapshot(workbook, snapshot_dir=str(snap_dir))
+    names = set(os.listdir(snap_dir))
+    assert not names & set(stale)
+    assert set(others) <= names
+
+
+def write_codes(path, codes):
+    pd.DataFrame({"Number": codes}).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def top():
+    codes = pd.Series(["2125550123", "3105551", "0212555", "2125550999", "12345", "4155552"])
+    return top_code_index(top_code_keys(codes), [10, 20, 30, 40, 50, 60])
+
+
+def test_top_code_index_keeps_first_count_per_code(top):
+    assert keys_to_strings(top.keys).tolist() == ["0212555", "2125550", "3105551", "4155552"]
+    assert top.counts.tolist() == [30.0, 10.0, 20.0, 60.0]
+    assert (top.rows, top.valid_rows) == (6, 5)
+
+
+def test_file_coverage_streams_and_matches_seven_digit_codes(top, tmp_path):
+    path = write_codes(tmp_path / "comp.csv", ["212-555-0000", "3105551999", "0212", "x"])
+    for chunksize in (None, 1):
+        scan = file_coverage(top, path, "Number", chunksize=chunksize)
+        assert scan.covered.tolist() == [False, True, True, False]
+        assert (scan.rows, scan.valid_rows) == (4, 2)
+
+
+def test_bitmap_packs_more_than_eight_files(top, tmp_path):
+    files = []
+    for i in range(11):
+        # file i covers the top code i % 4, file 9 covers nothing
+        code = "1" if i == 9 else keys_to_strings(top.keys)[i % 4]
+        files.append(file_coverage(top, write_codes(tmp_path / f"c{i}.csv", [code]), "Number"))
+    coverage = coverage_matrix(top, [f"c{i}" for i in range(11)], files)
+    assert coverage.bits.shape == (4, 2)
+    for i, scan in enumerate(files):
+        np.testing.assert_array_equal(coverage.covered(i), scan.covered)
+    assert coverage.covered_by.tolist() == [3, 2, 3, 2]
+    table = coverage.to_frame()
+    assert table["Covered By"].tolist() == [3, 2, 3, 2] and table["c8"].tolist() == [True, False, False, False]
+
+
+def test_summary_weights_coverage_by_count(top, tmp_path):
+    scan = file_coverage(top, write_codes(tmp_path / "comp.csv", ["4155552", "0212555"]), "Number")
+    summary = coverage_matrix(top, ["comp"], [scan]).summary().iloc[0]
+    assert summary["Top Codes Covered"] == 2
+    assert summary["Coverage %"] == pytest.approx(50.0)
+    assert summary["Count-Weighted Coverage %"] == pytest.approx(90 / 120 * 100)
+
+
+def test_batch_reuses_earlier_scans(tmp_path):
+    top_path = tmp_path / "top.csv"
+    pd.DataFrame({"Code": ["2125550", "3105551"], "Count": [1, 2]}).to_csv(top_path, index=False)
+    comps = [write_codes(tmp_path / "a.csv", ["2125550"]), write_codes(tmp_path / "b.csv", ["3105551"])]
+    first = engine.cover_top_codes(str(top_path), "Code", "Count", comps[:1], ["Number"])
+    second = engine.cover_top_codes(str(top_path), "Code", "Count", comps, ["Number", "Number"], scans=first.scans)
+    assert (first.scanned, second.scanned, second.reused) == (1, 1, 1)
+    assert second.coverage.covered_by.tolist() == [1, 1]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from portal.viewer import ResultIndex
+
+
+def index():
+    df = pd.DataFrame({
+        "Code": ["1201", "12012", "0044", "44", "120", "2", "4420"],
+        "Status": ["FOUND", "MISSING", "FOUND", "MISSING", "FOUND", "FOUND", "MISSING"],
+        "Rate": [0.5, 0.1, np.nan, 0.3, 0.2, 0.4, 0.6],
+    })
+    return ResultIndex(df, status_col="Status")
+
+
+def codes(idx, rows):
+    return idx.df["Code"].iloc[rows].tolist()
+
+
+def test_prefix_rows_in_code_order():
+    idx = index()
+    assert codes(idx, idx.prefix_rows("120")) == ["120", "1201", "12012"]
+    assert codes(idx, idx.prefix_rows("44")) == ["44", "4420"]
+
+
+def test_prefix_rows_respect_leading_zeros():
+    idx = index()
+    assert codes(idx, idx.prefix_rows("00")) == ["0044"]
+    assert codes(idx, idx.prefix_rows("4")) == ["44", "4420"]
+
+
+def test_prefix_rows_ignore_non_digits_and_overlong_prefixes():
+    idx = index()
+    assert codes(idx, idx.prefix_rows("12-0")) == ["120", "1201", "12012"]
+    assert len(idx.prefix_rows("")) == len(idx)
+    assert len(idx.prefix_rows("1" * 19)) == 0
+
+
+def test_rows_combine_prefix_status_and_sort():
+    idx = index()
+    rows = idx.rows(prefix="12", statuses=["FOUND"], sort_by="Rate", descending=True)
+    assert codes(idx, rows) == ["1201", "120"]
+    rows = idx.rows(sort_by="Rate")
+    assert codes(idx, rows)[-1] == "0044"  # missing values last